@@ -2,7 +2,9 @@ from typing import Optional, Dict
 import logging
 from pathlib import Path
 from .api.comfyone_client import ComfyOneClient
+from .api.async_client import AsyncComfyOneClient
 from .api.websocket.websocket_client import OneThingAIWebSocket
+from .api.websocket.async_websocket import AsyncOneThingAIWebSocket
 from .utils.logging import setup_logger
 from .utils.debug import debug_context, DebugContext
 
@@ -16,8 +18,13 @@ class ComfyOne:
                  max_retries: int = 3,
                  timeout: int = 5,
                  debug: bool = False,
-                 log_file: Optional[Path] = None):
-        
+                 log_file: Optional[Path] = None,
+                 **client_options):
+        """
+        参数:
+            client_options: 透传给ComfyOneClient的其他配置，例如pool_maxsize、idle_timeout
+        """
+
         # Set up logging
         log_level = logging.DEBUG if debug else logging.INFO
         self.logger = setup_logger(
@@ -42,9 +49,37 @@ class ComfyOne:
                 self.base_url, 
                 max_retries, 
                 timeout,
-                logger=self.logger
+                logger=self.logger,
+                **client_options
             )
             self.ws: Optional[OneThingAIWebSocket] = None
+            self.async_ws: Optional[AsyncOneThingAIWebSocket] = None
+            self.async_api: Optional[AsyncComfyOneClient] = None
+        self._max_retries = max_retries
+        self._timeout = timeout
+
+    def create_async_client(self, **client_options) -> AsyncComfyOneClient:
+        """
+        创建与当前配置一致的异步API客户端，需要安装aiohttp
+
+        参数:
+            client_options: 透传给AsyncComfyOneClient的其他配置，例如pool_maxsize
+
+        返回:
+            AsyncComfyOneClient: 异步客户端，同时保存在self.async_api
+        """
+        # 与同步客户端共享任务注册表，connect_websocket()收到的事件同样完成异步submit()的future
+        client_options.setdefault("tasks", self.api.tasks)
+        with debug_context(self.logger, "create_async_client"):
+            self.async_api = AsyncComfyOneClient(
+                self.api.api_key,
+                self.base_url,
+                self._max_retries,
+                self._timeout,
+                logger=self.logger,
+                **client_options
+            )
+            return self.async_api
 
     def connect_websocket(self) -> OneThingAIWebSocket:
         """初始化并连接WebSocket"""
@@ -53,15 +88,48 @@ class ComfyOne:
                 self.ws = OneThingAIWebSocket(
                     self.api.api_key, 
                     url=self.ws_url,
-                    logger=self.logger
+                    logger=self.logger,
+                    codec=self.api.codec,
+                    tasks=self.api.tasks
                 )
                 self.ws.start()
                 ctx.context["connected"] = True
             return self.ws
 
+    async def connect_async_websocket(self, **options) -> AsyncOneThingAIWebSocket:
+        """
+        在当前事件循环中初始化并连接asyncio WebSocket，需要安装aiohttp
+
+        参数:
+            options: 透传给AsyncOneThingAIWebSocket的其他配置，例如max_queue
+        """
+        with debug_context(self.logger, "connect_async_websocket") as ctx:
+            if not self.async_ws:
+                self.async_ws = AsyncOneThingAIWebSocket(
+                    self.api.api_key,
+                    url=self.ws_url,
+                    logger=self.logger,
+                    codec=self.api.codec,
+                    tasks=self.api.tasks,
+                    **options
+                )
+                await self.async_ws.start()
+                ctx.context["connected"] = True
+            return self.async_ws
+
     def close(self):
         """关闭所有连接"""
         with debug_context(self.logger, "close_connections") as ctx:
             if self.ws:
                 self.ws.close()
-                ctx.context["websocket_closed"] = True 
\ No newline at end of file
+                ctx.context["websocket_closed"] = True
+            self.api.close()
+            ctx.context["api_closed"] = True
+
+    async def aclose(self):
+        """关闭异步客户端以及所有同步连接"""
+        if self.async_ws:
+            await self.async_ws.close()
+        if self.async_api:
+            await self.async_api.close()
+        self.close() 
\ No newline at end of file
@@ -0,0 +1,720 @@
+import asyncio
+import mmap
+import os
+import time
+import logging
+from typing import Optional, List, Iterable, AsyncIterator, Tuple, Union, Dict, Any, Mapping, BinaryIO
+from .models import APIResponse, WorkflowPayload, PromptPayload
+from .exceptions import APIError, ConnectionError
+from .futures import PromptFuture, ProgressCallback, TaskRegistry, task_id_from_response
+from .codec import JSONCodec
+from .compression import DEFAULT_MIN_SIZE, Compressor
+from .retry import RetryPolicy, RetryState
+from .circuit_breaker import CircuitBreakerRegistry
+from .rate_limit import RateLimiter
+from .concurrency import AdaptiveConcurrencyLimiter
+from .cache import ResponseCache, CacheEntry
+from .workflow_registry import WorkflowRegistry, workflow_hash
+from .upload_cache import UploadCache
+from .download import (
+    DEFAULT_SEGMENT_SIZE, ChunkSizer, DownloadState, Segment, parse_content_range, prepare_buffer,
+    range_validator, resolve_save_path
+)
+from .download_cache import DownloadCache
+from .multipart import MultipartStream, NamedUploadSource, UploadSource
+from .client_core import ClientCore, RequestPlan, WorkflowUpdate
+from ..utils.bulk import async_bounded_map
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+
+class AsyncComfyOneClient(ClientCore):
+    """
+    ComfyOne API异步客户端类
+    与ComfyOneClient接口一致，所有方法均为协程，基于aiohttp的非阻塞连接池，
+    单个事件循环即可同时挂起大量请求而无需为每个请求占用线程。
+    """
+    def __init__(self, api_key: str, base_url: str = "https://pandora-server-cf.onethingai.com",
+                 max_retries: int = 3, timeout: int = 5, logger: Optional[logging.Logger] = None,
+                 pool_maxsize: int = 100, pool_maxsize_per_host: int = 0,
+                 idle_timeout: Optional[float] = 60.0,
+                 session: Optional["aiohttp.ClientSession"] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breakers: Union[CircuitBreakerRegistry, bool] = True,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 cache: Optional[ResponseCache] = None,
+                 workflow_registry: Optional[WorkflowRegistry] = None,
+                 upload_cache: Optional[UploadCache] = None,
+                 download_cache: Optional[DownloadCache] = None,
+                 codec: Optional[JSONCodec] = None,
+                 trust_responses: bool = False,
+                 compression: Union[str, Compressor, None] = None,
+                 compression_min_size: int = DEFAULT_MIN_SIZE,
+                 canonicalize_workflows: bool = True,
+                 workflow_patches: bool = True,
+                 tasks: Optional[TaskRegistry] = None):
+        """
+        参数:
+            pool_maxsize (int): 连接池最大连接数，0表示不限制
+            pool_maxsize_per_host (int): 每个主机的最大连接数，0表示不限制
+            idle_timeout (float, optional): keep-alive连接的空闲保持时间
+            session (aiohttp.ClientSession, optional): 使用外部会话，关闭客户端时不会关闭该会话
+            retry_policy (RetryPolicy, optional): 重试策略，默认与ComfyOneClient一致
+            circuit_breakers: 按接口族的熔断器，True使用默认配置，False关闭熔断
+            rate_limiter (RateLimiter, optional): 客户端限流器，等待令牌时不阻塞事件循环
+            concurrency_limiter (AdaptiveConcurrencyLimiter, optional): prompt和upload_file的自适应并发控制
+            cache (ResponseCache, optional): 工作流/后端查询缓存，可与同步客户端共享
+            workflow_registry (WorkflowRegistry, optional): ensure_workflow使用的工作流内容哈希索引
+            upload_cache (UploadCache, optional): 按文件内容哈希去重的上传缓存
+            download_cache (DownloadCache, optional): download_many使用的本地下载缓存
+            codec (JSONCodec, optional): 请求和响应体的JSON编解码器，默认安装了orjson时使用orjson
+            trust_responses (bool): 信任服务端响应，构造APIResponse时跳过pydantic校验
+            compression: 请求体压缩，"gzip"、"zstd"或压缩器实例，服务端返回415时自动改为不压缩
+            compression_min_size (int): 小于该大小的请求体不压缩
+            canonicalize_workflows (bool): 上传前去掉工作流图中仅用于界面展示的元数据
+            workflow_patches (bool): update_workflow在响应缓存中有服务端版本时只发送JSON Patch差异
+            tasks (TaskRegistry, optional): submit()返回的future注册表，可与同步客户端共享
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncComfyOneClient requires aiohttp, install it with: pip install comfyone-sdk[async]"
+            )
+        super().__init__(
+            api_key, base_url, max_retries, timeout, logger, retry_policy, circuit_breakers, rate_limiter,
+            concurrency_limiter, cache, workflow_registry, upload_cache, download_cache, codec, trust_responses,
+            compression, compression_min_size, canonicalize_workflows, workflow_patches, tasks
+        )
+        self.pool_maxsize = pool_maxsize
+        self.pool_maxsize_per_host = pool_maxsize_per_host
+        self.idle_timeout = idle_timeout
+        self._session = session
+        self._owns_session = session is None
+        self._background_tasks = set()
+        self._ensure_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def session(self) -> "aiohttp.ClientSession":
+        """共享的aiohttp会话，首次访问时在当前事件循环中创建"""
+        if self._session is None or self._session.closed:
+            if not self._owns_session:
+                raise ConnectionError(0, "External session is closed")
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_maxsize,
+                limit_per_host=self.pool_maxsize_per_host,
+                keepalive_timeout=self.idle_timeout
+            )
+            # 只限制建立连接和读取的间隔，不限制整个请求的总耗时（大文件上传、下载）
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """关闭客户端并释放连接池"""
+        if self._owns_session and self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self) -> "AsyncComfyOneClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    async def _request_api(self, api: str, payload: dict = None, method: str = "GET",
+                           headers: Optional[Dict[str, str]] = None) -> APIResponse:
+        """向ComfyOne API发送异步请求的通用函数"""
+        try:
+            if method == "GET" and self.cache is not None and self.cache.cacheable(api):
+                return self._response(await self._cached_get(api))
+            _, _, response_data = await self._execute(api, payload, method, headers)
+            self._invalidate_after(api, method)
+            return self._response(response_data)
+        except Exception as e:
+            raise self._api_error(api, e)
+
+    async def _cached_get(self, api: str) -> dict:
+        """带缓存的GET请求，返回响应字典"""
+        response_data, entry, refresh = self._cache_hit(api)
+        if refresh:
+            task = asyncio.ensure_future(self._background_refresh(api, entry))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        if response_data is not None:
+            return response_data
+        return await self._revalidate(api, entry)
+
+    async def _revalidate(self, api: str, entry: Optional[CacheEntry]) -> dict:
+        """重新获取缓存内容，条目带有ETag时发送条件请求"""
+        generation = self.cache.generation(api)
+        return self._revalidated(api, entry, generation,
+                                 *await self._execute(api, headers=self._revalidate_headers(entry)))
+
+    async def _background_refresh(self, api: str, entry: CacheEntry) -> None:
+        """stale-while-revalidate的后台刷新"""
+        try:
+            await self._revalidate(api, entry)
+        except Exception as e:
+            self._refresh_failed(api, e)
+        finally:
+            self.cache.end_refresh(api)
+
+    async def _execute(self, api: str, payload: dict = None, method: str = "GET",
+                       headers: Optional[Dict[str, str]] = None) -> Tuple[int, Mapping[str, str], Optional[dict]]:
+        """
+        发送请求并处理限流、熔断和重试
+        返回成功响应的(状态码, 响应头, 响应字典)，304时响应字典为None
+        """
+        plan = RequestPlan(self, api, payload, method, headers)
+        while True:
+            timeout = plan.before_send()
+            if plan.rate_category:
+                await self.rate_limiter.acquire_async(plan.rate_category)
+            try:
+                async with self._send(method, plan.url, plan.payload, timeout, plan.headers) as response:
+                    body = await response.read()
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                # 连接未建立时请求确定没有到达服务端
+                delay = plan.on_exception(e, isinstance(e, asyncio.TimeoutError),
+                                          not isinstance(e, aiohttp.ClientConnectorError))
+            else:
+                delay = plan.on_response(response.status, response.headers, body, response.reason)
+                if delay is None:
+                    return response.status, response.headers, self._response_data(response.status, body)
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def _request_limited(self, api: str, payload: dict = None, method: str = "GET") -> APIResponse:
+        """经过自适应并发控制器发送请求"""
+        limiter = self.concurrency_limiter
+        if limiter is None:
+            return await self._request_api(api, payload, method)
+        await limiter.acquire_async()
+        started = time.monotonic()
+        try:
+            response = await self._request_api(api, payload, method)
+        except BaseException as e:
+            self._release_limiter(limiter, started, e)
+            raise
+        self._release_limiter(limiter, started)
+        return response
+
+    def _send(self, method: str, url: str, payload: Union[bytes, MultipartStream, None],
+              timeout: float, extra_headers: Optional[Dict[str, str]] = None):
+        """发送单次HTTP请求"""
+        headers = self._request_headers(payload, extra_headers)
+        if isinstance(payload, MultipartStream):
+            # 重试时需要从头重新读取请求体
+            payload.rewind()
+            if payload.length is not None:
+                headers = {**headers, "Content-Length": str(payload.length)}
+            data = payload.aiter_chunks()
+        else:
+            data = payload
+        # 超时只限制建立连接和两次读写之间的间隔，大文件流式上传的总耗时不受限制
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        return self.session.request(method, url, headers=headers, timeout=timeout, data=data)
+
+    async def get_available_backends(self) -> APIResponse:
+        """查询所有可用的ComfyOne后端服务实例"""
+        return await self._request_api("v1/backends")
+
+    async def register_backend(self, instance_id: str) -> APIResponse:
+        """注册一个新的实例作为ComfyOne后端服务"""
+        payload = {"instance_id": instance_id}
+        return await self._request_api("v1/backends", payload, "POST")
+
+    async def delete_backend(self, instance_id: str) -> APIResponse:
+        """删除指定的后端服务实例"""
+        return await self._request_api(f"v1/backends/{instance_id}", method="DELETE")
+
+    async def set_backend_state(self, name: str, state: str) -> APIResponse:
+        """设置后端服务实例的运行状态（'up' 或 'down'）"""
+        payload = {"state": state}
+        return await self._request_api(f"v1/backends/{name}", payload, "PATCH")
+
+    async def get_backend(self, name: str) -> APIResponse:
+        """获取指定实例的详细信息"""
+        return await self._request_api(f"v1/backends/{name}")
+
+    async def create_workflow(self, payload: WorkflowPayload) -> APIResponse:
+        """创建一个新的工作流"""
+        return await self._request_api("v1/workflows", self._workflow_body(payload), "POST")
+
+    async def get_workflows(self) -> APIResponse:
+        """获取所有可用的工作流列表"""
+        return await self._request_api("v1/workflows")
+
+    async def get_workflow(self, workflow_id: str) -> APIResponse:
+        """获取指定工作流的详细信息"""
+        return await self._request_api(f"v1/workflows/{workflow_id}")
+
+    async def update_workflow(self, workflow_id: str, payload: WorkflowPayload) -> APIResponse:
+        """更新指定的工作流，响应缓存中有带ETag的服务端版本时只发送JSON Patch差异（带If-Match），否则发送完整工作流"""
+        update = WorkflowUpdate(self, workflow_id, payload)
+        result = None
+        if update.patch is not None:
+            try:
+                result = update.patched(
+                    await self._request_api(update.api, update.patch, "PATCH", update.patch_headers)
+                )
+            except APIError as e:
+                update.rejected(e)
+        if result is None:
+            result = await self._request_api(update.api, update.encoded, "PATCH")
+        return update.finish(result)
+
+    async def delete_workflow(self, workflow_id: str) -> APIResponse:
+        """删除指定的工作流"""
+        return self._workflow_deleted(
+            workflow_id, await self._request_api(f"v1/workflows/{workflow_id}", method="DELETE")
+        )
+
+    async def ensure_workflow(self, payload: WorkflowPayload) -> str:
+        """
+        确保服务端存在与payload内容一致的工作流，内容未变化时不发送任何请求
+
+        返回:
+            str: 工作流ID
+        """
+        content_hash = workflow_hash(payload)
+        if self._ensure_lock is None:
+            self._ensure_lock = asyncio.Lock()
+        async with self._ensure_lock:
+            unchanged_id, workflow_id = self._ensure_known(payload, content_hash)
+            if unchanged_id:
+                return unchanged_id
+            if workflow_id:
+                try:
+                    result = await self.update_workflow(workflow_id, payload)
+                except APIError as e:
+                    updated = self._ensure_updated(payload, content_hash, workflow_id, error=e)
+                else:
+                    updated = self._ensure_updated(payload, content_hash, workflow_id, result)
+                if updated:
+                    return workflow_id
+            return self._ensure_created(payload, content_hash, await self.create_workflow(payload))
+
+    async def upload_file(self, file_path: str, filename: Optional[str] = None) -> APIResponse:
+        """
+        上传文件到ComfyOne，文件内容以流式multipart方式发送
+
+        参数:
+            file_path (str): 要上传的文件路径
+            filename (str, optional): 服务端保存使用的文件名，默认取路径中的文件名
+
+        返回:
+            APIResponse: API响应数据
+        """
+        self._check_upload_file(file_path)
+        return await self._upload(file_path, filename)
+
+    async def upload_bytes(self, data: Union[bytes, bytearray, memoryview, mmap.mmap], filename: str = "upload.bin",
+                           content_type: Optional[str] = None) -> APIResponse:
+        """上传内存中的数据，支持bytes、bytearray、memoryview和mmap，数据不会被整体拷贝"""
+        return await self._upload(data, filename, content_type)
+
+    async def upload_fileobj(self, fileobj: BinaryIO, filename: Optional[str] = None,
+                             content_type: Optional[str] = None) -> APIResponse:
+        """从二进制文件对象的当前位置开始流式上传，调用方负责关闭文件对象"""
+        return await self._upload(fileobj, filename, content_type)
+
+    async def upload_files(self, sources: Iterable[NamedUploadSource], max_concurrency: int = 8
+                           ) -> List[Union[APIResponse, Exception]]:
+        """
+        并发上传多个文件，返回与输入顺序一致的APIResponse或异常列表
+
+        参数:
+            sources: 文件路径、bytes/memoryview/mmap、二进制文件对象，或(filename, 数据源)元组
+            max_concurrency (int): 同时进行中的上传数上限
+        """
+        results: Dict[int, Union[APIResponse, Exception]] = {}
+        uploads = async_bounded_map(lambda item: self._upload_source(item[1]), enumerate(sources), max_concurrency)
+        async for (index, _), result in uploads:
+            results[index] = result
+        return [results[index] for index in range(len(results))]
+
+    async def _upload_source(self, source: NamedUploadSource) -> APIResponse:
+        """按数据源类型分派到upload_file、upload_bytes或upload_fileobj"""
+        filename = None
+        if isinstance(source, tuple):
+            filename, source = source
+        if isinstance(source, (str, os.PathLike)):
+            return await self.upload_file(os.fspath(source), filename)
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            return await self.upload_bytes(source, filename or "upload.bin")
+        return await self.upload_fileobj(source, filename)
+
+    async def _upload(self, source: UploadSource, filename: Optional[str] = None,
+                      content_type: Optional[str] = None) -> APIResponse:
+        """上传数据源；启用上传缓存且可以计算内容哈希时经过缓存，哈希在线程池中计算"""
+        async def upload() -> APIResponse:
+            with MultipartStream(source, filename, content_type=content_type) as stream:
+                return await self._request_limited("v1/files", stream, "POST")
+
+        async def upload_data() -> Dict[str, Any]:
+            return (await upload()).to_dict()
+
+        key = self._upload_key(source)
+        if key is None:
+            return await upload()
+        cache_key = await asyncio.get_running_loop().run_in_executor(None, key)
+        return self._cached_upload_response(await self.upload_cache.get_or_upload_async(cache_key, upload_data))
+
+    async def prompt(self, payload: Union[PromptPayload, bytes]) -> APIResponse:
+        """向ComfyOne API发送prompt请求，payload也可以是PromptTemplate.encode()生成的请求体"""
+        body = payload if isinstance(payload, bytes) else payload.to_dict()
+        return await self._request_limited("v1/prompts", body, "POST")
+
+    def prompt_many(self, payloads: Iterable[Union[PromptPayload, bytes]], max_concurrency: int = 64
+                    ) -> AsyncIterator[Tuple[Union[PromptPayload, bytes], Union[APIResponse, Exception]]]:
+        """
+        并发提交多个prompt请求，按完成顺序产出(payload, APIResponse或异常)
+
+        参数:
+            payloads: Prompt请求参数，可以是惰性的可迭代对象
+            max_concurrency (int): 同时进行中的请求数上限
+        """
+        return async_bounded_map(self.prompt, payloads, max_concurrency)
+
+    async def submit(self, payload: Union[PromptPayload, bytes],
+                     on_progress: Optional[ProgressCallback] = None) -> PromptFuture:
+        """
+        提交prompt并返回任务的future，可以直接await，也可以用asyncio.wait/as_completed等待。
+        future由使用同一TaskRegistry的WebSocket客户端按taskId完成。
+        """
+        result = await self.prompt(payload)
+        if result.code != 0:
+            raise APIError(result.code, result.msg)
+        return self.tasks.register(task_id_from_response(result), on_progress)
+
+    async def get_prompt_status(self, prompt_id: str) -> APIResponse:
+        """获取指定prompt请求的状态"""
+        return await self._request_api(f"v1/prompts/{prompt_id}/status")
+
+    async def cancel_prompt(self, prompt_id: str) -> APIResponse:
+        """取消正在执行的prompt请求"""
+        return await self._request_api(f"v1/prompts/{prompt_id}/cancel", method="POST")
+
+    async def download_file(self, url: str, save_path: str = None, max_connections: int = 4,
+                            segment_size: int = DEFAULT_SEGMENT_SIZE) -> str:
+        """
+        从ComfyOne服务器下载文件
+        服务端支持Range请求时大文件分段并行下载，中断后从已写入的位置继续；
+        数据先写入临时文件，完成后原子重命名，失败时保留进度供下次调用续传。
+
+        参数:
+            url (str): 文件下载URL
+            save_path (str, optional): 文件保存路径或目录。如果为None，将保存在当前目录下，使用URL中的文件名
+            max_connections (int): 并行下载使用的最大连接数
+            segment_size (int): 分段大小（字节）
+
+        返回:
+            str: 保存文件的完整路径
+        """
+        state = await self._download(url, resolve_save_path(url, save_path), max_connections, segment_size)
+        return state.path
+
+    async def download_many(self, urls: Iterable[str], dest: Optional[str] = None,
+                            max_concurrency: int = 4) -> List[Union[str, Exception]]:
+        """
+        并发下载多个文件，返回与输入顺序一致的路径或异常列表；重复的URL只下载一次，
+        设置了download_cache时再次请求同一URL不会访问网络
+
+        参数:
+            urls: 文件下载URL
+            dest (str, optional): 保存目录。为None时启用缓存则直接返回缓存中的路径，否则保存到当前目录
+            max_concurrency (int): 同时下载的文件数上限
+        """
+        urls = list(urls)
+        if dest is not None:
+            os.makedirs(dest, exist_ok=True)
+        results = {
+            url: result
+            async for url, result in async_bounded_map(
+                lambda url: self._download_one(url, dest), dict.fromkeys(urls), max_concurrency
+            )
+        }
+        return [results[url] for url in urls]
+
+    async def _download_one(self, url: str, dest: Optional[str]) -> str:
+        """download_many的单个文件：优先使用本地缓存，未命中时下载到缓存再放到目标目录"""
+        cache = self.download_cache
+        if cache is None:
+            return await self.download_file(url, dest)
+        async def download(staging_path: str) -> Tuple[str, Optional[str]]:
+            state = await self._download(url, staging_path)
+            return state.path, state.validator
+
+        return self._place_download(url, await cache.get_or_download_async(url, download), dest)
+
+    async def _download(self, url: str, save_path: str, max_connections: int = 4,
+                        segment_size: int = DEFAULT_SEGMENT_SIZE) -> DownloadState:
+        """下载文件到save_path，返回完成后的下载状态（包含远端的ETag/Last-Modified）"""
+        state = DownloadState(save_path, self.logger)
+        try:
+            if not (state.load(url) and await self._resume_download(url, state, max_connections)):
+                await self._start_download(url, state, max_connections, segment_size)
+            state.commit()
+            self.logger.debug(f"File downloaded successfully to: {save_path}")
+            return state
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            state.save()
+            self.logger.error(f"Error downloading file: {str(e)}")
+            raise ConnectionError(503, f"Failed to download file: {str(e)}")
+        except IOError as e:
+            state.save()
+            self.logger.error(f"Error saving file: {str(e)}")
+            raise IOError(f"Failed to save file: {str(e)}")
+        except asyncio.CancelledError:
+            state.save()
+            raise
+
+    async def download_to_buffer(self, url: str,
+                                 buffer: Optional[Union[bytearray, memoryview]] = None) -> memoryview:
+        """
+        把文件直接下载到内存，不经过磁盘；连接中断且服务端支持Range时从已读取的位置继续
+
+        参数:
+            url (str): 文件下载URL
+            buffer (bytearray/memoryview, optional): 预分配的可写缓冲区，None时按Content-Length分配
+
+        返回:
+            memoryview: 缓冲区中已写入数据的部分
+        """
+        data: Union[bytearray, memoryview] = buffer
+        growable = False
+        position = 0
+        validator = None
+        retry = self.retry_policy.start()
+        try:
+            while True:
+                try:
+                    async with await self._open_download(url, position, validator) as response:
+                        if position == 0:
+                            validator = range_validator(response.headers)
+                            data, growable = prepare_buffer(buffer, response.headers.get("Content-Length"))
+                        # iter_any直接产出连接已收到的数据块，不按固定大小再切分复制
+                        if growable:
+                            async for chunk in response.content.iter_any():
+                                data += chunk
+                                position += len(chunk)
+                        else:
+                            with memoryview(data) as view, view.cast("B") as flat:
+                                async for chunk in response.content.iter_any():
+                                    end = position + len(chunk)
+                                    if end > flat.nbytes:
+                                        raise ValueError(f"Buffer too small: {flat.nbytes} bytes")
+                                    flat[position:end] = chunk
+                                    position = end
+                    return memoryview(data).cast("B")[:position]
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    delay = self._download_retry_delay(retry, e)
+                    if delay is None or (position and not validator):
+                        raise
+                    self.logger.warning(f"Download interrupted at {position} bytes, retry in {delay:.2f}s: {str(e)}")
+                    await asyncio.sleep(delay)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"Error downloading file: {str(e)}")
+            raise ConnectionError(503, f"Failed to download file: {str(e)}")
+
+    async def iter_download(self, url: str, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        以数据块的形式下载文件，适合直接传给解码器或再次上传；
+        连接中断且服务端支持Range时从已产出的位置继续，调用方不会收到重复数据
+
+        参数:
+            url (str): 文件下载URL
+            chunk_size (int, optional): 最大块大小，None表示按吞吐量自适应
+        """
+        position = 0
+        validator = None
+        retry = self.retry_policy.start()
+        try:
+            while True:
+                try:
+                    async with await self._open_download(url, position, validator) as response:
+                        if position == 0:
+                            validator = range_validator(response.headers)
+                        sizer = ChunkSizer()
+                        while True:
+                            started = time.monotonic()
+                            chunk = await response.content.read(chunk_size or sizer.size)
+                            if not chunk:
+                                return
+                            sizer.record(len(chunk), time.monotonic() - started)
+                            position += len(chunk)
+                            yield chunk
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    delay = self._download_retry_delay(retry, e)
+                    if delay is None or (position and not validator):
+                        raise
+                    self.logger.warning(f"Download interrupted at {position} bytes, retry in {delay:.2f}s: {str(e)}")
+                    await asyncio.sleep(delay)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"Error downloading file: {str(e)}")
+            raise ConnectionError(503, f"Failed to download file: {str(e)}")
+
+    async def _open_download(self, url: str, position: int, validator: Optional[str]) -> "aiohttp.ClientResponse":
+        """从position开始读取文件；续传时服务端必须返回206，否则说明不支持Range或文件已变化"""
+        if position == 0:
+            return await self._download_request(url)
+        response = await self._download_request(url, f"bytes={position}-", validator)
+        if response.status != 206:
+            response.release()
+            raise IOError(f"Cannot resume download of {url}: server ignored the Range request")
+        return response
+
+    async def _download_request(self, url: str, byte_range: Optional[str] = None,
+                                validator: Optional[str] = None) -> "aiohttp.ClientResponse":
+        """发送下载请求；禁用内容编码，保证Range的字节偏移与文件一致"""
+        if self.rate_limiter:
+            await self.rate_limiter.acquire_async(RateLimiter.FILE)
+        headers = {**self.headers, "Accept-Encoding": "identity"}
+        if byte_range:
+            headers["Range"] = byte_range
+            if validator:
+                headers["If-Range"] = validator
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        response = await self.session.get(url, headers=headers, timeout=timeout)
+        if response.status >= 400 and response.status != 416:
+            response.raise_for_status()
+        return response
+
+    async def _start_download(self, url: str, state: DownloadState, max_connections: int,
+                              segment_size: int) -> None:
+        """首次下载：第一个请求同时探测Range支持并下载第一个分段"""
+        response = await self._download_request(url, f"bytes=0-{segment_size - 1}")
+        content_range = parse_content_range(response.headers.get("Content-Range"))
+        if response.status != 206 or content_range is None or content_range[2] is None:
+            await self._download_whole(url, state, response)
+            return
+        state.plan(url, content_range[2], range_validator(response.headers), segment_size)
+        await self._download_segments(url, state, max_connections, response)
+
+    async def _resume_download(self, url: str, state: DownloadState, max_connections: int) -> bool:
+        """续传未完成的下载；远端文件已变化时丢弃旧进度并返回False"""
+        pending = state.incomplete()
+        if not pending:
+            return True
+        response = await self._download_request(url, pending[0].range_header(), state.validator)
+        if response.status != 206:
+            response.release()
+            self.logger.info(f"Remote file changed, restarting download: {url}")
+            state.discard()
+            return False
+        self.logger.debug(f"Resuming download of {sum(s.remaining for s in pending)} bytes: {url}")
+        await self._download_segments(url, state, max_connections, response)
+        return True
+
+    async def _download_whole(self, url: str, state: DownloadState,
+                              response: Optional["aiohttp.ClientResponse"]) -> None:
+        """服务端不支持Range时使用单个连接下载，中断后只能从头开始"""
+        if response is not None and response.status != 200:
+            response.release()
+            response = None
+        retry = self.retry_policy.start()
+        while True:
+            try:
+                if response is None:
+                    response = await self._download_request(url)
+                state.validator = range_validator(response.headers)
+                async with response:
+                    with open(state.part_path, "wb") as f:
+                        await self._copy_body(response, f)
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                response = None
+                delay = self._download_retry_delay(retry, e)
+                if delay is None:
+                    raise
+                self.logger.warning(f"Download interrupted, restarting in {delay:.2f}s: {str(e)}")
+                await asyncio.sleep(delay)
+
+    async def _download_segments(self, url: str, state: DownloadState, max_connections: int,
+                                 first_response: "aiohttp.ClientResponse") -> None:
+        """并发下载所有未完成的分段，first_response为第一个未完成分段已发出的请求"""
+        pending = state.incomplete()
+        if not pending:
+            # 空文件或所有分段都已完成：读完第一个响应（至多一个分段）再释放，连接才会归还连接池
+            async with first_response:
+                await first_response.read()
+            return
+        semaphore = asyncio.Semaphore(max(1, max_connections))
+
+        async def run(segment: Segment, response: Optional["aiohttp.ClientResponse"]) -> None:
+            async with semaphore:
+                await self._download_segment(url, state, segment, response)
+
+        tasks = [
+            asyncio.ensure_future(run(segment, first_response if i == 0 else None))
+            for i, segment in enumerate(pending)
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            errors = [task.exception() for task in done if task.exception() is not None]
+            if errors:
+                raise errors[0]
+        finally:
+            # 出错或被取消时停止其余分段，已写入的进度由download_file保存
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _download_segment(self, url: str, state: DownloadState, segment: Segment,
+                                response: Optional["aiohttp.ClientResponse"] = None) -> None:
+        """下载一个分段，连接中断时从该分段已写入的位置继续"""
+        retry = self.retry_policy.start()
+        while True:
+            try:
+                if response is None:
+                    response = await self._download_request(url, segment.range_header(), state.validator)
+                    if response.status != 206:
+                        response.release()
+                        raise IOError(f"Remote file changed during download: {url}")
+                async with response:
+                    with open(state.part_path, "r+b") as f:
+                        f.seek(segment.position)
+                        await self._copy_body(response, f, segment)
+                state.save()
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                response = None
+                delay = self._download_retry_delay(retry, e)
+                if delay is None:
+                    raise
+                self.logger.warning(
+                    f"Download of {segment.range_header()} interrupted, retry {retry.attempts}/"
+                    f"{self.retry_policy.max_attempts} in {delay:.2f}s: {str(e)}"
+                )
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _copy_body(response: "aiohttp.ClientResponse", f: BinaryIO,
+                         segment: Optional[Segment] = None) -> None:
+        """以自适应块大小把响应体写入文件；指定segment时只写入该分段剩余的字节"""
+        sizer = ChunkSizer()
+        while segment is None or not segment.done:
+            started = time.monotonic()
+            size = sizer.size if segment is None else min(sizer.size, segment.remaining)
+            chunk = await response.content.read(size)
+            if not chunk:
+                if segment is not None:
+                    raise aiohttp.ClientPayloadError("Connection closed before the range completed")
+                return
+            f.write(chunk)
+            if segment is not None:
+                segment.written += len(chunk)
+            sizer.record(len(chunk), time.monotonic() - started)
+
+    @staticmethod
+    def _download_retry_delay(retry: RetryState, error: Exception) -> Optional[float]:
+        """下载中断或收到可重试的HTTP状态时返回重试等待时间"""
+        if isinstance(error, aiohttp.ClientResponseError):
+            return retry.next_delay(error.status, "GET", error.headers)
+        return retry.next_delay()
@@ -0,0 +1,222 @@
+import copy
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional, Tuple
+
+# 磁盘缓存文件名：键的SHA-256十六进制摘要加.json，clear只删除符合该格式的文件
+CACHE_FILE_PATTERN = re.compile(r"^[0-9a-f]{64}\.json$")
+
+
+@dataclass
+class CacheEntry:
+    """缓存条目，data为原始API响应字典"""
+    key: str
+    data: Dict[str, Any]
+    stored_at: float
+    etag: Optional[str] = None
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+
+class ResponseCache:
+    """
+    工作流和后端查询接口的读缓存
+    内存层为LRU，按资源类型设置TTL；过期后在stale_while_revalidate时间窗口内先返回旧值并在后台刷新，
+    服务端返回ETag时使用If-None-Match进行条件请求。可选的磁盘层使进程重启后缓存仍然有效。
+    每个键有一个代数，invalidate和clear会推进代数；发送请求前记下代数，写回时代数已变化则丢弃结果，
+    避免在失效之前发出的（后台）刷新把旧数据写回缓存。
+    """
+    FRESH = "fresh"
+    STALE = "stale"
+    EXPIRED = "expired"
+    MISS = "miss"
+
+    DEFAULT_TTLS = {"workflows": 300.0, "backends": 30.0}
+
+    def __init__(self, max_entries: int = 256, ttls: Optional[Dict[str, float]] = None,
+                 stale_while_revalidate: float = 60.0, disk_path: Optional[str] = None,
+                 logger: Optional[logging.Logger] = None):
+        """
+        参数:
+            max_entries (int): 内存中最多缓存的条目数
+            ttls (Dict[str, float], optional): 资源类型（workflows、backends）到TTL秒数的映射，未列出的资源不缓存
+            stale_while_revalidate (float): 过期后仍可返回旧值并后台刷新的秒数
+            disk_path (str, optional): 磁盘缓存目录
+        """
+        self.max_entries = max_entries
+        self.ttls = dict(self.DEFAULT_TTLS if ttls is None else ttls)
+        self.stale_while_revalidate = stale_while_revalidate
+        self.disk_path = os.path.expanduser(disk_path) if disk_path else None
+        self.logger = logger or logging.getLogger(__name__)
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._counter = itertools.count(1)
+        self._generations: Dict[str, int] = {}
+        self._cleared_at = 0
+        if self.disk_path:
+            os.makedirs(self.disk_path, exist_ok=True)
+
+    @staticmethod
+    def resource_of(api: str) -> str:
+        """接口路径对应的资源类型，例如v1/workflows/123 -> workflows"""
+        parts = api.strip("/").split("/")
+        return parts[1] if len(parts) > 1 else parts[0]
+
+    def cacheable(self, api: str) -> bool:
+        """该接口是否启用了缓存"""
+        return self.resource_of(api) in self.ttls
+
+    def lookup(self, key: str) -> Tuple[Optional[CacheEntry], str]:
+        """查询缓存，返回(条目, 状态)，状态为FRESH/STALE/EXPIRED/MISS之一"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            entry = self._load(key)
+            if entry is None:
+                return None, self.MISS
+            self._remember(entry)
+
+        ttl = self.ttls.get(self.resource_of(key), 0.0)
+        age = entry.age()
+        if age < ttl:
+            return entry, self.FRESH
+        if age < ttl + self.stale_while_revalidate:
+            return entry, self.STALE
+        return entry, self.EXPIRED
+
+    def generation(self, key: str) -> int:
+        """键的当前代数，在发送请求前获取并传给store/touch"""
+        with self._lock:
+            return self._generations.setdefault(key, self._cleared_at)
+
+    def store(self, key: str, data: Dict[str, Any], etag: Optional[str] = None,
+              generation: Optional[int] = None) -> CacheEntry:
+        """
+        写入缓存
+
+        参数:
+            generation (int, optional): 发送请求前获取的代数；此后键已失效时不写入，只返回条目
+        """
+        entry = CacheEntry(key=key, data=data, stored_at=time.time(), etag=etag)
+        if self._remember(entry, generation):
+            self._dump(entry)
+        return entry
+
+    def touch(self, entry: CacheEntry, generation: Optional[int] = None) -> None:
+        """条件请求返回304时刷新条目的写入时间，generation的含义同store"""
+        entry.stored_at = time.time()
+        if self._remember(entry, generation):
+            self._dump(entry)
+
+    def response_data(self, entry: CacheEntry) -> Dict[str, Any]:
+        """返回条目数据的副本，避免调用方修改缓存内容"""
+        return copy.deepcopy(entry.data)
+
+    def invalidate(self, api: str) -> None:
+        """
+        写操作后使相关缓存失效：该路径本身、其子路径以及所属的集合，
+        例如v1/workflows/123会使v1/workflows/123和v1/workflows失效
+        """
+        path = api.strip("/")
+        collection = "/".join(path.split("/")[:2])
+
+        def affected(key: str) -> bool:
+            return key in (path, collection) or key.startswith(path + "/")
+
+        with self._lock:
+            keys = [k for k in self._entries if affected(k)]
+            for key in keys:
+                del self._entries[key]
+            keys = set(keys) | {k for k in self._generations if affected(k)} | {path, collection}
+            generation = next(self._counter)
+            for key in keys:
+                self._generations[key] = generation
+        for key in keys:
+            self._remove_file(key)
+
+    def clear(self) -> None:
+        """清空内存和磁盘缓存；磁盘目录中只删除本缓存写入的文件"""
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._cleared_at = next(self._counter)
+        if self.disk_path:
+            for name in os.listdir(self.disk_path):
+                if CACHE_FILE_PATTERN.match(name):
+                    try:
+                        os.remove(os.path.join(self.disk_path, name))
+                    except FileNotFoundError:
+                        pass
+
+    def begin_refresh(self, key: str) -> bool:
+        """标记后台刷新开始，同一个键同时只允许一个刷新"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key: str) -> None:
+        """标记后台刷新结束"""
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _remember(self, entry: CacheEntry, generation: Optional[int] = None) -> bool:
+        """放入内存层；generation已过期时不放入并返回False"""
+        with self._lock:
+            if generation is not None and generation != self._generations.get(entry.key, self._cleared_at):
+                self.logger.debug(f"Discarding cache write for {entry.key} invalidated in flight")
+                return False
+            self._entries[entry.key] = entry
+            self._entries.move_to_end(entry.key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def _file_for(self, key: str) -> str:
+        return os.path.join(self.disk_path, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        if not self.disk_path:
+            return None
+        try:
+            with open(self._file_for(key), "r", encoding="utf-8") as f:
+                entry = CacheEntry(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError, OSError) as e:
+            self.logger.warning(f"Ignoring unreadable cache file for {key}: {e}")
+            return None
+        return entry if entry.key == key else None
+
+    def _dump(self, entry: CacheEntry) -> None:
+        if not self.disk_path:
+            return
+        path = self._file_for(entry.key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(asdict(entry), f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            self.logger.warning(f"Failed to write cache file for {entry.key}: {e}")
+
+    def _remove_file(self, key: str) -> None:
+        if not self.disk_path:
+            return
+        try:
+            os.remove(self._file_for(key))
+        except FileNotFoundError:
+            pass
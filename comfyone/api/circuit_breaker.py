@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Dict
+from .exceptions import ConnectionError
+
+
+class CircuitState(str, Enum):
+    """熔断器状态枚举"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """熔断器处于打开状态，请求被直接拒绝"""
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(503, f"Circuit breaker open for {name}, retry in {retry_in:.1f}s",
+                         {"endpoint": name, "retry_in": retry_in})
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    基于失败率滑动窗口的熔断器
+    CLOSED: 正常放行并统计最近window_size次调用的结果；
+    OPEN: 失败率超过阈值后打开，open_timeout秒内所有请求直接失败；
+    HALF_OPEN: 超时后放行少量探测请求，探测成功则关闭，失败则重新打开。
+    """
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, window_size: int = 20,
+                 min_calls: int = 10, open_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.open_timeout = open_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._window = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._last_probe_at = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        """当前状态，打开超时后自动转为半开"""
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == CircuitState.OPEN and now - self._opened_at >= self.open_timeout:
+            self._state = CircuitState.HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+
+    def _failure_rate(self) -> float:
+        if not self._window:
+            return 0.0
+        return self._window.count(False) / len(self._window)
+
+    def _open(self, now: float) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = now
+
+    def before_call(self) -> None:
+        """请求前调用，熔断器打开或探测名额已满时抛出CircuitOpenError"""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_half_open(now)
+            if self._state == CircuitState.OPEN:
+                raise CircuitOpenError(self.name, self.open_timeout - (now - self._opened_at))
+            if self._state == CircuitState.HALF_OPEN:
+                # 探测请求异常丢失结果时，超过open_timeout后允许新的探测
+                if self._probes >= self.half_open_max_calls and now - self._last_probe_at < self.open_timeout:
+                    raise CircuitOpenError(self.name, 0.0)
+                self._probes += 1
+                self._last_probe_at = now
+
+    def record_success(self) -> None:
+        """记录一次成功调用"""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_calls:
+                    self._state = CircuitState.CLOSED
+                    self._window.clear()
+                return
+            self._window.append(True)
+
+    def record_failure(self) -> None:
+        """记录一次失败调用"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._open(now)
+                return
+            self._window.append(False)
+            if (self._state == CircuitState.CLOSED and len(self._window) >= self.min_calls
+                    and self._failure_rate() >= self.failure_rate_threshold):
+                self._open(now)
+
+    def reset(self) -> None:
+        """强制关闭熔断器并清空统计"""
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._window.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回熔断器的当前状态信息"""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_half_open(now)
+            return {
+                "state": self._state.value,
+                "failure_rate": self._failure_rate(),
+                "calls": len(self._window),
+                "retry_in": max(0.0, self.open_timeout - (now - self._opened_at))
+                if self._state == CircuitState.OPEN else 0.0,
+            }
+
+
+class CircuitBreakerRegistry:
+    """按接口族（如v1/prompts、v1/files）管理熔断器"""
+    def __init__(self, **breaker_options):
+        """
+        参数:
+            breaker_options: 创建CircuitBreaker时使用的配置，例如failure_rate_threshold、open_timeout
+        """
+        self.breaker_options = breaker_options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint_family(api: str) -> str:
+        """将接口路径归类为接口族，例如v1/prompts/123/status -> v1/prompts"""
+        return "/".join(api.strip("/").split("/")[:2])
+
+    def get(self, api: str) -> CircuitBreaker:
+        """获取接口对应的熔断器，不存在时创建"""
+        family = self.endpoint_family(api)
+        breaker = self._breakers.get(family)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(family)
+                if breaker is None:
+                    breaker = CircuitBreaker(family, **self.breaker_options)
+                    self._breakers[family] = breaker
+        return breaker
+
+    def states(self) -> Dict[str, Dict[str, Any]]:
+        """所有熔断器的状态快照"""
+        return {name: breaker.snapshot() for name, breaker in list(self._breakers.items())}
@@ -0,0 +1,483 @@
+import copy
+import hashlib
+import mmap
+import os
+import time
+import logging
+import threading
+from typing import Optional, Tuple, Union, Dict, Any, Callable, Mapping
+from .models import APIResponse, WorkflowPayload
+from .exceptions import APIError, AuthenticationError, ConnectionError
+from .futures import TaskRegistry
+from .codec import JSONCodec, default_codec
+from .compression import Compressor, get_compressor
+from . import json_patch
+from .retry import RetryPolicy, RetryBudget
+from .circuit_breaker import CircuitBreakerRegistry
+from .rate_limit import RateLimiter
+from .concurrency import AdaptiveConcurrencyLimiter
+from .cache import ResponseCache, CacheEntry
+from .workflow_registry import WorkflowRegistry, canonicalize_workflow
+from .upload_cache import UploadCache, sha256_file, sha256_stream
+from .download import resolve_save_path
+from .download_cache import DownloadCache, copy_from_cache
+from .multipart import MultipartStream, UploadSource
+
+
+def account_scope(base_url: str, api_key: str) -> str:
+    """
+    服务端地址和账号的标识，用于区分工作流索引、上传缓存中属于不同服务端或账号的条目；
+    只包含API密钥的哈希，持久化的缓存文件中不会出现密钥本身
+    """
+    account = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return f"{base_url.rstrip('/')}#{account}"
+
+
+class ClientCore:
+    """
+    ComfyOneClient和AsyncComfyOneClient共享的部分
+    只包含不涉及I/O的逻辑：请求计划与重试判断、响应缓存的查询和失效、工作流请求体与补丁的构造、
+    ensure_workflow的决策以及上传下载缓存的键。两个客户端只负责实际的发送和等待（阻塞或await）。
+    """
+    def __init__(self, api_key: str, base_url: str, max_retries: int, timeout: int,
+                 logger: Optional[logging.Logger],
+                 retry_policy: Optional[RetryPolicy],
+                 circuit_breakers: Union[CircuitBreakerRegistry, bool],
+                 rate_limiter: Optional[RateLimiter],
+                 concurrency_limiter: Optional[AdaptiveConcurrencyLimiter],
+                 cache: Optional[ResponseCache],
+                 workflow_registry: Optional[WorkflowRegistry],
+                 upload_cache: Optional[UploadCache],
+                 download_cache: Optional[DownloadCache],
+                 codec: Optional[JSONCodec],
+                 trust_responses: bool,
+                 compression: Union[str, Compressor, None],
+                 compression_min_size: int,
+                 canonicalize_workflows: bool,
+                 workflow_patches: bool,
+                 tasks: Optional[TaskRegistry]):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')  # Remove trailing slash if present
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.headers = {
+            "Authorization": f"Bearer {api_key}"
+        }
+        # 工作流索引和上传缓存按服务端和账号区分条目
+        self.scope = account_scope(self.base_url, api_key)
+        # 默认重试策略：max_retries次尝试，decorrelated jitter退避，客户端共享重试预算
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries, budget=RetryBudget())
+        # 按接口族熔断，True使用默认配置，False关闭熔断
+        if circuit_breakers is True:
+            circuit_breakers = CircuitBreakerRegistry()
+        self.circuit_breakers: Optional[CircuitBreakerRegistry] = circuit_breakers or None
+        # 可选的客户端限流，按prompt/status/file类别分别限速
+        self.rate_limiter = rate_limiter
+        # 可选的AIMD自适应并发控制，作用于prompt和upload_file
+        self.concurrency_limiter = concurrency_limiter
+        # 可选的工作流/后端查询缓存，通过本客户端的写操作会自动使相关缓存失效
+        self.cache = cache
+        # ensure_workflow使用的工作流内容哈希索引，默认仅保存在内存中
+        self.workflow_registry = workflow_registry or WorkflowRegistry(logger=self.logger)
+        # 可选的上传去重缓存，相同内容的文件只上传一次
+        self.upload_cache = upload_cache
+        # 可选的下载内容缓存，download_many再次请求同一URL时直接使用本地文件
+        self.download_cache = download_cache
+        # 请求和响应体的JSON编解码器，默认安装了orjson时使用orjson
+        self.codec = codec or default_codec
+        # 信任服务端响应时跳过APIResponse的pydantic校验，data保持原始结构
+        self.trust_responses = trust_responses
+        # 可选的请求体压缩（gzip/zstd），只压缩不小于compression_min_size的JSON请求体；
+        # 服务端返回415时自动改为不压缩发送
+        self.compressor = get_compressor(compression)
+        self.compression_min_size = compression_min_size
+        # 上传前去掉工作流图中仅用于界面展示的元数据
+        self.canonicalize_workflows = canonicalize_workflows
+        # update_workflow在响应缓存中有服务端版本时只发送JSON Patch差异，服务端不支持时自动关闭
+        self.workflow_patches = workflow_patches
+        self._update_stats = {"patched": 0, "full": 0, "bytes_saved": 0}
+        self._stats_lock = threading.Lock()
+        # submit()返回的future注册表，由共享该注册表的WebSocket客户端按taskId完成
+        self.tasks = tasks or TaskRegistry(logger=self.logger)
+
+    def get_concurrency_stats(self) -> Dict[str, Any]:
+        """
+        获取自适应并发控制器的指标
+
+        返回:
+            Dict: {limit, in_flight, latency_baseline, overloads}，未启用时为空字典
+        """
+        return self.concurrency_limiter.stats() if self.concurrency_limiter else {}
+
+    def get_workflow_update_stats(self) -> Dict[str, int]:
+        """
+        获取update_workflow的增量更新统计
+
+        返回:
+            Dict: {patched, full, bytes_saved}，bytes_saved为JSON Patch相比完整请求体节省的字节数
+        """
+        with self._stats_lock:
+            return dict(self._update_stats)
+
+    def get_circuit_states(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取各接口族熔断器的状态
+
+        返回:
+            Dict: 接口族 -> {state, failure_rate, calls, retry_in}
+        """
+        return self.circuit_breakers.states() if self.circuit_breakers else {}
+
+    def _response(self, response_data: Dict[str, Any]) -> APIResponse:
+        """构造APIResponse，trust_responses为True时不经过校验"""
+        if self.trust_responses:
+            return APIResponse.trusted(response_data)
+        return APIResponse(**response_data)
+
+    def _api_error(self, api: str, error: Exception) -> APIError:
+        """_request_api中的异常统一转换为APIError"""
+        self.logger.error(f"API Error ({api}): {str(error)}")
+        if isinstance(error, APIError):
+            return error
+        return APIError(500, str(error))
+
+    def _compress(self, payload: Union[bytes, MultipartStream, None], headers: Optional[Dict[str, str]]
+                  ) -> Tuple[Union[bytes, MultipartStream, None], Optional[Dict[str, str]]]:
+        """启用请求体压缩时压缩足够大的JSON请求体，并添加Content-Encoding请求头"""
+        compressor = self.compressor
+        if compressor is None or not isinstance(payload, bytes) or len(payload) < self.compression_min_size:
+            return payload, headers
+        return compressor.compress(payload), {**(headers or {}), "Content-Encoding": compressor.name}
+
+    @staticmethod
+    def _without_content_encoding(headers: Dict[str, str]) -> Optional[Dict[str, str]]:
+        headers = {key: value for key, value in headers.items() if key != "Content-Encoding"}
+        return headers or None
+
+    def _request_headers(self, payload: Union[bytes, MultipartStream, None],
+                         extra_headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """单次请求的请求头：认证信息、请求体类型以及调用方指定的请求头"""
+        headers = {**self.headers, **extra_headers} if extra_headers else self.headers
+        if isinstance(payload, MultipartStream):
+            return {**headers, "Content-Type": payload.content_type}
+        if payload is not None:
+            return {"Content-Type": "application/json", **headers}
+        return headers
+
+    def _error_message(self, status: int, body: bytes, reason: Optional[str]) -> str:
+        """从错误响应体中提取错误信息"""
+        try:
+            return self.codec.loads(body).get("msg") or reason
+        except (ValueError, AttributeError):
+            return body[:200].decode("utf-8", "replace") or reason or f"HTTP {status}"
+
+    def _response_data(self, status: int, body: bytes) -> Optional[Dict[str, Any]]:
+        """解码成功响应的响应体，304没有响应体时返回None"""
+        return None if status == 304 else self.codec.loads(body)
+
+    def _cache_hit(self, api: str) -> Tuple[Optional[Dict[str, Any]], Optional[CacheEntry], bool]:
+        """
+        查询响应缓存
+
+        返回:
+            (响应字典, 缓存条目, 是否需要后台刷新)；响应字典为None时需要发送请求并交给_revalidated处理
+        """
+        entry, state = self.cache.lookup(api)
+        if state == ResponseCache.FRESH:
+            self.logger.debug(f"API Cache hit: {api}")
+            return self.cache.response_data(entry), entry, False
+        if state == ResponseCache.STALE:
+            self.logger.debug(f"API Cache stale, refreshing in background: {api}")
+            return self.cache.response_data(entry), entry, self.cache.begin_refresh(api)
+        return None, entry, False
+
+    @staticmethod
+    def _revalidate_headers(entry: Optional[CacheEntry]) -> Optional[Dict[str, str]]:
+        """重新获取缓存内容的请求头，条目带有ETag时发送条件请求"""
+        return {"If-None-Match": entry.etag} if entry is not None and entry.etag else None
+
+    def _revalidated(self, api: str, entry: Optional[CacheEntry], generation: int, status: int,
+                     headers: Mapping[str, str], response_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        处理重新获取的结果：304刷新原条目，成功的响应写入缓存，返回响应字典；
+        generation为发送请求前的缓存代数，请求期间缓存已失效时结果只返回给调用方而不写回
+        """
+        if status == 304 and entry is not None:
+            self.logger.debug(f"API Cache revalidated: {api}")
+            self.cache.touch(entry, generation)
+            return self.cache.response_data(entry)
+        if response_data.get("code") == 0:
+            entry = self.cache.store(api, response_data, headers.get("ETag"), generation)
+            return self.cache.response_data(entry)
+        return response_data
+
+    def _refresh_failed(self, api: str, error: Exception) -> None:
+        self.logger.warning(f"Background cache refresh failed ({api}): {str(error)}")
+
+    def _invalidate_after(self, api: str, method: str) -> None:
+        """通过本客户端的写操作使相关缓存失效"""
+        if method != "GET" and self.cache is not None and self.cache.cacheable(api):
+            self.cache.invalidate(api)
+
+    @staticmethod
+    def _release_limiter(limiter: AdaptiveConcurrencyLimiter, started: float,
+                         error: Optional[BaseException] = None) -> None:
+        """请求结束后释放并发许可：成功和过载的请求计入延迟，其他失败不影响并发上限"""
+        if error is None:
+            limiter.release(time.monotonic() - started)
+        elif isinstance(error, APIError):
+            overloaded = limiter.is_overload(error)
+            limiter.release(time.monotonic() - started if overloaded else None, overloaded)
+        else:
+            limiter.release()
+
+    def _workflow_body(self, payload: WorkflowPayload) -> Dict[str, Any]:
+        """工作流请求体，canonicalize_workflows为True时去掉界面元数据"""
+        body = payload.to_dict()
+        if self.canonicalize_workflows:
+            body["workflow"] = canonicalize_workflow(body["workflow"])
+        return body
+
+    def _workflow_deleted(self, workflow_id: str, result: APIResponse) -> APIResponse:
+        if result.code == 0:
+            self.workflow_registry.forget(self.scope, workflow_id)
+        return result
+
+    def _ensure_known(self, payload: WorkflowPayload, content_hash: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        ensure_workflow的第一步：同名工作流内容未变化，或服务端已有相同内容的工作流时不需要上传
+
+        返回:
+            (可以直接使用的工作流ID, 需要更新的同名工作流ID)，两者都为None时需要创建
+        """
+        entry = self.workflow_registry.lookup(self.scope, payload.name)
+        if entry and entry["hash"] == content_hash:
+            self.logger.debug(f"Workflow unchanged, skip upload: {payload.name}")
+            return entry["workflow_id"], None
+        workflow_id = self.workflow_registry.find(self.scope, content_hash)
+        if workflow_id:
+            self.logger.debug(f"Workflow content already uploaded as {workflow_id}, skip upload: {payload.name}")
+            self.workflow_registry.record(self.scope, payload.name, content_hash, workflow_id)
+            return workflow_id, None
+        return None, entry["workflow_id"] if entry else None
+
+    def _ensure_updated(self, payload: WorkflowPayload, content_hash: str, workflow_id: str,
+                        result: Optional[APIResponse] = None, error: Optional[APIError] = None) -> bool:
+        """
+        处理ensure_workflow中update_workflow的结果（返回值或抛出的APIError）
+
+        返回:
+            bool: 更新成功返回True；服务端工作流已被删除（404）返回False，需要重新创建。
+            其他失败抛出APIError，否则重新创建会产生同名的重复工作流
+        """
+        code = error.code if error is not None else result.code
+        if code == 404:
+            return False
+        if error is not None:
+            raise error
+        if code != 0:
+            raise APIError(code, result.msg)
+        self.workflow_registry.record(self.scope, payload.name, content_hash, workflow_id)
+        return True
+
+    def _ensure_created(self, payload: WorkflowPayload, content_hash: str, result: APIResponse) -> str:
+        """处理ensure_workflow中create_workflow的结果，返回新工作流ID"""
+        if result.code != 0:
+            raise APIError(result.code, result.msg)
+        workflow_id = result.data["id"]
+        self.workflow_registry.record(self.scope, payload.name, content_hash, workflow_id)
+        return workflow_id
+
+    def _upload_key(self, source: UploadSource) -> Optional[Callable[[], str]]:
+        """
+        启用上传缓存时计算缓存键（本客户端scope下数据源的内容哈希）的函数；
+        不可seek的文件对象无法预先计算内容哈希，返回None
+        """
+        if self.upload_cache is None:
+            return None
+        if isinstance(source, str):
+            digest = lambda: sha256_file(source)
+        elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            digest = lambda: hashlib.sha256(source).hexdigest()
+        elif source.seekable():
+            def digest() -> str:
+                position = source.tell()
+                try:
+                    return sha256_stream(source)
+                finally:
+                    source.seek(position)
+        else:
+            return None
+        return lambda: UploadCache.scoped_key(self.scope, digest())
+
+    def _check_upload_file(self, file_path: str) -> None:
+        if not os.path.isfile(file_path):
+            self.logger.error(f"File not found: {file_path}")
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+    def _cached_upload_response(self, data: Dict[str, Any]) -> APIResponse:
+        """上传缓存中的文件引用由多个调用方共享，返回副本"""
+        return self._response(copy.deepcopy(data))
+
+    @staticmethod
+    def _place_download(url: str, cached_path: str, dest: Optional[str]) -> str:
+        """download_many的缓存文件放到目标目录；dest为None时直接返回缓存中的路径"""
+        if dest is None:
+            return cached_path
+        return copy_from_cache(cached_path, resolve_save_path(url, dest))
+
+
+class RequestPlan:
+    """
+    一次API调用的发送计划，不执行任何I/O
+    请求体只编码、压缩一次；每次尝试的结果交给on_exception/on_response，
+    由它们记录熔断结果并决定重试的等待时间，客户端只负责发送和等待。
+    """
+    def __init__(self, client: ClientCore, api: str, payload: Union[dict, list, bytes, MultipartStream, None],
+                 method: str = "GET", headers: Optional[Dict[str, str]] = None):
+        self.client = client
+        self.api = api
+        self.method = method
+        self.url = f"{client.base_url}/{api}"
+        client.logger.debug(f"API Request: {method} {self.url}")
+        if isinstance(payload, (dict, list)):
+            # 只编码一次，重试时复用同一个请求体
+            payload = client.codec.dumps(payload) if payload else None
+        self.raw_payload = payload
+        self.payload, self.headers = client._compress(payload, headers)
+        self.retry = client.retry_policy.start()
+        self.breaker = client.circuit_breakers.get(api) if client.circuit_breakers else None
+        self.rate_category = RateLimiter.classify(api, method) if client.rate_limiter else None
+
+    def before_send(self) -> float:
+        """每次发送前调用：熔断打开时抛出CircuitOpenError，返回本次发送的超时时间（不超过重试截止时间）"""
+        if self.breaker:
+            self.breaker.before_call()
+        remaining = self.retry.remaining()
+        timeout = self.client.timeout
+        return timeout if remaining is None else max(0.001, min(timeout, remaining))
+
+    def on_exception(self, error: Exception, timed_out: bool, sent: bool) -> float:
+        """
+        请求没有得到响应（连接失败、超时）
+
+        参数:
+            timed_out (bool): 是否为超时
+            sent (bool): 请求是否可能已到达服务端，连接未建立时为False
+
+        返回:
+            float: 重试前的等待时间，不再重试时抛出ConnectionError
+        """
+        if self.breaker:
+            self.breaker.record_failure()
+        delay = self.retry.next_delay(method=self.method, sent=sent)
+        if delay is None:
+            self.client.logger.error(f"API failed after {self.retry.attempts} attempts: {self.api}")
+            if timed_out:
+                raise ConnectionError(408, "API request timed out")
+            raise ConnectionError(503, f"API request failed: {str(error)}")
+        self.client.logger.warning(
+            f"API {'timeout' if timed_out else 'error'}, retry {self.retry.attempts}/"
+            f"{self.client.retry_policy.max_attempts} in {delay:.2f}s: {self.api}"
+        )
+        return delay
+
+    def on_response(self, status: int, headers: Mapping[str, str], body: bytes,
+                    reason: Optional[str] = None) -> Optional[float]:
+        """
+        收到响应
+
+        返回:
+            None表示响应成功（状态码<400）；否则为重发前的等待时间，服务端拒绝压缩请求体时为0。
+            401抛出AuthenticationError，不再重试的错误状态抛出APIError
+        """
+        if self.breaker:
+            if status >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+        if status == 401:
+            self.client.logger.error("API Authentication failed")
+            raise AuthenticationError(401, "Invalid API key")
+
+        if status == 415 and self.payload is not self.raw_payload:
+            self.client.logger.warning(f"Server rejected compressed request body, disable compression: {self.api}")
+            self.client.compressor = None
+            self.payload, self.headers = self.raw_payload, self.client._without_content_encoding(self.headers)
+            return 0.0
+
+        if status >= 400:
+            delay = self.retry.next_delay(status, self.method, headers)
+            if delay is None:
+                raise APIError(status, self.client._error_message(status, body, reason))
+            self.client.logger.warning(
+                f"API status {status}, retry {self.retry.attempts}/{self.client.retry_policy.max_attempts} "
+                f"in {delay:.2f}s: {self.api}"
+            )
+            return delay
+
+        self.client.logger.debug(f"API Response: {status} - {self.api}")
+        return None
+
+
+class WorkflowUpdate:
+    """
+    update_workflow的请求体构造，不执行任何I/O
+    响应缓存中有该工作流带ETag的服务端版本时，先发送相对该版本的JSON Patch并带上If-Match，
+    服务端版本已变化（412）、补丁被拒绝或失败时改为发送完整的工作流，完成后记录统计。
+    """
+    def __init__(self, client: ClientCore, workflow_id: str, payload: WorkflowPayload):
+        self.client = client
+        self.workflow_id = workflow_id
+        self.api = f"v1/workflows/{workflow_id}"
+        self.body = client._workflow_body(payload)
+        self.encoded = client.codec.dumps(self.body)
+        self.patch_headers = {"Content-Type": json_patch.CONTENT_TYPE}
+        self.patch = self._patch()
+        self.saved = 0
+
+    def _patch(self) -> Optional[bytes]:
+        """
+        相对响应缓存中服务端版本的JSON Patch请求体，并在patch_headers中加入该版本的If-Match；
+        没有带ETag的缓存版本或补丁不比完整请求体小时返回None
+        """
+        cache = self.client.cache
+        if not self.client.workflow_patches or cache is None or not cache.cacheable(self.api):
+            return None
+        entry, _ = cache.lookup(self.api)
+        if entry is None or not entry.etag or not isinstance(entry.data.get("data"), dict):
+            return None
+        # 只比较请求体中的字段，服务端附加的字段（ID、时间戳等）不受补丁影响
+        current = entry.data["data"]
+        base = {key: current[key] for key in self.body if key in current}
+        patch = self.client.codec.dumps(json_patch.diff(base, self.body))
+        if len(patch) >= len(self.encoded):
+            return None
+        self.patch_headers["If-Match"] = entry.etag
+        return patch
+
+    def patched(self, result: APIResponse) -> Optional[APIResponse]:
+        """补丁请求的结果，失败时返回None，需要发送完整的工作流"""
+        if result.code != 0:
+            self.client.logger.info(f"Workflow patch failed ({result.msg}), sending full workflow: {self.workflow_id}")
+            return None
+        self.saved = len(self.encoded) - len(self.patch)
+        self.client.logger.debug(f"Workflow {self.workflow_id} patched, saved {self.saved} bytes")
+        return result
+
+    def rejected(self, error: APIError) -> None:
+        """补丁请求被拒绝：可以回退的状态码改为发送完整的工作流，其他错误重新抛出"""
+        if error.code not in json_patch.FALLBACK_STATUS:
+            raise error
+        if error.code in json_patch.UNSUPPORTED_STATUS:
+            self.client.workflow_patches = False
+        self.client.logger.info(f"Workflow patch rejected ({error.code}), sending full workflow: {self.workflow_id}")
+
+    def finish(self, result: APIResponse) -> APIResponse:
+        """记录增量更新统计"""
+        with self.client._stats_lock:
+            self.client._update_stats["patched" if self.saved else "full"] += 1
+            self.client._update_stats["bytes_saved"] += self.saved
+        return result
@@ -0,0 +1,62 @@
+import json
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class JSONCodec:
+    """
+    基于标准库json的编解码器
+    dumps直接返回UTF-8字节串，可以作为HTTP请求体或WebSocket消息发送而无需再次编码。
+    自定义编解码器只需实现相同的dumps/loads接口。
+    """
+    name = "json"
+
+    def dumps(self, value: Any) -> bytes:
+        """把对象编码为紧凑的UTF-8 JSON字节串"""
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """解码JSON，非法输入抛出ValueError"""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """基于orjson的编解码器，编码直接生成bytes，编解码速度比标准库快数倍"""
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("OrjsonCodec requires orjson, install it with: pip install comfyone-sdk[orjson]")
+
+    def dumps(self, value: Any) -> bytes:
+        # 与标准库一致，允许非字符串的字典键
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        return orjson.loads(data)
+
+
+def get_codec(name: Optional[str] = None) -> JSONCodec:
+    """
+    获取JSON编解码器
+
+    参数:
+        name (str, optional): "json"、"orjson"，None表示安装了orjson时使用orjson，否则使用标准库
+    """
+    if name is None:
+        return OrjsonCodec() if orjson is not None else JSONCodec()
+    if name == "orjson":
+        return OrjsonCodec()
+    if name == "json":
+        return JSONCodec()
+    raise ValueError(f"Unknown JSON codec: {name}")
+
+
+# 客户端未指定编解码器时使用的默认实例
+default_codec = get_codec()
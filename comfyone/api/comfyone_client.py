@@ -1,83 +1,205 @@
 import requests
-import json
+import mmap
 import os
 import time
 import logging
-from typing import Optional, List
+import threading
+import urllib3
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from typing import Optional, List, Iterable, Iterator, Tuple, Union, Dict, Mapping, BinaryIO
 from .models import APIResponse, WorkflowPayload, PromptPayload
-from .exceptions import APIError, AuthenticationError, ConnectionError
+from .exceptions import APIError, ConnectionError
+from .futures import PromptFuture, ProgressCallback, TaskRegistry, task_id_from_response
+from .poller import StatusPoller
+from .transport import PooledTransport
+from .codec import JSONCodec
+from .compression import DEFAULT_MIN_SIZE, Compressor
+from .retry import RetryPolicy, RetryState
+from .circuit_breaker import CircuitBreakerRegistry
+from .rate_limit import RateLimiter
+from .concurrency import AdaptiveConcurrencyLimiter
+from .cache import ResponseCache, CacheEntry
+from .workflow_registry import WorkflowRegistry, workflow_hash
+from .upload_cache import UploadCache
+from .download import (
+    DEFAULT_SEGMENT_SIZE, ChunkSizer, DownloadState, Segment, parse_content_range, prepare_buffer,
+    range_validator, resolve_save_path
+)
+from .download_cache import DownloadCache
+from .multipart import MultipartStream, NamedUploadSource, UploadSource
+from .client_core import ClientCore, RequestPlan, WorkflowUpdate
+from ..utils.bulk import bounded_map
 
-class ComfyOneClient:
+# 下载过程中可以重试（续传）的错误：连接中断、超时以及HTTP错误状态（是否重试由RetryPolicy决定）
+_RETRYABLE_DOWNLOAD_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.HTTPError,
+    urllib3.exceptions.HTTPError,
+)
+
+
+def _request_not_sent(error: requests.exceptions.RequestException) -> bool:
+    """连接未建立（连接超时、拒绝连接、DNS解析失败），请求确定没有到达服务端"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+class ComfyOneClient(ClientCore):
     """
     ComfyOne API客户端类
     用于处理与ComfyOne服务的所有API交互
     """
     def __init__(self, api_key: str, base_url: str = "https://pandora-server-cf.onethingai.com", 
-                 max_retries: int = 3, timeout: int = 5, logger: Optional[logging.Logger] = None):
-        self.api_key = api_key
-        self.base_url = base_url.rstrip('/')  # Remove trailing slash if present
-        self.max_retries = max_retries
-        self.timeout = timeout
-        self.logger = logger or logging.getLogger(__name__)
-        self.headers = {
-            "Authorization": f"Bearer {api_key}"
-        }
-
-    def _request_api(self, api: str, payload: dict = None, method: str = "GET") -> APIResponse:
+                 max_retries: int = 3, timeout: int = 5, logger: Optional[logging.Logger] = None,
+                 pool_connections: int = 10, pool_maxsize: int = 10,
+                 idle_timeout: Optional[float] = 60.0,
+                 transport: Optional[PooledTransport] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breakers: Union[CircuitBreakerRegistry, bool] = True,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 cache: Optional[ResponseCache] = None,
+                 workflow_registry: Optional[WorkflowRegistry] = None,
+                 upload_cache: Optional[UploadCache] = None,
+                 download_cache: Optional[DownloadCache] = None,
+                 codec: Optional[JSONCodec] = None,
+                 trust_responses: bool = False,
+                 compression: Union[str, Compressor, None] = None,
+                 compression_min_size: int = DEFAULT_MIN_SIZE,
+                 canonicalize_workflows: bool = True,
+                 workflow_patches: bool = True,
+                 tasks: Optional[TaskRegistry] = None):
+        super().__init__(
+            api_key, base_url, max_retries, timeout, logger, retry_policy, circuit_breakers, rate_limiter,
+            concurrency_limiter, cache, workflow_registry, upload_cache, download_cache, codec, trust_responses,
+            compression, compression_min_size, canonicalize_workflows, workflow_patches, tasks
+        )
+        # 客户端持有的连接池，所有请求复用keep-alive连接；外部传入的连接池由调用方负责关闭
+        self._owns_transport = transport is None
+        self.transport = transport or PooledTransport(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            idle_timeout=idle_timeout,
+            logger=self.logger
+        )
+        self._ensure_lock = threading.Lock()
+        self._poller: Optional[StatusPoller] = None
+        self._poller_lock = threading.Lock()
+
+    @property
+    def poller(self) -> StatusPoller:
+        """WebSocket不可用时使用的状态轮询器，首次访问时创建，也可以赋值为自定义参数的StatusPoller"""
+        with self._poller_lock:
+            if self._poller is None:
+                self._poller = StatusPoller(self, logger=self.logger)
+            return self._poller
+
+    @poller.setter
+    def poller(self, poller: StatusPoller) -> None:
+        with self._poller_lock:
+            self._poller = poller
+
+    def close(self) -> None:
+        """关闭客户端，释放客户端自己创建的连接池"""
+        if self._poller is not None:
+            self._poller.close()
+        if self._owns_transport:
+            self.transport.close()
+
+    def __enter__(self) -> "ComfyOneClient":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _request_api(self, api: str, payload: dict = None, method: str = "GET",
+                     headers: Optional[Dict[str, str]] = None) -> APIResponse:
         """向ComfyOne API发送请求的通用函数"""
-        url = f"{self.base_url}/{api}"
-        self.logger.debug(f"API Request: {method} {url}")
         try:
-            retry_count = 0
-            while retry_count < self.max_retries:
-                try:
-                    if method == "POST" and payload and "file" in payload:
-                        response = requests.request(
-                            method, 
-                            url, 
-                            headers=self.headers,
-                            files=payload,
-                            timeout=self.timeout
-                        )
-                    else:
-                        response = requests.request(
-                            method, 
-                            url, 
-                            headers=self.headers,
-                            json=payload if payload else None,
-                            timeout=self.timeout
-                    )
-                    
-                    if response.status_code == 401:
-                        self.logger.error("API Authentication failed")
-                        raise AuthenticationError(401, "Invalid API key")
-                    
-                    response.raise_for_status()
-                    response_data = response.json()
-                    self.logger.debug(f"API Response: {response.status_code} - {api}")
-                    return APIResponse(**response_data)
-                    
-                except requests.exceptions.Timeout:
-                    retry_count += 1
-                    if retry_count == self.max_retries:
-                        self.logger.error(f"API timeout after {self.max_retries} retries: {api}")
-                        raise ConnectionError("API request timed out")
-                    self.logger.warning(f"API timeout, retry {retry_count}/{self.max_retries}: {api}")
-                    time.sleep(2 ** retry_count)
-                    
-                except requests.exceptions.RequestException as e:
-                    retry_count += 1
-                    if retry_count == self.max_retries:
-                        self.logger.error(f"API failed after {self.max_retries} retries: {api}")
-                        raise ConnectionError(f"API request failed: {str(e)}")
-                    self.logger.warning(f"API error, retry {retry_count}/{self.max_retries}: {str(e)}")
-                    time.sleep(2 ** retry_count)
-                    
+            if method == "GET" and self.cache is not None and self.cache.cacheable(api):
+                return self._response(self._cached_get(api))
+            _, _, response_data = self._execute(api, payload, method, headers)
+            self._invalidate_after(api, method)
+            return self._response(response_data)
+        except Exception as e:
+            raise self._api_error(api, e)
+
+    def _cached_get(self, api: str) -> dict:
+        """带缓存的GET请求，返回响应字典"""
+        response_data, entry, refresh = self._cache_hit(api)
+        if refresh:
+            threading.Thread(target=self._background_refresh, args=(api, entry), daemon=True).start()
+        if response_data is not None:
+            return response_data
+        return self._revalidate(api, entry)
+
+    def _revalidate(self, api: str, entry: Optional[CacheEntry]) -> dict:
+        """重新获取缓存内容，条目带有ETag时发送条件请求"""
+        generation = self.cache.generation(api)
+        return self._revalidated(api, entry, generation,
+                                 *self._execute(api, headers=self._revalidate_headers(entry)))
+
+    def _background_refresh(self, api: str, entry: CacheEntry) -> None:
+        """stale-while-revalidate的后台刷新"""
+        try:
+            self._revalidate(api, entry)
         except Exception as e:
-            self.logger.error(f"API Error ({api}): {str(e)}")
-            if isinstance(e, (AuthenticationError, ConnectionError)):
-                raise
-            raise APIError(500, str(e))
+            self._refresh_failed(api, e)
+        finally:
+            self.cache.end_refresh(api)
+
+    def _execute(self, api: str, payload: dict = None, method: str = "GET",
+                 headers: Optional[Dict[str, str]] = None) -> Tuple[int, Mapping[str, str], Optional[dict]]:
+        """
+        发送请求并处理限流、熔断和重试
+        返回成功响应的(状态码, 响应头, 响应字典)，304时响应字典为None
+        """
+        plan = RequestPlan(self, api, payload, method, headers)
+        while True:
+            timeout = plan.before_send()
+            if plan.rate_category:
+                self.rate_limiter.acquire(plan.rate_category)
+            try:
+                response = self._send(method, plan.url, plan.payload, timeout, plan.headers)
+            except requests.exceptions.RequestException as e:
+                delay = plan.on_exception(e, isinstance(e, requests.exceptions.Timeout), not _request_not_sent(e))
+            else:
+                delay = plan.on_response(response.status_code, response.headers, response.content, response.reason)
+                if delay is None:
+                    return response.status_code, response.headers, self._response_data(
+                        response.status_code, response.content)
+            if delay:
+                time.sleep(delay)
+
+    def _request_limited(self, api: str, payload: dict = None, method: str = "GET") -> APIResponse:
+        """经过自适应并发控制器发送请求"""
+        limiter = self.concurrency_limiter
+        if limiter is None:
+            return self._request_api(api, payload, method)
+        limiter.acquire()
+        started = time.monotonic()
+        try:
+            response = self._request_api(api, payload, method)
+        except BaseException as e:
+            self._release_limiter(limiter, started, e)
+            raise
+        self._release_limiter(limiter, started)
+        return response
+
+    def _send(self, method: str, url: str, payload: Union[bytes, MultipartStream, None],
+              timeout: float, extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """发送单次HTTP请求"""
+        headers = self._request_headers(payload, extra_headers)
+        if isinstance(payload, MultipartStream):
+            # 重试时需要从头重新读取请求体；长度未知时以生成器发送，使用分块传输编码
+            payload.rewind()
+            data = payload if payload.length is not None else iter(payload)
+        else:
+            data = payload
+        return self.transport.request(method, url, headers=headers, data=data, timeout=timeout)
 
     def get_available_backends(self) -> APIResponse:
         """
@@ -151,7 +273,7 @@ class ComfyOneClient:
         返回:
             APIResponse: API响应数据
         """
-        return self._request_api("v1/workflows", payload.to_dict(), "POST")
+        return self._request_api("v1/workflows", self._workflow_body(payload), "POST")
 
     def get_workflows(self) -> APIResponse:
         """
@@ -176,7 +298,10 @@ class ComfyOneClient:
 
     def update_workflow(self, workflow_id: str, payload: WorkflowPayload) -> APIResponse:
         """
-        更新指定的工作流
+        更新指定的工作流。
+        设置了响应缓存且缓存中有该工作流带ETag的服务端版本（例如get_workflow获取过）时，
+        只发送相对该版本的JSON Patch差异并带上If-Match，服务端版本已变化时返回412；
+        没有缓存版本、补丁不比完整请求体小、服务端不支持或拒绝补丁时发送完整的工作流，节省的字节数见get_workflow_update_stats()。
         
         参数:
             workflow_id (str): 工作流ID
@@ -185,7 +310,16 @@ class ComfyOneClient:
         返回:
             APIResponse: API响应数据
         """
-        return self._request_api(f"v1/workflows/{workflow_id}", payload, "PATCH")
+        update = WorkflowUpdate(self, workflow_id, payload)
+        result = None
+        if update.patch is not None:
+            try:
+                result = update.patched(self._request_api(update.api, update.patch, "PATCH", update.patch_headers))
+            except APIError as e:
+                update.rejected(e)
+        if result is None:
+            result = self._request_api(update.api, update.encoded, "PATCH")
+        return update.finish(result)
 
     def delete_workflow(self, workflow_id: str) -> APIResponse:
         """
@@ -197,42 +331,187 @@ class ComfyOneClient:
         返回:
             APIResponse: API响应数据
         """
-        return self._request_api(f"v1/workflows/{workflow_id}", method="DELETE")
+        return self._workflow_deleted(workflow_id, self._request_api(f"v1/workflows/{workflow_id}", method="DELETE"))
+
+    def ensure_workflow(self, payload: WorkflowPayload) -> str:
+        """
+        确保服务端存在与payload内容一致的工作流。
+        对工作流图及输入输出定义做规范化哈希，内容未变化时不发送任何请求，
+        同名工作流内容变化时调用update_workflow，否则调用create_workflow。
+        
+        参数:
+            payload: 工作流配置参数
+            
+        返回:
+            str: 工作流ID
+        """
+        content_hash = workflow_hash(payload)
+        with self._ensure_lock:
+            unchanged_id, workflow_id = self._ensure_known(payload, content_hash)
+            if unchanged_id:
+                return unchanged_id
+            if workflow_id:
+                try:
+                    result = self.update_workflow(workflow_id, payload)
+                except APIError as e:
+                    updated = self._ensure_updated(payload, content_hash, workflow_id, error=e)
+                else:
+                    updated = self._ensure_updated(payload, content_hash, workflow_id, result)
+                if updated:
+                    return workflow_id
+            return self._ensure_created(payload, content_hash, self.create_workflow(payload))
 
-    def upload_file(self, file_path: str) -> APIResponse:
+    def upload_file(self, file_path: str, filename: Optional[str] = None) -> APIResponse:
         """
-        上传文件到ComfyOne
+        上传文件到ComfyOne，文件内容以流式multipart方式发送，内存占用与文件大小无关
         
         参数:
             file_path (str): 要上传的文件路径
+            filename (str, optional): 服务端保存使用的文件名，默认取路径中的文件名
             
         返回:
             APIResponse: API响应数据
         """
-        try:
-            payload = {"file": open(file_path, "rb")}
-        except FileNotFoundError:
-            self.logger.error(f"File not found: {file_path}")
-            raise FileNotFoundError(f"File not found: {file_path}")
-        except Exception as e:
-            self.logger.error(f"Error uploading file: {e}")
-            raise e
-        ret = self._request_api("v1/files", payload, "POST")
-        # 关闭文件
-        payload["file"].close()
-        return ret
+        self._check_upload_file(file_path)
+        return self._upload(file_path, filename)
+
+    def upload_bytes(self, data: Union[bytes, bytearray, memoryview, mmap.mmap], filename: str = "upload.bin",
+                     content_type: Optional[str] = None) -> APIResponse:
+        """
+        上传内存中的数据，支持bytes、bytearray、memoryview和mmap，数据不会被整体拷贝
+        
+        参数:
+            data: 要上传的数据
+            filename (str): 服务端保存使用的文件名
+            content_type (str, optional): 文件类型，默认按文件名猜测
+            
+        返回:
+            APIResponse: API响应数据
+        """
+        return self._upload(data, filename, content_type)
+
+    def upload_fileobj(self, fileobj: BinaryIO, filename: Optional[str] = None,
+                       content_type: Optional[str] = None) -> APIResponse:
+        """
+        从二进制文件对象的当前位置开始流式上传，调用方负责关闭文件对象。
+        不可seek的文件对象使用分块传输编码，且不支持重试和上传缓存。
+        
+        参数:
+            fileobj: 以二进制模式打开的文件对象
+            filename (str, optional): 服务端保存使用的文件名，默认取fileobj.name
+            content_type (str, optional): 文件类型，默认按文件名猜测
+            
+        返回:
+            APIResponse: API响应数据
+        """
+        return self._upload(fileobj, filename, content_type)
+
+    def upload_files(self, sources: Iterable[NamedUploadSource], max_concurrency: int = 8
+                     ) -> List[Union[APIResponse, Exception]]:
+        """
+        并发上传多个文件，所有上传共享客户端连接池，总耗时接近其中最大文件的上传时间。
+        单个文件失败不影响其他文件。
+        
+        参数:
+            sources: 文件路径、bytes/memoryview/mmap、二进制文件对象，或(filename, 数据源)元组
+            max_concurrency (int): 同时进行中的上传数上限
+            
+        返回:
+            与输入顺序一致的列表，每项为APIResponse或该文件上传失败的异常
+        """
+        results: Dict[int, Union[APIResponse, Exception]] = {}
+        uploads = bounded_map(lambda item: self._upload_source(item[1]), enumerate(sources),
+                              max_concurrency, thread_name_prefix="comfyone-upload")
+        for (index, _), result in uploads:
+            results[index] = result
+        return [results[index] for index in range(len(results))]
 
-    def prompt(self, payload: PromptPayload) -> APIResponse:
+    def _upload_source(self, source: NamedUploadSource) -> APIResponse:
+        """按数据源类型分派到upload_file、upload_bytes或upload_fileobj"""
+        filename = None
+        if isinstance(source, tuple):
+            filename, source = source
+        if isinstance(source, (str, os.PathLike)):
+            return self.upload_file(os.fspath(source), filename)
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            return self.upload_bytes(source, filename or "upload.bin")
+        return self.upload_fileobj(source, filename)
+
+    def _upload(self, source: UploadSource, filename: Optional[str] = None,
+                content_type: Optional[str] = None) -> APIResponse:
+        """上传数据源；启用上传缓存且可以计算内容哈希时经过缓存"""
+        def upload() -> APIResponse:
+            with MultipartStream(source, filename, content_type=content_type) as stream:
+                return self._request_limited("v1/files", stream, "POST")
+
+        key = self._upload_key(source)
+        if key is None:
+            return upload()
+        return self._cached_upload_response(self.upload_cache.get_or_upload(key(), lambda: upload().to_dict()))
+
+    def prompt(self, payload: Union[PromptPayload, bytes]) -> APIResponse:
         """
         向ComfyOne API发送prompt请求。
         
         参数:
-            payload: Prompt请求参数
+            payload: Prompt请求参数，或PromptTemplate.encode()生成的请求体
             
         返回:
             APIResponse: API响应数据
         """
-        return self._request_api("v1/prompts", payload.to_dict(), "POST")
+        body = payload if isinstance(payload, bytes) else payload.to_dict()
+        return self._request_limited("v1/prompts", body, "POST")
+
+    def prompt_many(self, payloads: Iterable[Union[PromptPayload, bytes]], max_concurrency: int = 8
+                    ) -> Iterator[Tuple[Union[PromptPayload, bytes], Union[APIResponse, Exception]]]:
+        """
+        并发提交多个prompt请求，所有请求共享客户端连接池。
+        建议max_concurrency不超过pool_maxsize，否则多出的连接无法复用。
+        
+        参数:
+            payloads: Prompt请求参数，可以是惰性的可迭代对象
+            max_concurrency (int): 同时进行中的请求数上限
+            
+        返回:
+            按完成顺序产出(payload, APIResponse或异常)的迭代器
+        """
+        return bounded_map(self.prompt, payloads, max_concurrency, thread_name_prefix="comfyone-prompt")
+
+    def submit(self, payload: Union[PromptPayload, bytes], on_progress: Optional[ProgressCallback] = None,
+               poll: bool = False) -> PromptFuture:
+        """
+        提交prompt并返回任务的future。
+        future由WebSocket事件完成，需要连接使用同一TaskRegistry的OneThingAIWebSocket
+        （ComfyOne.connect_websocket()会自动共享），可以用concurrent.futures.wait/as_completed等待大量任务。
+        
+        参数:
+            payload: Prompt请求参数，或PromptTemplate.encode()生成的请求体
+            on_progress (callable, optional): 进度回调，参数为pendding/progress事件
+            poll (bool): 同时由状态轮询器跟踪任务，用于没有WebSocket连接的情况
+            
+        返回:
+            PromptFuture: 成功时结果为finished事件，失败时抛出PromptFailedError
+        """
+        result = self.prompt(payload)
+        if result.code != 0:
+            raise APIError(result.code, result.msg)
+        task_id = task_id_from_response(result)
+        if poll:
+            return self.watch(task_id, on_progress)
+        return self.tasks.register(task_id, on_progress)
+
+    def watch(self, task_id: str, on_progress: Optional[ProgressCallback] = None) -> PromptFuture:
+        """
+        通过状态轮询器等待已提交的任务，所有任务共用一个后台轮询线程，同一任务重复调用返回同一个future
+        
+        参数:
+            task_id (str): 任务ID
+            on_progress (callable, optional): 进度回调
+            
+        返回:
+            PromptFuture: 与submit()返回的future相同
+        """
+        return self.poller.watch(task_id, on_progress)
 
     def get_prompt_status(self, prompt_id: str) -> APIResponse:
         """
@@ -258,49 +537,325 @@ class ComfyOneClient:
         """
         return self._request_api(f"v1/prompts/{prompt_id}/cancel", method="POST")
     
-    def download_file(self, url: str, save_path: str = None) -> str:
+    def download_file(self, url: str, save_path: str = None, max_connections: int = 4,
+                      segment_size: int = DEFAULT_SEGMENT_SIZE) -> str:
         """
         从ComfyOne服务器下载文件
+        服务端支持Range请求时，大文件被切分为多个分段并行下载，连接中断后从已写入的位置继续。
+        数据先写入临时文件，完成后原子重命名；失败时保留进度，再次调用会续传。
         
         参数:
             url (str): 文件下载URL
-            save_path (str, optional): 文件保存路径。如果为None，将保存在当前目录下，使用URL中的文件名
+            save_path (str, optional): 文件保存路径或目录。如果为None，将保存在当前目录下，使用URL中的文件名
+            max_connections (int): 并行下载使用的最大连接数
+            segment_size (int): 分段大小（字节）
             
         返回:
             str: 保存文件的完整路径
         """
-        try:
-            response = requests.get(url, headers=self.headers, stream=True)
-            response.raise_for_status()
-            
-            # If save_path is not provided, extract filename from URL or use default name
-            if save_path is None:
-                from urllib.parse import urlparse
-                from os.path import basename, splitext
-                parsed_url = urlparse(url)
-                url_filename = basename(parsed_url.path)
-                
-                # If URL doesn't have a filename or extension, use a default
-                if not url_filename or not splitext(url_filename)[1]:
-                    save_path = f"comfyone_download_{int(time.time())}.png"
-                else:
-                    save_path = url_filename
-            else:
-                save_path = os.path.join(save_path, url_filename)
-            
-            with open(save_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+        return self._download(url, resolve_save_path(url, save_path), max_connections, segment_size).path
+
+    def download_many(self, urls: Iterable[str], dest: Optional[str] = None,
+                      max_concurrency: int = 4) -> List[Union[str, Exception]]:
+        """
+        并发下载多个文件，所有下载共享客户端连接池，重复的URL只下载一次。
+        设置了download_cache时文件先写入内容缓存，再次请求同一URL不会访问网络。
+        
+        参数:
+            urls: 文件下载URL
+            dest (str, optional): 保存目录。为None时启用缓存则直接返回缓存中的路径，否则保存到当前目录
+            max_concurrency (int): 同时下载的文件数上限
             
+        返回:
+            与输入顺序一致的列表，每项为保存文件的路径或该文件下载失败的异常
+        """
+        urls = list(urls)
+        if dest is not None:
+            os.makedirs(dest, exist_ok=True)
+        results = dict(bounded_map(lambda url: self._download_one(url, dest), dict.fromkeys(urls),
+                                   max_concurrency, thread_name_prefix="comfyone-download"))
+        return [results[url] for url in urls]
+
+    def _download_one(self, url: str, dest: Optional[str]) -> str:
+        """download_many的单个文件：优先使用本地缓存，未命中时下载到缓存再放到目标目录"""
+        cache = self.download_cache
+        if cache is None:
+            return self.download_file(url, dest)
+
+        def download(staging_path: str) -> Tuple[str, Optional[str]]:
+            state = self._download(url, staging_path)
+            return state.path, state.validator
+
+        return self._place_download(url, cache.get_or_download(url, download), dest)
+
+    def _download(self, url: str, save_path: str, max_connections: int = 4,
+                  segment_size: int = DEFAULT_SEGMENT_SIZE) -> DownloadState:
+        """下载文件到save_path，返回完成后的下载状态（包含远端的ETag/Last-Modified）"""
+        state = DownloadState(save_path, self.logger)
+        try:
+            if not (state.load(url) and self._resume_download(url, state, max_connections)):
+                self._start_download(url, state, max_connections, segment_size)
+            state.commit()
             self.logger.debug(f"File downloaded successfully to: {save_path}")
-            return save_path
+            return state
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+            state.save()
             self.logger.error(f"Error downloading file: {str(e)}")
-            raise ConnectionError(f"Failed to download file: {str(e)}")
+            raise ConnectionError(503, f"Failed to download file: {str(e)}")
         except IOError as e:
+            state.save()
             self.logger.error(f"Error saving file: {str(e)}")
             raise IOError(f"Failed to save file: {str(e)}")
+
+    def download_to_buffer(self, url: str, buffer: Optional[Union[bytearray, memoryview]] = None) -> memoryview:
+        """
+        把文件直接下载到内存，不经过磁盘。数据通过readinto写入缓冲区，
+        连接中断且服务端支持Range时从已读取的位置继续。
+        
+        参数:
+            url (str): 文件下载URL
+            buffer (bytearray/memoryview, optional): 预分配的可写缓冲区，None时按Content-Length分配
+            
+        返回:
+            memoryview: 缓冲区中已写入数据的部分
+        """
+        data: Union[bytearray, memoryview] = buffer
+        growable = False
+        position = 0
+        validator = None
+        retry = self.retry_policy.start()
+        try:
+            while True:
+                try:
+                    with self._open_download(url, position, validator) as response:
+                        if position == 0:
+                            validator = range_validator(response.headers)
+                            data, growable = prepare_buffer(buffer, response.headers.get("Content-Length"))
+                        sizer = ChunkSizer()
+                        while True:
+                            capacity = memoryview(data).nbytes
+                            if position == capacity:
+                                if growable:
+                                    data.extend(bytes(max(capacity, sizer.size)))
+                                    continue
+                                if response.raw.read(1):
+                                    raise ValueError(f"Buffer too small: {capacity} bytes")
+                                break
+                            started = time.monotonic()
+                            with memoryview(data) as view, view.cast("B") as flat, \
+                                    flat[position:position + sizer.size] as target:
+                                count = response.raw.readinto(target)
+                            if not count:
+                                break
+                            sizer.record(count, time.monotonic() - started)
+                            position += count
+                    if growable:
+                        del data[position:]
+                    return memoryview(data).cast("B")[:position]
+                except _RETRYABLE_DOWNLOAD_ERRORS as e:
+                    delay = self._download_retry_delay(retry, e)
+                    if delay is None or (position and not validator):
+                        raise
+                    self.logger.warning(f"Download interrupted at {position} bytes, retry in {delay:.2f}s: {str(e)}")
+                    time.sleep(delay)
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+            self.logger.error(f"Error downloading file: {str(e)}")
+            raise ConnectionError(503, f"Failed to download file: {str(e)}")
+
+    def iter_download(self, url: str, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+        """
+        以数据块的形式下载文件，适合直接传给解码器或再次上传。
+        连接中断且服务端支持Range时从已产出的位置继续，调用方不会收到重复数据。
+        
+        参数:
+            url (str): 文件下载URL
+            chunk_size (int, optional): 固定的块大小，None表示按吞吐量自适应
+            
+        返回:
+            产出bytes数据块的迭代器
+        """
+        position = 0
+        validator = None
+        retry = self.retry_policy.start()
+        try:
+            while True:
+                try:
+                    with self._open_download(url, position, validator) as response:
+                        if position == 0:
+                            validator = range_validator(response.headers)
+                        sizer = ChunkSizer()
+                        while True:
+                            started = time.monotonic()
+                            chunk = response.raw.read(chunk_size or sizer.size, decode_content=True)
+                            if not chunk:
+                                return
+                            sizer.record(len(chunk), time.monotonic() - started)
+                            position += len(chunk)
+                            yield chunk
+                except _RETRYABLE_DOWNLOAD_ERRORS as e:
+                    delay = self._download_retry_delay(retry, e)
+                    if delay is None or (position and not validator):
+                        raise
+                    self.logger.warning(f"Download interrupted at {position} bytes, retry in {delay:.2f}s: {str(e)}")
+                    time.sleep(delay)
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+            self.logger.error(f"Error downloading file: {str(e)}")
+            raise ConnectionError(503, f"Failed to download file: {str(e)}")
+
+    def _open_download(self, url: str, position: int, validator: Optional[str]) -> requests.Response:
+        """从position开始读取文件；续传时服务端必须返回206，否则说明不支持Range或文件已变化"""
+        if position == 0:
+            return self._download_request(url)
+        response = self._download_request(url, f"bytes={position}-", validator)
+        if response.status_code != 206:
+            response.close()
+            raise IOError(f"Cannot resume download of {url}: server ignored the Range request")
+        return response
+
+    def _download_request(self, url: str, byte_range: Optional[str] = None,
+                          validator: Optional[str] = None) -> requests.Response:
+        """发送流式下载请求；禁用内容编码，保证Range的字节偏移与文件一致"""
+        if self.rate_limiter:
+            self.rate_limiter.acquire(RateLimiter.FILE)
+        headers = {**self.headers, "Accept-Encoding": "identity"}
+        if byte_range:
+            headers["Range"] = byte_range
+            if validator:
+                headers["If-Range"] = validator
+        response = self.transport.get(url, headers=headers, stream=True, timeout=self.timeout)
+        if response.status_code >= 400 and response.status_code != 416:
+            response.close()
+            response.raise_for_status()
+        return response
+
+    def _start_download(self, url: str, state: DownloadState, max_connections: int, segment_size: int) -> None:
+        """首次下载：第一个请求同时探测Range支持并下载第一个分段"""
+        response = self._download_request(url, f"bytes=0-{segment_size - 1}")
+        content_range = parse_content_range(response.headers.get("Content-Range"))
+        if response.status_code != 206 or content_range is None or content_range[2] is None:
+            self._download_whole(url, state, response)
+            return
+        state.plan(url, content_range[2], range_validator(response.headers), segment_size)
+        self._download_segments(url, state, max_connections, response)
+
+    def _resume_download(self, url: str, state: DownloadState, max_connections: int) -> bool:
+        """续传未完成的下载；远端文件已变化时丢弃旧进度并返回False"""
+        pending = state.incomplete()
+        if not pending:
+            return True
+        response = self._download_request(url, pending[0].range_header(), state.validator)
+        if response.status_code != 206:
+            response.close()
+            self.logger.info(f"Remote file changed, restarting download: {url}")
+            state.discard()
+            return False
+        self.logger.debug(f"Resuming download of {sum(s.remaining for s in pending)} bytes: {url}")
+        self._download_segments(url, state, max_connections, response)
+        return True
+
+    def _download_whole(self, url: str, state: DownloadState, response: Optional[requests.Response]) -> None:
+        """服务端不支持Range时使用单个连接下载，中断后只能从头开始"""
+        if response is not None and response.status_code != 200:
+            response.close()
+            response = None
+        retry = self.retry_policy.start()
+        while True:
+            try:
+                if response is None:
+                    response = self._download_request(url)
+                state.validator = range_validator(response.headers)
+                with response, open(state.part_path, "wb") as f:
+                    self._copy_body(response, f)
+                return
+            except _RETRYABLE_DOWNLOAD_ERRORS as e:
+                response = None
+                delay = self._download_retry_delay(retry, e)
+                if delay is None:
+                    raise
+                self.logger.warning(f"Download interrupted, restarting in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+
+    def _download_segments(self, url: str, state: DownloadState, max_connections: int,
+                           first_response: requests.Response) -> None:
+        """并行下载所有未完成的分段，first_response为第一个未完成分段已发出的请求"""
+        pending = state.incomplete()
+        if not pending:
+            # 空文件或所有分段都已完成：读完第一个响应（至多一个分段）再关闭，连接才会归还连接池
+            with first_response:
+                first_response.content
+            return
+        workers = max(1, min(max_connections, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="comfyone-download") as executor:
+            futures = [
+                executor.submit(self._download_segment, url, state, segment, first_response if i == 0 else None)
+                for i, segment in enumerate(pending)
+            ]
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            errors = [future.exception() for future in done if future.exception() is not None]
+            if errors:
+                # 其余分段尽快停止，已写入的进度由download_file保存
+                state.aborted.set()
+                for future in not_done:
+                    future.cancel()
+                raise errors[0]
+
+    def _download_segment(self, url: str, state: DownloadState, segment: Segment,
+                          response: Optional[requests.Response] = None) -> None:
+        """下载一个分段，连接中断时从该分段已写入的位置继续"""
+        retry = self.retry_policy.start()
+        while not state.aborted.is_set():
+            try:
+                if response is None:
+                    response = self._download_request(url, segment.range_header(), state.validator)
+                    if response.status_code != 206:
+                        response.close()
+                        raise IOError(f"Remote file changed during download: {url}")
+                with response, open(state.part_path, "r+b") as f:
+                    f.seek(segment.position)
+                    self._copy_body(response, f, segment, state.aborted)
+                if segment.done:
+                    state.save()
+                return
+            except _RETRYABLE_DOWNLOAD_ERRORS as e:
+                response = None
+                delay = self._download_retry_delay(retry, e)
+                if delay is None or state.aborted.is_set():
+                    raise
+                self.logger.warning(
+                    f"Download of {segment.range_header()} interrupted, retry {retry.attempts}/"
+                    f"{self.retry_policy.max_attempts} in {delay:.2f}s: {str(e)}"
+                )
+                time.sleep(delay)
+        if response is not None:
+            response.close()
+
+    @staticmethod
+    def _copy_body(response: requests.Response, f: BinaryIO, segment: Optional[Segment] = None,
+                   aborted: Optional[threading.Event] = None) -> None:
+        """以自适应块大小把响应体写入文件；指定segment时只写入该分段剩余的字节"""
+        sizer = ChunkSizer()
+        while segment is None or not segment.done:
+            if aborted is not None and aborted.is_set():
+                return
+            started = time.monotonic()
+            size = sizer.size if segment is None else min(sizer.size, segment.remaining)
+            chunk = response.raw.read(size, decode_content=True)
+            if not chunk:
+                if segment is not None:
+                    raise requests.exceptions.ChunkedEncodingError("Connection closed before the range completed")
+                return
+            f.write(chunk)
+            if segment is not None:
+                segment.written += len(chunk)
+            sizer.record(len(chunk), time.monotonic() - started)
+
+    @staticmethod
+    def _download_retry_delay(retry: RetryState, error: Exception) -> Optional[float]:
+        """下载中断或收到可重试的HTTP状态时返回重试等待时间"""
+        response = getattr(error, "response", None)
+        if response is None:
+            return retry.next_delay()
+        return retry.next_delay(response.status_code, "GET", response.headers)
     
     # TODO: 添加prompt历史记录的API
\ No newline at end of file
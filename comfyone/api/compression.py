@@ -0,0 +1,62 @@
+import gzip
+import io
+from typing import Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# 小于该大小的请求体压缩收益很小，不压缩
+DEFAULT_MIN_SIZE = 1024
+
+
+class GzipCompressor:
+    """
+    gzip请求体压缩
+    name作为Content-Encoding请求头的值，自定义压缩器只需实现相同的name和compress接口。
+    """
+    name = "gzip"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # mtime固定为0，相同内容总是得到相同的压缩结果
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=self.level, mtime=0) as f:
+            f.write(data)
+        return buffer.getvalue()
+
+
+class ZstdCompressor:
+    """zstd请求体压缩，压缩率与gzip相当或更高，速度快数倍"""
+    name = "zstd"
+
+    def __init__(self, level: int = 3):
+        if zstandard is None:
+            raise ImportError("ZstdCompressor requires zstandard, install it with: pip install comfyone-sdk[zstd]")
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # ZstdCompressor实例不能在线程间共享，每次压缩单独创建
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+
+Compressor = Union[GzipCompressor, ZstdCompressor]
+
+
+def get_compressor(compression: Union[str, Compressor, None]) -> Optional[Compressor]:
+    """
+    获取请求体压缩器
+
+    参数:
+        compression: "gzip"、"zstd"、压缩器实例，None表示不压缩
+    """
+    if compression is None or not isinstance(compression, str):
+        return compression
+    if compression == "gzip":
+        return GzipCompressor()
+    if compression == "zstd":
+        return ZstdCompressor()
+    raise ValueError(f"Unknown request compression: {compression}")
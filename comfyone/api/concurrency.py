@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+from .exceptions import APIError
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD自适应并发控制器
+    延迟与错误率正常时，每完成约limit个请求并发上限加increase（加性增）；
+    遇到429、超时或延迟突增时并发上限乘以decrease_factor（乘性减），
+    同一个冷却周期内的多次过载只会下调一次。
+    """
+    OVERLOAD_CODES = frozenset({408, 429, 503})
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 256,
+                 increase: float = 1.0, decrease_factor: float = 0.5,
+                 latency_tolerance: float = 2.0, min_samples: int = 10,
+                 decrease_cooldown: Optional[float] = None):
+        """
+        参数:
+            initial_limit (int): 初始并发上限
+            min_limit/max_limit (int): 并发上限的取值范围
+            increase (float): 每个窗口增加的并发数
+            decrease_factor (float): 过载时并发上限的缩放系数
+            latency_tolerance (float): 延迟超过基线的该倍数时视为延迟突增
+            min_samples (int): 建立延迟基线所需的最少样本数
+            decrease_cooldown (float, optional): 两次下调之间的最小间隔，默认为延迟基线
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.min_samples = min_samples
+        self.decrease_cooldown = decrease_cooldown
+
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._baseline: Optional[float] = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._overloads = 0
+        self._cond = threading.Condition()
+        self._async_waiters = deque()
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """当前进行中的请求数"""
+        return self._in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        """并发控制器的指标快照"""
+        with self._cond:
+            return {
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "latency_baseline": self._baseline,
+                "overloads": self._overloads,
+            }
+
+    @classmethod
+    def is_overload(cls, error: Exception) -> bool:
+        """判断异常是否表示服务端过载（429、超时、服务不可用）"""
+        return isinstance(error, APIError) and error.code in cls.OVERLOAD_CODES
+
+    def _try_acquire(self) -> bool:
+        if self._in_flight < int(self._limit):
+            self._in_flight += 1
+            return True
+        return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """阻塞直到获得并发名额，超时返回False"""
+        with self._cond:
+            return self._cond.wait_for(self._try_acquire, timeout)
+
+    async def acquire_async(self) -> None:
+        """acquire的协程版本，等待期间不阻塞事件循环"""
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+                future = asyncio.get_running_loop().create_future()
+                self._async_waiters.append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                # 被取消时把唤醒机会转交给其他等待者
+                with self._cond:
+                    self._wake_one()
+                raise
+
+    def _wake_one(self) -> None:
+        self._cond.notify()
+        while self._async_waiters:
+            future = self._async_waiters.popleft()
+            if not future.done():
+                future.get_loop().call_soon_threadsafe(self._resolve, future)
+                break
+
+    @staticmethod
+    def _resolve(future: "asyncio.Future") -> None:
+        if not future.done():
+            future.set_result(None)
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False) -> None:
+        """
+        释放并发名额并根据结果调整上限
+
+        参数:
+            latency (float, optional): 请求耗时，None表示结果不参与调整（例如参数错误）
+            overloaded (bool): 请求是否因服务端过载失败
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._in_flight -= 1
+            old_limit = int(self._limit)
+            if overloaded or (latency is not None and self._is_latency_spike(latency)):
+                self._decrease(now)
+            elif latency is not None:
+                self._record_latency(latency)
+                self._limit = min(self.max_limit, self._limit + self.increase / max(self._limit, 1.0))
+            for _ in range(max(1, int(self._limit) - old_limit)):
+                self._wake_one()
+
+    def _is_latency_spike(self, latency: float) -> bool:
+        return (self._baseline is not None and self._samples >= self.min_samples
+                and latency > self._baseline * self.latency_tolerance)
+
+    def _record_latency(self, latency: float) -> None:
+        self._samples += 1
+        if self._baseline is None:
+            self._baseline = latency
+        else:
+            self._baseline += 0.1 * (latency - self._baseline)
+
+    def _decrease(self, now: float) -> None:
+        self._overloads += 1
+        cooldown = self.decrease_cooldown if self.decrease_cooldown is not None else (self._baseline or 0.0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import logging
+from dataclasses import dataclass, asdict
+from typing import List, Mapping, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+def url_extension(url: str) -> str:
+    """URL路径中的扩展名，路径没有扩展名时取查询参数filename的扩展名（ComfyUI的/view?filename=...）"""
+    parsed = urlparse(url)
+    extension = os.path.splitext(parsed.path)[1]
+    if not extension:
+        filename = parse_qs(parsed.query).get("filename")
+        if filename:
+            extension = os.path.splitext(os.path.basename(filename[0]))[1]
+    return extension
+
+
+def resolve_save_path(url: str, save_path: Optional[str] = None) -> str:
+    """
+    确定下载文件的保存路径：save_path为None时保存到当前目录，为目录时使用URL中的文件名，
+    否则视为完整的文件路径。URL路径中没有带扩展名的文件名时，按URL的哈希生成文件名，
+    不同URL并发下载时不会写入同一个文件。
+    """
+    url_filename = os.path.basename(urlparse(url).path)
+    if not url_filename or not os.path.splitext(url_filename)[1]:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        url_filename = f"comfyone_download_{digest}{url_extension(url) or '.png'}"
+    if save_path is None:
+        return url_filename
+    if os.path.isdir(save_path):
+        return os.path.join(save_path, url_filename)
+    return save_path
+
+
+def parse_content_range(value: Optional[str]) -> Optional[Tuple[int, int, Optional[int]]]:
+    """解析Content-Range响应头，返回(start, end, total)，total未知时为None"""
+    match = _CONTENT_RANGE.match(value or "")
+    if match is None:
+        return None
+    start, end, total = match.groups()
+    return int(start), int(end), None if total == "*" else int(total)
+
+
+def range_validator(headers: Mapping[str, str]) -> Optional[str]:
+    """用于If-Range的校验值：强ETag，其次Last-Modified"""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def prepare_buffer(buffer: Optional[Union[bytearray, memoryview]], content_length: Optional[str]
+                   ) -> Tuple[Union[bytearray, memoryview], bool]:
+    """
+    为download_to_buffer准备缓冲区，返回(缓冲区, 是否可扩容)。
+    未提供缓冲区时按Content-Length预分配，长度未知时使用可扩容的bytearray；提供了缓冲区时检查其大小。
+    """
+    length = int(content_length) if content_length is not None else None
+    if buffer is None:
+        return (bytearray(length), False) if length is not None else (bytearray(), True)
+    size = memoryview(buffer).nbytes
+    if length is not None and length > size:
+        raise ValueError(f"Buffer too small: {size} bytes, {length} needed")
+    return buffer, False
+
+
+class ChunkSizer:
+    """
+    自适应读取块大小
+    读取很快时块大小加倍以减少系统调用和Python循环开销，读取变慢时减半，以便中断时丢失的数据更少。
+    """
+    def __init__(self, initial: int = MIN_CHUNK_SIZE, minimum: int = MIN_CHUNK_SIZE,
+                 maximum: int = MAX_CHUNK_SIZE, target: float = 0.05):
+        """
+        参数:
+            initial (int): 初始块大小
+            minimum/maximum (int): 块大小的取值范围
+            target (float): 期望的单次读取耗时（秒）
+        """
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+
+    def record(self, nbytes: int, elapsed: float) -> None:
+        """记录一次读取的字节数和耗时，并调整块大小"""
+        if elapsed > self.target * 2:
+            self.size = max(self.minimum, self.size // 2)
+        elif nbytes >= self.size and elapsed < self.target / 2:
+            self.size = min(self.maximum, self.size * 2)
+
+
+@dataclass
+class Segment:
+    """文件的一个字节区间[start, end]，written为已写入的字节数"""
+    start: int
+    end: int
+    written: int = 0
+
+    @property
+    def position(self) -> int:
+        """下一个待写入字节的偏移"""
+        return self.start + self.written
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.position + 1
+
+    @property
+    def done(self) -> bool:
+        return self.remaining <= 0
+
+    def range_header(self) -> str:
+        return f"bytes={self.position}-{self.end}"
+
+
+class DownloadState:
+    """
+    断点续传状态
+    数据写入<path>.part临时文件，分段进度保存在<path>.part.json中，
+    再次下载同一URL且远端文件未变化时只请求未完成的字节；全部完成后原子重命名为最终文件。
+    """
+    def __init__(self, path: str, logger: Optional[logging.Logger] = None):
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.meta_path = f"{self.part_path}.json"
+        self.logger = logger or logging.getLogger(__name__)
+        self.url: Optional[str] = None
+        self.validator: Optional[str] = None
+        self.total: Optional[int] = None
+        self.segments: List[Segment] = []
+        self.aborted = threading.Event()
+        self._lock = threading.Lock()
+
+    def load(self, url: str) -> bool:
+        """加载同一URL未完成的下载，返回是否可以续传"""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["url"] != url or not meta["validator"] or os.path.getsize(self.part_path) != meta["total"]:
+                return False
+            segments = [Segment(**s) for s in meta["segments"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self.url, self.validator, self.total = url, meta["validator"], meta["total"]
+        self.segments = segments
+        return True
+
+    def plan(self, url: str, total: int, validator: Optional[str], segment_size: int) -> None:
+        """按segment_size切分文件并预分配临时文件"""
+        self.url, self.validator, self.total = url, validator, total
+        segment_size = max(1, segment_size)
+        self.segments = [
+            Segment(start, min(start + segment_size, total) - 1) for start in range(0, total, segment_size)
+        ]
+        with open(self.part_path, "wb") as f:
+            f.truncate(total)
+
+    def incomplete(self) -> List[Segment]:
+        return [segment for segment in self.segments if not segment.done]
+
+    def save(self) -> None:
+        """保存分段进度，远端不提供校验值时无法安全续传，不保存"""
+        if not self.validator or not self.segments:
+            return
+        with self._lock:
+            meta = {
+                "url": self.url,
+                "validator": self.validator,
+                "total": self.total,
+                "segments": [asdict(segment) for segment in self.segments],
+            }
+            tmp_path = f"{self.meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                os.replace(tmp_path, self.meta_path)
+            except OSError as e:
+                self.logger.warning(f"Failed to write download state {self.meta_path}: {e}")
+
+    def commit(self) -> None:
+        """下载完成，原子重命名临时文件并删除进度文件"""
+        os.replace(self.part_path, self.path)
+        self._remove(self.meta_path)
+
+    def discard(self) -> None:
+        """删除临时文件和进度文件"""
+        self.segments = []
+        self._remove(self.part_path)
+        self._remove(self.meta_path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
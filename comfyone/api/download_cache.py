@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from .download import url_extension
+
+INDEX_FILE = "index.json"
+
+
+def copy_from_cache(source: str, target: str) -> str:
+    """
+    把缓存文件复制到目标路径。不使用硬链接，调用方修改目标文件不会影响缓存；
+    先写入临时文件再替换，目标路径上不会出现写了一半的文件
+    """
+    if os.path.abspath(source) == os.path.abspath(target):
+        return target
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return target
+
+
+class DownloadCache:
+    """
+    下载文件的本地内容缓存
+    文件以URL和ETag（或Last-Modified）的哈希命名保存在缓存目录中，再次请求同一URL时直接返回本地文件而不访问网络；
+    缓存总大小超过max_bytes时按最近最少使用的顺序删除文件；
+    多个线程同时下载同一URL时只进行一次传输，其余调用方等待并共享结果。
+    缓存文件是只读的，放到目标目录时总是复制，不会把缓存持有的文件交给调用方修改。
+    """
+    def __init__(self, path: str, max_bytes: int = 2 * 1024 ** 3, logger: Optional[logging.Logger] = None):
+        """
+        参数:
+            path (str): 缓存目录
+            max_bytes (int): 缓存文件的总大小上限（字节）
+        """
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        os.makedirs(self.path, exist_ok=True)
+        # url -> {"file", "validator", "size", "last_used"}，按最近使用排序
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = self._load()
+
+    @property
+    def total_bytes(self) -> int:
+        """缓存文件的总大小"""
+        with self._lock:
+            return sum(entry["size"] for entry in self._entries.values())
+
+    def get(self, url: str) -> Optional[str]:
+        """查询URL对应的本地文件，未命中或文件已被删除时返回None"""
+        with self._lock:
+            return self._lookup(url)
+
+    def staging_path(self, url: str) -> str:
+        """下载过程中使用的临时路径，下载完成后通过put移入缓存"""
+        staging = os.path.join(self.path, "staging")
+        os.makedirs(staging, exist_ok=True)
+        return os.path.join(staging, hashlib.sha256(url.encode("utf-8")).hexdigest() + self._extension(url))
+
+    def put(self, url: str, file_path: str, validator: Optional[str] = None) -> str:
+        """把已下载的文件移入缓存并返回缓存中的路径，必要时淘汰最近最少使用的文件"""
+        key = hashlib.sha256(f"{url}\0{validator or ''}".encode("utf-8")).hexdigest()
+        name = key + self._extension(url)
+        cached_path = os.path.join(self.path, name)
+        os.chmod(file_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(file_path, cached_path)
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous is not None and previous["file"] != name:
+                self._remove(previous["file"])
+            self._entries[url] = {
+                "file": name,
+                "validator": validator,
+                "size": os.path.getsize(cached_path),
+                "last_used": time.time(),
+            }
+            self._evict(keep=url)
+            self._save()
+        return cached_path
+
+    def claim(self, url: str) -> Tuple[Optional[str], Optional[Future]]:
+        """
+        查询缓存并在未命中时认领下载，两步在同一把锁内完成，
+        不会出现另一个调用方刚resolve完、本调用方又重新下载的情况。
+
+        返回:
+            (缓存路径, None): 命中缓存
+            (None, Future): 其他调用方正在下载，等待该Future得到缓存路径
+            (None, None): 由调用方负责下载，完成后必须调用resolve或reject；其余调用方不能使用同一个staging_path
+        """
+        with self._lock:
+            cached_path = self._lookup(url)
+            if cached_path is not None:
+                return cached_path, None
+            future = self._in_flight.get(url)
+            if future is not None:
+                return None, future
+            self._in_flight[url] = Future()
+            return None, None
+
+    def resolve(self, url: str, cached_path: str) -> None:
+        """下载完成并已通过put移入缓存，唤醒等待者"""
+        with self._lock:
+            future = self._in_flight.pop(url, None)
+        if future is not None:
+            future.set_result(cached_path)
+
+    def reject(self, url: str, error: BaseException) -> None:
+        """下载失败，把异常传递给等待者"""
+        with self._lock:
+            future = self._in_flight.pop(url, None)
+        if future is not None:
+            future.set_exception(error)
+
+    def get_or_download(self, url: str, download: Callable[[str], Tuple[str, Optional[str]]]) -> str:
+        """
+        命中缓存直接返回；否则下载（并发的相同下载合并为一次）并移入缓存
+
+        参数:
+            url (str): 文件URL
+            download (callable): 接收staging_path，下载完成后返回(文件路径, ETag/Last-Modified)
+        """
+        cached_path, future = self.claim(url)
+        if cached_path is not None:
+            self.logger.debug(f"Download cache hit: {url}")
+            return cached_path
+        if future is not None:
+            return future.result()
+        try:
+            cached_path = self.put(url, *download(self.staging_path(url)))
+        except BaseException as e:
+            self.reject(url, e)
+            raise
+        self.resolve(url, cached_path)
+        return cached_path
+
+    async def get_or_download_async(self, url: str,
+                                    download: Callable[[str], Awaitable[Tuple[str, Optional[str]]]]) -> str:
+        """get_or_download的协程版本，等待其他调用方的下载时不阻塞事件循环"""
+        cached_path, future = self.claim(url)
+        if cached_path is not None:
+            self.logger.debug(f"Download cache hit: {url}")
+            return cached_path
+        if future is not None:
+            return await asyncio.wrap_future(future)
+        try:
+            cached_path = self.put(url, *(await download(self.staging_path(url))))
+        except BaseException as e:
+            self.reject(url, e)
+            raise
+        self.resolve(url, cached_path)
+        return cached_path
+
+    def clear(self) -> None:
+        """删除所有缓存文件"""
+        with self._lock:
+            for entry in self._entries.values():
+                self._remove(entry["file"])
+            self._entries.clear()
+            self._save()
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _extension(url: str) -> str:
+        return url_extension(url)
+
+    def _lookup(self, url: str) -> Optional[str]:
+        """get的实现，调用方须持有self._lock"""
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        file_path = os.path.join(self.path, entry["file"])
+        if not os.path.isfile(file_path):
+            del self._entries[url]
+            self._save()
+            return None
+        # 命中只更新内存中的使用顺序，索引在下次写入时一并保存
+        entry["last_used"] = time.time()
+        self._entries.move_to_end(url)
+        return file_path
+
+    def _evict(self, keep: str) -> None:
+        total = sum(entry["size"] for entry in self._entries.values())
+        for url in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if url == keep:
+                continue
+            entry = self._entries.pop(url)
+            self._remove(entry["file"])
+            total -= entry["size"]
+            self.logger.debug(f"Evicted cached download {url} ({entry['size']} bytes)")
+
+    def _remove(self, name: str) -> None:
+        path = os.path.join(self.path, name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except PermissionError:
+            # Windows不允许删除只读文件
+            os.chmod(path, stat.S_IWUSR | stat.S_IRUSR)
+            os.remove(path)
+
+    def _load(self) -> "OrderedDict[str, Dict[str, Any]]":
+        try:
+            with open(os.path.join(self.path, INDEX_FILE), "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return OrderedDict()
+        except (ValueError, OSError) as e:
+            self.logger.warning(f"Ignoring unreadable download cache index in {self.path}: {e}")
+            return OrderedDict()
+        return OrderedDict(sorted(entries.items(), key=lambda item: item[1]["last_used"]))
+
+    def _save(self) -> None:
+        index_path = os.path.join(self.path, INDEX_FILE)
+        tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            self.logger.warning(f"Failed to write download cache index in {self.path}: {e}")
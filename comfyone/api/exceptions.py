@@ -20,4 +20,11 @@ class AuthenticationError(APIError):
 
 class ConnectionError(APIError):
     """Connection related errors"""
-    pass 
\ No newline at end of file
+    pass 
+
+class PromptFailedError(ComfyOneError):
+    """Prompt execution failed on the server"""
+    def __init__(self, task_id: str, message: str, event: dict = None):
+        super().__init__(message, {"task_id": task_id})
+        self.task_id = task_id
+        self.event = event or {}
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+from .exceptions import PromptFailedError
+from .models import APIResponse
+
+# 任务排队和执行中的进度事件（服务端消息类型为pendding）
+PROGRESS_EVENTS = frozenset({"pendding", "pending", "progress"})
+# 任务结束事件，收到后future完成并从注册表移除
+TERMINAL_EVENTS = frozenset({"finished", "error"})
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+def task_id_from_response(response: APIResponse) -> str:
+    """从prompt响应中取出任务ID"""
+    for key in ("taskId", "task_id", "id"):
+        task_id = response.get(key)
+        if task_id:
+            return str(task_id)
+    raise ValueError(f"Prompt response has no task id: {response.data}")
+
+
+class PromptFuture(Future):
+    """
+    prompt任务的执行结果
+    任务成功结束时结果为finished事件，失败时抛出PromptFailedError。
+    可以直接用于concurrent.futures.wait/as_completed，在协程中也可以直接await。
+    cancel()只停止本地跟踪（从TaskRegistry移除，状态轮询器不再查询），不会取消服务端任务；
+    需要停止服务端执行时调用client.cancel_prompt(task_id)。
+    """
+    def __init__(self, task_id: str, logger: Optional[logging.Logger] = None):
+        super().__init__()
+        self.task_id = task_id
+        self.logger = logger or logging.getLogger(__name__)
+        # 最近一次收到的进度事件
+        self.last_event: Optional[Dict[str, Any]] = None
+        self._progress_callbacks: List[ProgressCallback] = []
+
+    def add_progress_callback(self, fn: ProgressCallback) -> None:
+        """添加进度回调，每个pendding/progress事件调用一次，回调在分发事件的线程中执行"""
+        self._progress_callbacks.append(fn)
+
+    def _progress(self, event: Dict[str, Any]) -> None:
+        self.last_event = event
+        for fn in self._progress_callbacks:
+            try:
+                fn(event)
+            except Exception:
+                self.logger.exception(f"Progress callback raised for task {self.task_id}")
+
+    def _finish(self, event: Dict[str, Any]) -> None:
+        # 调用方已取消时不再设置结果
+        if self.done() or not self.set_running_or_notify_cancel():
+            return
+        self.last_event = event
+        data = event.get("data") or {}
+        if event.get("type") == "finished" and data.get("success", True):
+            self.set_result(event)
+        else:
+            message = data.get("message") or data.get("msg") or "Prompt execution failed"
+            self.set_exception(PromptFailedError(self.task_id, message, event))
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
+    def __repr__(self) -> str:
+        return f"<PromptFuture task_id={self.task_id!r} state={self._state}>"
+
+
+class TaskRegistry:
+    """
+    taskId -> PromptFuture的注册表
+    WebSocket客户端把收到的每个事件交给dispatch，按taskId O(1)找到对应的future。
+    同一taskId只对应一个future；结束事件先于register到达时（prompt响应返回前任务已完成）
+    会暂存最近max_early个，register时直接完成。被调用方取消的future通过done回调自动移除。
+    """
+    def __init__(self, max_early: int = 1024, logger: Optional[logging.Logger] = None):
+        self.max_early = max_early
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._futures: Dict[str, PromptFuture] = {}
+        self._early: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def register(self, task_id: str, on_progress: Optional[ProgressCallback] = None) -> PromptFuture:
+        """
+        获取任务的future，已注册时返回同一个future
+
+        参数:
+            task_id (str): 任务ID
+            on_progress (callable, optional): 进度回调
+        """
+        with self._lock:
+            future = self._futures.get(task_id)
+            if future is None:
+                future = PromptFuture(task_id, self.logger)
+                early = self._early.pop(task_id, None)
+                if early is None:
+                    self._futures[task_id] = future
+                    future.add_done_callback(self._unregister)
+            else:
+                early = None
+        if on_progress is not None:
+            future.add_progress_callback(on_progress)
+        if early is not None:
+            future._finish(early)
+        return future
+
+    def get(self, task_id: str) -> Optional[PromptFuture]:
+        """查询未完成任务的future"""
+        return self._futures.get(task_id)
+
+    def discard(self, task_id: str) -> None:
+        """不再跟踪任务，future保持当前状态"""
+        with self._lock:
+            self._futures.pop(task_id, None)
+
+    def _unregister(self, future: PromptFuture) -> None:
+        """future结束（包括被取消）时移除，已被同一taskId的新future替换时保留"""
+        with self._lock:
+            if self._futures.get(future.task_id) is future:
+                del self._futures[future.task_id]
+
+    def dispatch(self, event: Dict[str, Any]) -> bool:
+        """
+        分发一个WebSocket事件
+
+        返回:
+            bool: 事件是否属于已注册的任务
+        """
+        task_id = event.get("taskId")
+        event_type = event.get("type")
+        if task_id is None:
+            return False
+        if event_type in TERMINAL_EVENTS:
+            with self._lock:
+                future = self._futures.pop(task_id, None)
+                if future is None:
+                    self._early[task_id] = event
+                    while len(self._early) > self.max_early:
+                        self._early.popitem(last=False)
+                    return False
+            future._finish(event)
+            return True
+        if event_type in PROGRESS_EVENTS:
+            future = self._futures.get(task_id)
+            if future is not None:
+                future._progress(event)
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._futures)
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._futures
@@ -0,0 +1,48 @@
+from typing import Any, Dict, List
+
+# JSON Patch（RFC 6902）请求体的Content-Type
+CONTENT_TYPE = "application/json-patch+json"
+# 服务端不支持JSON Patch的状态码
+UNSUPPORTED_STATUS = (405, 415, 501)
+# 补丁被拒绝（格式错误、If-Match对应的版本已变化等）时改为发送完整文档的状态码
+FALLBACK_STATUS = (400, 409, 412, 422) + UNSUPPORTED_STATUS
+
+
+def _escape(token: str) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """
+    生成把old变为new的JSON Patch操作列表
+    字典逐键比较并递归进入两边都是字典或等长列表的值；长度变化的列表整体替换，
+    ComfyUI工作流中的列表（节点连接等）很短，整体替换比逐元素操作更紧凑。
+
+    参数:
+        old: 原文档
+        new: 新文档
+        path (str): 当前位置的JSON Pointer
+
+    返回:
+        List[Dict]: add/remove/replace操作，文档相同时为空列表
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(diff(old[key], value, child))
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            ops.extend(diff(old_item, new_item, f"{path}/{index}"))
+        return ops
+    return [{"op": "replace", "path": path, "value": new}]
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Iterator, Optional, Type, TypeVar, Union
 from pydantic import BaseModel, Field, validator
 from enum import Enum
 from .exceptions import ValidationError
@@ -111,12 +111,58 @@ class PromptPayload(BaseModel):
         str_strip_whitespace = True
         validate_assignment = True 
 
+M = TypeVar("M", bound=BaseModel)
+
+
+def construct_model(model: Type[M], values: Dict[str, Any]) -> M:
+    """不经过校验直接构造模型（兼容pydantic v1/v2），只用于可信数据"""
+    construct = getattr(model, "model_construct", None) or model.construct
+    return construct(**values)
+
+
 class APIResponse(BaseModel):
     """API响应基础结构"""
     code: int
     msg: str
     data: Optional[Union[Dict[str, Any], List[Any]]] = None
 
+    @classmethod
+    def trusted(cls, response_data: Dict[str, Any]) -> "APIResponse":
+        """
+        不经过pydantic校验直接从服务端响应构造APIResponse。
+        data保持解码后的原始结构，只有通过data_as/iter_data读取时才会转换为模型。
+        """
+        return construct_model(cls, {
+            "code": response_data.get("code"),
+            "msg": response_data.get("msg", ""),
+            "data": response_data.get("data"),
+        })
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取字典data中的单个字段，data不是字典时返回default"""
+        return self.data.get(key, default) if isinstance(self.data, dict) else default
+
+    def data_as(self, model: Type[M], validate: bool = False) -> M:
+        """
+        把字典data转换为指定模型
+
+        参数:
+            model: pydantic模型类
+            validate (bool): 是否校验，默认直接构造
+        """
+        return model(**self.data) if validate else construct_model(model, self.data)
+
+    def iter_data(self, model: Optional[Type[M]] = None, validate: bool = False) -> Iterator[Any]:
+        """
+        逐个产出列表data中的元素，指定model时元素在迭代到时才转换为模型，
+        只读取前几项时不会为整个列表构造对象
+        """
+        for item in self.data or ():
+            if model is None:
+                yield item
+            else:
+                yield model(**item) if validate else construct_model(model, item)
+
     def to_dict(self) -> Dict[str, Any]:
         """将API响应转换为字典"""
         return self.dict()
@@ -0,0 +1,182 @@
+import asyncio
+import mimetypes
+import mmap
+import os
+import uuid
+from typing import AsyncIterator, BinaryIO, Iterator, Optional, Tuple, Union
+
+UploadSource = Union[str, "os.PathLike[str]", bytes, bytearray, memoryview, mmap.mmap, BinaryIO]
+# 数据源或(filename, 数据源)，用于批量上传时为内存数据指定文件名
+NamedUploadSource = Union[UploadSource, Tuple[str, UploadSource]]
+
+CHUNK_SIZE = 256 * 1024
+
+
+class MultipartStream:
+    """
+    流式multipart/form-data编码器
+    请求体按需从数据源读取，内存占用与文件大小无关；内存中的数据（bytes、memoryview、mmap）
+    以memoryview切片的形式发送，不产生整体拷贝。
+    支持文件路径、bytes类对象、mmap以及二进制文件对象，数据源大小已知时会设置Content-Length，
+    否则使用分块传输编码。
+    """
+    def __init__(self, source: UploadSource, filename: Optional[str] = None,
+                 field_name: str = "file", content_type: Optional[str] = None,
+                 boundary: Optional[str] = None):
+        """
+        参数:
+            source: 文件路径、bytes/bytearray/memoryview/mmap或二进制文件对象
+            filename (str, optional): 上传使用的文件名，默认取路径或文件对象的name
+            field_name (str): 表单字段名
+            content_type (str, optional): 文件的Content-Type，默认按文件名猜测
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self._file: Optional[BinaryIO] = None
+        self._buffer: Optional[memoryview] = None
+        self._owns_file = False
+        self._start = 0
+
+        if isinstance(source, (str, os.PathLike)):
+            self._file = open(source, "rb")
+            self._owns_file = True
+            self.body_size: Optional[int] = os.fstat(self._file.fileno()).st_size
+            filename = filename or os.path.basename(os.fspath(source))
+        elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            self._buffer = memoryview(source).cast("B")
+            self.body_size = self._buffer.nbytes
+        elif hasattr(source, "read"):
+            self._file = source
+            self.body_size = self._remaining_size(source)
+            filename = filename or os.path.basename(str(getattr(source, "name", "") or ""))
+        else:
+            raise TypeError(f"Unsupported upload source: {type(source).__name__}")
+
+        self.filename = filename or "upload.bin"
+        self.field_name = field_name
+        self.file_content_type = (
+            content_type or mimetypes.guess_type(self.filename)[0] or "application/octet-stream"
+        )
+        quoted = self.filename.replace("\\", "\\\\").replace('"', "%22")
+        self._head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{quoted}"\r\n'
+            f"Content-Type: {self.file_content_type}\r\n\r\n"
+        ).encode("utf-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+        self._pos = 0
+        self._body_done = False
+        self._body_end = 0
+
+    def _remaining_size(self, stream: BinaryIO) -> Optional[int]:
+        """计算文件对象从当前位置到末尾的字节数，不可seek时返回None"""
+        try:
+            self._start = stream.tell()
+            try:
+                return os.fstat(stream.fileno()).st_size - self._start
+            except (AttributeError, OSError, ValueError):
+                end = stream.seek(0, os.SEEK_END)
+                stream.seek(self._start)
+                return end - self._start
+        except (AttributeError, OSError, ValueError):
+            self._start = None
+            return None
+
+    @property
+    def content_type(self) -> str:
+        """请求的Content-Type头"""
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    @property
+    def length(self) -> Optional[int]:
+        """请求体总长度，数据源大小未知时为None"""
+        if self.body_size is None:
+            return None
+        return len(self._head) + self.body_size + len(self._tail)
+
+    def __len__(self) -> int:
+        length = self.length
+        if length is None:
+            raise TypeError("MultipartStream length is unknown for non-seekable sources")
+        return length
+
+    @property
+    def in_memory(self) -> bool:
+        """数据源是否在内存中（读取不会阻塞）"""
+        return self._buffer is not None
+
+    def rewind(self) -> None:
+        """回到请求体开头，用于重试"""
+        if self._pos == 0:
+            return
+        if self._file is not None:
+            if self._start is None:
+                raise ValueError("Cannot rewind a non-seekable upload source")
+            self._file.seek(self._start)
+        self._pos = 0
+        self._body_done = False
+
+    def read(self, size: int = -1) -> Union[bytes, memoryview]:
+        """读取请求体的下一段数据，返回空值表示结束"""
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        head_len = len(self._head)
+        if self._pos < head_len:
+            chunk = self._head[self._pos:self._pos + size]
+            self._pos += len(chunk)
+            return chunk
+
+        if not self._body_done:
+            offset = self._pos - head_len
+            if self._buffer is not None:
+                chunk = self._buffer[offset:offset + size]
+            else:
+                limit = size if self.body_size is None else min(size, self.body_size - offset)
+                chunk = self._file.read(limit) if limit > 0 else b""
+            if chunk:
+                self._pos += len(chunk)
+                return chunk
+            if self.body_size is not None and offset < self.body_size:
+                raise IOError(f"Upload source ended early: {offset}/{self.body_size} bytes")
+            self._body_done = True
+            self._body_end = self._pos
+
+        offset = self._pos - self._body_end
+        chunk = self._tail[offset:offset + size]
+        self._pos += len(chunk)
+        return chunk
+
+    def __iter__(self) -> Iterator[Union[bytes, memoryview]]:
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    async def aiter_chunks(self, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[Union[bytes, memoryview]]:
+        """异步读取请求体，文件数据源在线程池中读取以免阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if self.in_memory:
+                chunk = self.read(chunk_size)
+            else:
+                chunk = await loop.run_in_executor(None, self.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        """关闭由本对象打开的文件"""
+        if self._owns_file and self._file is not None:
+            self._file.close()
+        if self._buffer is not None:
+            try:
+                self._buffer.release()
+            except BufferError:
+                pass
+            self._buffer = None
+
+    def __enter__(self) -> "MultipartStream":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
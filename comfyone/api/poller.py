@@ -0,0 +1,213 @@
+import heapq
+import itertools
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from .exceptions import APIError
+from .futures import ProgressCallback, PromptFuture
+
+# get_prompt_status返回的任务状态
+SUCCESS_STATUSES = frozenset({"finished", "success", "succeeded", "done", "completed"})
+FAILURE_STATUSES = frozenset({"failed", "error", "cancelled", "canceled"})
+
+
+def status_event(task_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    把get_prompt_status的结果转换为与WebSocket相同格式的事件：
+    已结束的任务转换为finished事件，排队中（有current排队位置）为pendding，其余为progress
+    """
+    status = str(data.get("status", "")).lower()
+    if status in SUCCESS_STATUSES or status in FAILURE_STATUSES:
+        event_data = {**data, "success": status in SUCCESS_STATUSES}
+        if not event_data["success"]:
+            event_data.setdefault("message", data.get("msg") or f"Prompt {status}")
+        return {"type": "finished", "taskId": task_id, "data": event_data}
+    if data.get("current") is not None:
+        return {"type": "pendding", "taskId": task_id, "data": data}
+    return {"type": "progress", "taskId": task_id, "data": data}
+
+
+@dataclass
+class _PollState:
+    """单个任务的轮询状态"""
+    interval: float
+    progress: Optional[float] = None
+    progress_at: Optional[float] = None
+    last_key: Optional[Tuple[Any, ...]] = None
+
+
+class StatusPoller:
+    """
+    多任务共享的状态轮询器，WebSocket不可用时代替逐个任务循环调用get_prompt_status
+    所有待查询的任务按下次查询时间放在一个优先队列中，由一个后台线程取出到期的任务，
+    通过客户端连接池并发查询；轮询间隔根据排队位置和执行进度自适应调整。
+    查询结果转换为WebSocket格式的事件交给客户端的TaskRegistry，与WebSocket共用同一批future。
+    """
+    def __init__(self, client, min_interval: float = 1.0, max_interval: float = 30.0,
+                 max_concurrency: int = 8, logger: Optional[logging.Logger] = None):
+        """
+        参数:
+            client (ComfyOneClient): 用于查询状态的客户端，结果交给client.tasks
+            min_interval/max_interval (float): 单个任务的轮询间隔范围（秒）
+            max_concurrency (int): 同时进行中的状态查询数上限
+        """
+        self.client = client
+        self.tasks = client.tasks
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_concurrency = max_concurrency
+        self.logger = logger or logging.getLogger(__name__)
+        self._cond = threading.Condition()
+        # (下次查询时间, 序号, task_id)
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._states: Dict[str, _PollState] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._closed = False
+
+    def watch(self, task_id: str, on_progress: Optional[ProgressCallback] = None) -> PromptFuture:
+        """
+        开始跟踪任务，同一任务重复调用时返回同一个future且只查询一次
+
+        参数:
+            task_id (str): 任务ID
+            on_progress (callable, optional): 进度回调
+
+        返回:
+            PromptFuture: 与submit()返回的future相同
+        """
+        future = self.tasks.register(task_id, on_progress)
+        if future.done():
+            return future
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("StatusPoller is closed")
+            if task_id not in self._states:
+                self._states[task_id] = _PollState(self.min_interval)
+                heapq.heappush(self._heap, (time.monotonic(), next(self._seq), task_id))
+                self._start()
+                self._cond.notify()
+        # 结束或被取消后立即停止跟踪，不再等到下一次查询
+        future.add_done_callback(lambda _: self._forget(task_id))
+        return future
+
+    def close(self) -> None:
+        """停止轮询，未完成的future保持等待状态"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="comfyone-poll")
+            self._thread = threading.Thread(target=self._run, name="comfyone-status-poller", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                now = time.monotonic()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+            # 等待这一批查询完成后再取下一批，同时进行的查询不超过max_concurrency
+            for _ in self._executor.map(self._safe_poll, due):
+                pass
+
+    def _safe_poll(self, task_id: str) -> None:
+        """查询单个任务，意外异常只记录日志并退避后重试，不能结束唯一的轮询线程"""
+        try:
+            self._poll(task_id)
+        except Exception:
+            self.logger.exception(f"Status poll raised for {task_id}")
+            state = self._states.get(task_id)
+            if state is not None:
+                self._schedule(task_id, min(self.max_interval, state.interval * 2))
+
+    def _poll(self, task_id: str) -> None:
+        if task_id not in self.tasks:
+            # 任务已经由WebSocket事件完成或被放弃
+            self._forget(task_id)
+            return
+        state = self._states.get(task_id)
+        if state is None:
+            return
+        try:
+            response = self.client.get_prompt_status(task_id)
+            if response.code != 0:
+                raise APIError(response.code, response.msg)
+        except APIError as e:
+            if e.code == 404:
+                self.tasks.dispatch({"type": "error", "taskId": task_id, "data": {"message": str(e)}})
+                self._forget(task_id)
+                return
+            self.logger.warning(f"Status poll failed for {task_id}: {str(e)}")
+            self._schedule(task_id, min(self.max_interval, state.interval * 2))
+            return
+        data = response.data if isinstance(response.data, dict) else {}
+        event = status_event(task_id, data)
+        if event["type"] == "finished":
+            self.tasks.dispatch(event)
+            self._forget(task_id)
+            return
+        key = (event["type"], data.get("current"), data.get("process"))
+        if key != state.last_key:
+            state.last_key = key
+            self.tasks.dispatch(event)
+        self._schedule(task_id, self._next_interval(state, data))
+
+    def _next_interval(self, state: _PollState, data: Dict[str, Any]) -> float:
+        """
+        排队中按排队位置线性放大间隔；执行中按进度变化速度估计剩余时间，在剩余时间的一半后再查；
+        状态没有变化时逐步退避
+        """
+        now = time.monotonic()
+        position = data.get("current")
+        progress = data.get("process")
+        interval = state.interval * 1.5
+        if position is not None:
+            try:
+                interval = self.min_interval * (1 + float(position))
+            except (TypeError, ValueError):
+                pass
+        elif progress is not None:
+            try:
+                progress = float(progress)
+            except (TypeError, ValueError):
+                progress = None
+            if progress is not None:
+                if state.progress is not None and progress > state.progress:
+                    rate = (progress - state.progress) / (now - state.progress_at)
+                    interval = (100 - progress) / rate / 2
+                if state.progress is None or progress != state.progress:
+                    state.progress, state.progress_at = progress, now
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _schedule(self, task_id: str, interval: float) -> None:
+        with self._cond:
+            state = self._states.get(task_id)
+            if state is None or self._closed:
+                return
+            state.interval = interval
+            heapq.heappush(self._heap, (time.monotonic() + interval, next(self._seq), task_id))
+            self._cond.notify()
+
+    def _forget(self, task_id: str) -> None:
+        with self._cond:
+            self._states.pop(task_id, None)
@@ -0,0 +1,133 @@
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+from .codec import JSONCodec, default_codec
+from .exceptions import ValidationError
+from .models import PromptInput, PromptPayload
+
+# 没有默认值、每次提交都必须提供的参数
+REQUIRED = object()
+
+InputSchema = Mapping[str, Union[Iterable[str], Mapping[str, Any]]]
+
+
+class PromptTemplate:
+    """
+    预编译的Prompt请求模板
+    compile时用PromptPayload校验一次结构，并把请求体中不变的部分（workflow_id、节点ID、参数名、默认值）
+    预先编码为字节串；之后每次提交只编码传入的参数值再拼接，不再构造pydantic模型。
+    生成的字节串可以直接传给client.prompt()/prompt_many()。
+    """
+    def __init__(self, workflow_id: str, nodes: List[Tuple[str, List[Tuple[str, Any]]]],
+                 free_cache: bool = False, codec: Optional[JSONCodec] = None):
+        """
+        参数:
+            workflow_id (str): 工作流ID
+            nodes: [(节点ID, [(参数名, 默认值或REQUIRED)])]，通常通过compile构造
+            free_cache (bool): 请求体中的free_cache
+            codec (JSONCodec, optional): 编码参数值的编解码器，默认与客户端相同
+        """
+        self.workflow_id = workflow_id
+        self.free_cache = free_cache
+        self.codec = codec or default_codec
+        self._nodes = {node_id: {name for name, _ in params} for node_id, params in nodes}
+        dumps = self.codec.dumps
+        # 请求体 = parts[0] + slot0 + parts[1] + slot1 + ... ，slot为(节点ID, 参数名, 预编码的默认值)
+        self._parts: List[bytes] = []
+        self._slots: List[Tuple[str, str, Any]] = []
+        static = bytearray(b'{"workflow_id":' + dumps(workflow_id) + b',"inputs":[')
+        for index, (node_id, params) in enumerate(nodes):
+            if index:
+                static += b","
+            static += b'{"id":' + dumps(node_id) + b',"params":{'
+            for position, (name, default) in enumerate(params):
+                if position:
+                    static += b","
+                static += dumps(name) + b":"
+                self._parts.append(bytes(static))
+                self._slots.append((node_id, name, default if default is REQUIRED else dumps(default)))
+                static = bytearray()
+            static += b"}}"
+        static += b'],"free_cache":' + dumps(free_cache) + b"}"
+        self._parts.append(bytes(static))
+
+    @classmethod
+    def compile(cls, workflow_id: str, input_schema: InputSchema, free_cache: bool = False,
+                codec: Optional[JSONCodec] = None) -> "PromptTemplate":
+        """
+        校验并编译模板
+
+        参数:
+            workflow_id (str): 工作流ID
+            input_schema: {节点ID: [参数名]}，或{节点ID: {参数名: 默认值}}，有默认值的参数提交时可以省略
+            free_cache (bool): 请求体中的free_cache
+            codec (JSONCodec, optional): 编码参数值的编解码器
+
+        返回:
+            PromptTemplate: 编译后的模板
+        """
+        nodes = []
+        for node_id, params in input_schema.items():
+            if isinstance(params, str):
+                raise ValidationError(f"Params of input {node_id} must be a list of names or a dict of defaults")
+            if not isinstance(params, Mapping):
+                params = dict.fromkeys(params, REQUIRED)
+            for name in params:
+                if not isinstance(name, str):
+                    raise ValidationError(f"Param names of input {node_id} must be strings, got {name!r}")
+            nodes.append((node_id, list(params.items())))
+        # 只在编译时经过一次pydantic校验，使用规范化后的字段
+        payload = PromptPayload(
+            workflow_id=workflow_id,
+            inputs=[PromptInput(id=node_id, params=dict(params)) for node_id, params in nodes],
+            free_cache=free_cache,
+        )
+        nodes = [(prompt_input.id, params) for prompt_input, (_, params) in zip(payload.inputs, nodes)]
+        return cls(payload.workflow_id, nodes, payload.free_cache, codec)
+
+    @property
+    def params(self) -> List[Tuple[str, str]]:
+        """模板中的所有参数，(节点ID, 参数名)"""
+        return [(node_id, name) for node_id, name, _ in self._slots]
+
+    def encode(self, values: Optional[Mapping[str, Mapping[str, Any]]] = None) -> bytes:
+        """
+        生成可以直接发送的请求体
+
+        参数:
+            values: {节点ID: {参数名: 参数值}}，省略的参数使用默认值
+
+        返回:
+            bytes: 与PromptPayload.to_dict()编码结果相同的JSON请求体
+        """
+        values = values or {}
+        self._check(values)
+        dumps = self.codec.dumps
+        parts = self._parts
+        body = [parts[0]]
+        for index, (node_id, name, default) in enumerate(self._slots, 1):
+            params = values.get(node_id)
+            if params is not None and name in params:
+                body.append(dumps(params[name]))
+            elif default is REQUIRED:
+                raise ValidationError(f"Missing value for param {name} of input {node_id}")
+            else:
+                body.append(default)
+            body.append(parts[index])
+        return b"".join(body)
+
+    def render(self, values: Optional[Mapping[str, Mapping[str, Any]]] = None) -> Dict[str, Any]:
+        """生成与PromptPayload.to_dict()结构相同的字典，用于调试或需要修改请求体的场景"""
+        return self.codec.loads(self.encode(values))
+
+    def _check(self, values: Mapping[str, Mapping[str, Any]]) -> None:
+        """拒绝模板中不存在的节点和参数，避免拼写错误被静默忽略"""
+        nodes = self._nodes
+        for node_id, params in values.items():
+            names = nodes.get(node_id)
+            if names is None:
+                raise ValidationError(f"Unknown input {node_id} for workflow {self.workflow_id}")
+            if not names.issuperset(params):
+                unknown = ", ".join(sorted(set(params) - names))
+                raise ValidationError(f"Unknown params for input {node_id}: {unknown}")
+
+    def __repr__(self) -> str:
+        return f"PromptTemplate(workflow_id={self.workflow_id!r}, params={len(self._slots)})"
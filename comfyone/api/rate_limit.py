@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+RateSpec = Union[float, Tuple[float, float]]
+
+
+class TokenBucket:
+    """
+    令牌桶限流器
+    每秒补充rate个令牌，最多累积burst个。acquire会预约令牌并返回需要等待的时间，
+    多个调用方按到达顺序依次获得令牌，不会出现同时唤醒后再争抢的情况。
+    """
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """预约令牌，返回调用方需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """阻塞当前线程直到获得令牌，返回实际等待的秒数"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """acquire的协程版本，等待期间不阻塞事件循环"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """
+    按接口类别划分的客户端限流器
+    prompt: 提交prompt；status: 查询prompt状态；file: 文件上传下载；default: 其他接口。
+    未配置速率的类别不限流。
+    """
+    PROMPT = "prompt"
+    STATUS = "status"
+    FILE = "file"
+    DEFAULT = "default"
+
+    _shared: Dict[str, "RateLimiter"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, prompt: Optional[RateSpec] = None, status: Optional[RateSpec] = None,
+                 file: Optional[RateSpec] = None, default: Optional[RateSpec] = None):
+        """
+        参数:
+            prompt/status/file/default: 每秒请求数，或(每秒请求数, 突发容量)元组
+        """
+        self.buckets: Dict[str, TokenBucket] = {}
+        for name, spec in ((self.PROMPT, prompt), (self.STATUS, status),
+                           (self.FILE, file), (self.DEFAULT, default)):
+            if spec is None:
+                continue
+            rate, burst = spec if isinstance(spec, tuple) else (spec, None)
+            self.buckets[name] = TokenBucket(rate, burst)
+
+    @classmethod
+    def for_api_key(cls, api_key: str, **limits) -> "RateLimiter":
+        """
+        获取进程内按API密钥共享的限流器，使用同一密钥的多个客户端共用同一组令牌桶。
+        首次调用时使用limits创建，之后的调用忽略limits。
+        """
+        with cls._shared_lock:
+            limiter = cls._shared.get(api_key)
+            if limiter is None:
+                limiter = cls(**limits)
+                cls._shared[api_key] = limiter
+            return limiter
+
+    @classmethod
+    def classify(cls, api: str, method: str = "GET") -> str:
+        """根据接口路径和方法判断接口类别"""
+        parts = api.strip("/").split("/")
+        resource = parts[1] if len(parts) > 1 else ""
+        if resource == "files":
+            return cls.FILE
+        if resource == "prompts":
+            if method == "POST" and len(parts) == 2:
+                return cls.PROMPT
+            if parts[-1] == "status":
+                return cls.STATUS
+        return cls.DEFAULT
+
+    def acquire(self, category: str) -> float:
+        """阻塞直到该接口类别有可用令牌，返回等待的秒数"""
+        bucket = self.buckets.get(category)
+        return bucket.acquire() if bucket else 0.0
+
+    async def acquire_async(self, category: str) -> float:
+        """acquire的协程版本"""
+        bucket = self.buckets.get(category)
+        return await bucket.acquire_async() if bucket else 0.0
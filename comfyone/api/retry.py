@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional, Iterable
+
+
+class RetryBudget:
+    """
+    客户端级别的令牌桶重试预算
+    每个正常请求存入ratio个令牌，每次重试消耗一个令牌，保证重试流量不超过正常流量的固定比例。
+    min_per_second保证低流量时仍然可以进行少量重试。
+    """
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, capacity: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def deposit(self) -> None:
+        """记录一次正常请求"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """尝试为一次重试消耗令牌，预算不足时返回False"""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    @property
+    def tokens(self) -> float:
+        """当前剩余的重试令牌"""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class RetryState:
+    """单次API调用的重试状态，由RetryPolicy.start()创建"""
+    def __init__(self, policy: "RetryPolicy"):
+        self.policy = policy
+        self.attempts = 1
+        self.started_at = time.monotonic()
+        self._last_delay = policy.base_delay
+
+    def remaining(self) -> Optional[float]:
+        """距离整体截止时间的剩余秒数，未设置截止时间时返回None"""
+        if self.policy.deadline is None:
+            return None
+        return self.policy.deadline - (time.monotonic() - self.started_at)
+
+    def next_delay(self, status: Optional[int] = None, method: str = "GET",
+                   headers: Optional[Mapping[str, str]] = None, sent: bool = True) -> Optional[float]:
+        """
+        判断是否应当重试，并返回重试前的等待秒数。
+        status为None表示连接错误或超时，sent为False表示连接未建立、请求确定没有发出。返回None表示不应重试。
+        """
+        policy = self.policy
+        if self.attempts >= policy.max_attempts:
+            return None
+        if not policy.is_retryable(status, method, headers, sent):
+            return None
+
+        delay = policy.backoff(self._last_delay)
+        if headers is not None and policy.respect_retry_after:
+            retry_after = policy.parse_retry_after(headers.get("Retry-After"))
+            if retry_after is not None:
+                if retry_after > policy.max_retry_after:
+                    return None
+                delay = max(delay, retry_after)
+
+        remaining = self.remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        if policy.budget is not None and not policy.budget.try_withdraw():
+            return None
+
+        self._last_delay = delay
+        self.attempts += 1
+        return delay
+
+
+class RetryPolicy:
+    """
+    可插拔的重试策略
+    使用decorrelated jitter退避，按状态码区分可重试错误，支持429/503的Retry-After，
+    并可设置整体截止时间以及共享的重试预算。可以继承并重写is_retryable/backoff实现自定义策略。
+    非幂等请求（POST/PATCH）可能已被服务端处理，只在确定未被处理时重试，避免重复提交prompt任务。
+    """
+    RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+    IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+    # 服务端拒绝处理、要求稍后再试的状态码，带Retry-After时非幂等请求也可以重试
+    REJECTED_STATUSES = frozenset({429, 503})
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 30.0,
+                 deadline: Optional[float] = None,
+                 retryable_statuses: Optional[Iterable[int]] = None,
+                 respect_retry_after: bool = True, max_retry_after: float = 60.0,
+                 budget: Optional[RetryBudget] = None,
+                 idempotent_methods: Optional[Iterable[str]] = None):
+        """
+        参数:
+            max_attempts (int): 包含首次请求在内的最大尝试次数
+            base_delay (float): 最小退避时间（秒）
+            max_delay (float): 最大退避时间（秒）
+            deadline (float, optional): 单次调用（包含所有重试）的整体截止时间（秒）
+            retryable_statuses: 可重试的HTTP状态码，默认408/425/429/5xx网关类错误
+            respect_retry_after (bool): 是否遵循服务端返回的Retry-After
+            max_retry_after (float): Retry-After超过该值时直接失败而不是等待
+            budget (RetryBudget, optional): 共享的重试预算
+            idempotent_methods: 可以安全重试的HTTP方法，默认GET/HEAD/OPTIONS/PUT/DELETE
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retryable_statuses = (
+            frozenset(retryable_statuses) if retryable_statuses is not None else self.RETRYABLE_STATUSES
+        )
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        self.budget = budget
+        self.idempotent_methods = frozenset(
+            m.upper() for m in (idempotent_methods if idempotent_methods is not None else self.IDEMPOTENT_METHODS)
+        )
+
+    def start(self) -> RetryState:
+        """开始一次新的API调用"""
+        if self.budget is not None:
+            self.budget.deposit()
+        return RetryState(self)
+
+    def is_retryable(self, status: Optional[int], method: str,
+                     headers: Optional[Mapping[str, str]] = None, sent: bool = True) -> bool:
+        """
+        幂等请求：连接错误和超时总是可重试，HTTP错误只有在retryable_statuses中才重试。
+        非幂等请求：只在连接未建立，或服务端以带Retry-After的429/503拒绝时重试；
+        超时和其他5xx时服务端可能已经接受了请求，不重试。
+        """
+        if method.upper() in self.idempotent_methods:
+            return status is None or status in self.retryable_statuses
+        if status is None:
+            return not sent
+        return (status in self.REJECTED_STATUSES and status in self.retryable_statuses
+                and headers is not None and headers.get("Retry-After") is not None)
+
+    def backoff(self, previous_delay: float) -> float:
+        """decorrelated jitter: 在[base_delay, previous_delay * 3]之间随机选择"""
+        upper = max(self.base_delay, previous_delay * 3)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """解析Retry-After头，支持秒数和HTTP日期两种格式"""
+        if not value:
+            return None
+        value = value.strip()
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError, IndexError):
+            return None
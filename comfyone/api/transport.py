@@ -0,0 +1,119 @@
+import threading
+import time
+import logging
+from functools import partial
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from .exceptions import ConnectionError
+
+
+class _IdleEvictionMixin:
+    """
+    按连接记录空闲时间：连接放回池中时记下时间，取出时空闲超过idle_timeout则先关闭，
+    下次使用时重新建立。只影响真正空闲过久的连接，繁忙的连接不会让其他过期连接继续留在池中。
+    """
+    def __init__(self, *args, idle_timeout: Optional[float] = None, **kwargs):
+        self.idle_timeout = idle_timeout
+        super().__init__(*args, **kwargs)
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        idle_since = getattr(conn, "_comfyone_idle_since", None)
+        if idle_since is not None and self.idle_timeout is not None:
+            if time.monotonic() - idle_since >= self.idle_timeout:
+                conn.close()
+        return conn
+
+    def _put_conn(self, conn) -> None:
+        if conn is not None:
+            conn._comfyone_idle_since = time.monotonic()
+        super()._put_conn(conn)
+
+
+class _IdleEvictingHTTPConnectionPool(_IdleEvictionMixin, HTTPConnectionPool):
+    pass
+
+
+class _IdleEvictingHTTPSConnectionPool(_IdleEvictionMixin, HTTPSConnectionPool):
+    pass
+
+
+class _IdleEvictingAdapter(HTTPAdapter):
+    """连接池按连接驱逐空闲连接的HTTPAdapter"""
+    def __init__(self, idle_timeout: Optional[float] = None, **kwargs):
+        self.idle_timeout = idle_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": partial(_IdleEvictingHTTPConnectionPool, idle_timeout=self.idle_timeout),
+            "https": partial(_IdleEvictingHTTPSConnectionPool, idle_timeout=self.idle_timeout),
+        }
+
+
+class PooledTransport:
+    """
+    基于requests.Session的连接池传输层
+    复用TCP/TLS连接，避免每次请求都重新握手。
+    底层urllib3连接池是线程安全的，可以在多个线程之间共享同一个实例。
+    """
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10,
+                 idle_timeout: Optional[float] = 60.0, pool_block: bool = False,
+                 logger: Optional[logging.Logger] = None):
+        """
+        参数:
+            pool_connections (int): 缓存的主机连接池数量
+            pool_maxsize (int): 每个主机连接池中保持的最大连接数
+            idle_timeout (float, optional): 单个连接空闲超过该秒数后丢弃，None表示不驱逐
+            pool_block (bool): 连接池耗尽时是否阻塞等待空闲连接
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._adapter = _IdleEvictingAdapter(
+            idle_timeout=idle_timeout,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=0
+        )
+        self._session = requests.Session()
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+
+    @property
+    def closed(self) -> bool:
+        """传输层是否已关闭"""
+        return self._closed
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """通过连接池发送HTTP请求，参数与requests.request一致"""
+        if self._closed:
+            raise ConnectionError(0, "Transport is closed")
+        return self._session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """发送GET请求"""
+        return self.request("GET", url, **kwargs)
+
+    def close(self) -> None:
+        """关闭连接池并释放所有连接"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._session.close()
+            self.logger.debug("Pooled transport closed")
+
+    def __enter__(self) -> "PooledTransport":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_stream(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> str:
+    """以流式方式计算文件对象剩余内容的SHA-256，内存占用与文件大小无关"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sha256_file(file_path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """以流式方式计算文件的SHA-256"""
+    with open(file_path, "rb") as f:
+        return sha256_stream(f, chunk_size)
+
+
+class UploadCache:
+    """
+    (服务端账号, 文件内容哈希) -> 服务端文件引用 的上传缓存
+    相同内容的文件对同一服务端账号只上传一次；LRU淘汰，可选持久化到JSON文件；
+    多个线程同时上传相同内容时只进行一次传输，其余调用方等待并共享结果。
+    """
+    def __init__(self, max_entries: int = 4096, path: Optional[str] = None,
+                 ttl: Optional[float] = None, logger: Optional[logging.Logger] = None):
+        """
+        参数:
+            max_entries (int): 最多缓存的文件引用数量
+            path (str, optional): 持久化文件路径
+            ttl (float, optional): 文件引用的有效期（秒），服务端会清理上传文件时应设置
+        """
+        self.max_entries = max_entries
+        self.path = os.path.expanduser(path) if path else None
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._in_flight: Dict[str, Future] = {}
+        self._load()
+
+    @staticmethod
+    def scoped_key(scope: str, digest: str) -> str:
+        """
+        缓存键：服务端文件引用只在上传到的服务端和账号下有效，不同scope的相同内容分别缓存
+
+        参数:
+            scope (str): 服务端地址和账号的标识，即客户端的scope
+            digest (str): 文件内容的SHA-256
+        """
+        return f"{scope}|{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询文件引用，未命中或已过期时返回None"""
+        with self._lock:
+            return self._lookup(key)
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        """记录上传结果"""
+        with self._lock:
+            self._entries[key] = (time.time(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def claim(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[Future]]:
+        """
+        查询缓存并在未命中时认领上传，两步在同一把锁内完成
+
+        返回:
+            (文件引用, None): 命中缓存
+            (None, Future): 其他调用方正在上传，等待该Future得到文件引用
+            (None, None): 由调用方负责上传，完成后必须调用resolve或reject
+        """
+        with self._lock:
+            data = self._lookup(key)
+            if data is not None:
+                return data, None
+            future = self._in_flight.get(key)
+            if future is not None:
+                return None, future
+            self._in_flight[key] = Future()
+            return None, None
+
+    def resolve(self, key: str, data: Dict[str, Any], cacheable: bool = True) -> None:
+        """上传完成，缓存结果并唤醒等待者"""
+        if cacheable:
+            self.put(key, data)
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is not None:
+            future.set_result(data)
+
+    def reject(self, key: str, error: BaseException) -> None:
+        """上传失败，把异常传递给等待者，失败结果不缓存"""
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is not None:
+            future.set_exception(error)
+
+    def get_or_upload(self, key: str, upload: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """命中缓存直接返回；否则上传（并发的相同上传合并为一次）"""
+        data, future = self.claim(key)
+        if data is not None:
+            return data
+        if future is not None:
+            return future.result()
+        try:
+            data = upload()
+        except BaseException as e:
+            self.reject(key, e)
+            raise
+        self.resolve(key, data, cacheable=data.get("code") == 0)
+        return data
+
+    async def get_or_upload_async(self, key: str,
+                                  upload: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """get_or_upload的协程版本，等待其他调用方的上传时不阻塞事件循环"""
+        data, future = self.claim(key)
+        if data is not None:
+            return data
+        if future is not None:
+            return await asyncio.wrap_future(future)
+        try:
+            data = await upload()
+        except BaseException as e:
+            self.reject(key, e)
+            raise
+        self.resolve(key, data, cacheable=data.get("code") == 0)
+        return data
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """get的实现，调用方须持有self._lock"""
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        stored_at, data = item
+        if self.ttl is not None and time.time() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return data
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for key, (stored_at, data) in json.load(f).items():
+                    self._entries[key] = (stored_at, data)
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError, OSError) as e:
+            self.logger.warning(f"Ignoring unreadable upload cache {self.path}: {e}")
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Failed to write upload cache {self.path}: {e}")
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import weakref
+import logging
+from typing import Any, Dict, Iterable, Optional, Set
+from .. import exceptions
+from ..codec import JSONCodec, default_codec
+from ..futures import TERMINAL_EVENTS, TaskRegistry
+from .router import EventRouter, Handler, Subscription
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+_CLOSED = object()
+
+
+class EventStream:
+    """
+    ws.events()返回的异步事件迭代器
+    创建时立即开始接收事件，事件放在有界asyncio.Queue中：队列满时WebSocket读取暂停，直到消费者取走事件（背压）。
+    指定了task_id时在任务结束事件之后结束迭代；不再引用、close()或客户端关闭时停止接收。
+    """
+    def __init__(self, owner: "AsyncOneThingAIWebSocket", task_id: Optional[str],
+                 types: Optional[Iterable[str]], max_queue: int):
+        self.task_id = task_id
+        self.types = frozenset(types) if types else None
+        self._owner = owner
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self._closed = False
+        # 队列满时等待放入的任务，close()时取消
+        self._putters: Set[asyncio.Future] = set()
+
+    async def _put(self, event: Dict[str, Any]) -> None:
+        if self._closed or (self.types is not None and event.get("type") not in self.types):
+            return
+        if not self._queue.full():
+            self._queue.put_nowait(event)
+            return
+        # 消费者可能不再读取队列就关闭事件流，放入操作必须能被close()取消，否则WebSocket读取永远阻塞
+        putter = asyncio.ensure_future(self._queue.put(event))
+        self._putters.add(putter)
+        try:
+            await asyncio.wait({putter})
+        finally:
+            putter.cancel()
+            self._putters.discard(putter)
+
+    def close(self) -> None:
+        """停止接收事件，已排队的事件仍可以迭代取出"""
+        if self._closed:
+            return
+        self._closed = True
+        self._owner._remove_stream(self)
+        for putter in self._putters:
+            putter.cancel()
+        try:
+            self._queue.put_nowait(_CLOSED)
+        except asyncio.QueueFull:
+            pass
+
+    def __aiter__(self) -> "EventStream":
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        event = await self._queue.get()
+        if event is _CLOSED:
+            raise StopAsyncIteration
+        if self.task_id is not None and event.get("type") in TERMINAL_EVENTS:
+            self.close()
+        return event
+
+    async def __aenter__(self) -> "EventStream":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class AsyncOneThingAIWebSocket:
+    """
+    基于asyncio的ComfyOne WebSocket客户端
+    连接、接收和分发都在事件循环中进行，不使用后台线程；通过async for event in ws.events(task_id=...)消费事件，
+    事件同时交给任务注册表（完成submit()返回的future）和按(类型, taskId)订阅的处理器。需要安装aiohttp。
+    """
+    def __init__(self, token: str,
+                 url: str = "wss://pandora-server-cf.onethingai.com/v1/ws",
+                 reconnect_delay: float = 5,
+                 logger: Optional[logging.Logger] = None,
+                 codec: Optional[JSONCodec] = None,
+                 tasks: Optional[TaskRegistry] = None,
+                 max_queue: int = 1000,
+                 heartbeat: Optional[float] = 30.0,
+                 session: Optional["aiohttp.ClientSession"] = None):
+        """
+        参数:
+            reconnect_delay (float): 连接断开后重连的等待时间（秒）
+            tasks (TaskRegistry, optional): 客户端submit()返回的future注册表
+            max_queue (int): events()事件队列的默认容量
+            heartbeat (float, optional): 发送ping的间隔（秒），None表示不发送
+            session (aiohttp.ClientSession, optional): 使用外部会话，关闭时不会关闭该会话
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncOneThingAIWebSocket requires aiohttp, install it with: pip install comfyone-sdk[async]"
+            )
+        self.url = url.rstrip('/')
+        self.token = token
+        self.reconnect_delay = reconnect_delay
+        self.logger = logger or logging.getLogger(__name__)
+        self.codec = codec or default_codec
+        self.tasks = tasks
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self.router = EventRouter(self.logger)
+        self.running = False
+        self._session = session
+        self._owns_session = session is None
+        self._ws: Optional["aiohttp.ClientWebSocketResponse"] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connected: Optional[asyncio.Event] = None
+        # taskId -> 事件流，None对应不限任务的事件流；不再被引用的事件流自动移除
+        self._streams: Dict[Optional[str], "weakref.WeakSet[EventStream]"] = {}
+
+    async def start(self) -> None:
+        """在当前事件循环中启动连接和接收任务"""
+        if self._task is not None and not self._task.done():
+            return
+        self.running = True
+        self._connected = asyncio.Event()
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def wait_connected(self, timeout: Optional[float] = None) -> None:
+        """等待连接建立并发送认证消息"""
+        if self._connected is None:
+            raise exceptions.ConnectionError(503, "WebSocket client not started")
+        await asyncio.wait_for(self._connected.wait(), timeout)
+
+    async def close(self) -> None:
+        """关闭连接，结束所有事件流"""
+        self.logger.info("Closing WebSocket connection...")
+        self.running = False
+        if self._ws is not None:
+            await self._ws.close()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for streams in list(self._streams.values()):
+            for stream in list(streams):
+                stream.close()
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "AsyncOneThingAIWebSocket":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    def events(self, task_id: Optional[str] = None, types: Optional[Iterable[str]] = None,
+               max_queue: Optional[int] = None) -> EventStream:
+        """
+        订阅事件流
+
+        参数:
+            task_id (str, optional): 只接收该任务的事件，任务结束后迭代结束
+            types (Iterable[str], optional): 只接收这些类型的事件
+            max_queue (int, optional): 队列容量，默认为max_queue
+
+        返回:
+            EventStream: 异步迭代器
+        """
+        stream = EventStream(self, task_id, types, max_queue or self.max_queue)
+        self._streams.setdefault(task_id, weakref.WeakSet()).add(stream)
+        return stream
+
+    def subscribe(self, handler: Handler, message_type: Optional[str] = None,
+                  task_id: Optional[str] = None) -> Subscription:
+        """按消息类型和/或taskId订阅事件，处理器在事件循环中直接调用，不能阻塞"""
+        return self.router.subscribe(handler, message_type, task_id)
+
+    async def send_message(self, message: Dict[str, Any]) -> None:
+        """发送WebSocket消息"""
+        if self._ws is None or self._ws.closed:
+            raise exceptions.ConnectionError(503, "WebSocket connection not established")
+        try:
+            await self._ws.send_str(self.codec.dumps(message).decode("utf-8"))
+            self.logger.debug(f"Message sent: {message.get('type', 'unknown')}")
+        except Exception as e:
+            raise exceptions.ConnectionError(503, f"Failed to send message: {str(e)}")
+
+    def is_connected(self) -> bool:
+        """检查WebSocket是否已连接"""
+        return self._ws is not None and not self._ws.closed
+
+    async def _run(self) -> None:
+        """连接、接收消息并在断开后重连"""
+        while self.running:
+            try:
+                self.logger.debug(f"Connecting to WebSocket server: {self.url}")
+                async with self._session.ws_connect(
+                    self.url, headers={"Authorization": f"Bearer {self.token}"}, heartbeat=self.heartbeat
+                ) as ws:
+                    self._ws = ws
+                    await self._on_open(ws)
+                    async for message in ws:
+                        if message.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                            await self._on_message(message.data)
+                        elif message.type == aiohttp.WSMsgType.ERROR:
+                            self.logger.error(f"WebSocket error: {ws.exception()}")
+                            break
+                    self.logger.info(f"WebSocket connection closed [{ws.close_code}]")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"WebSocket error: {e}")
+            finally:
+                self._ws = None
+                self._connected.clear()
+            if self.running:
+                self.logger.info(f"Attempting to reconnect in {self.reconnect_delay}s...")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _on_open(self, ws: "aiohttp.ClientWebSocketResponse") -> None:
+        """连接建立后发送与OneThingAIWebSocket.on_open相同的认证消息"""
+        self.logger.info("WebSocket connection established")
+        # 与同步客户端一样以文本帧发送
+        await ws.send_str(self.codec.dumps({"type": "auth", "token": self.token}).decode("utf-8"))
+        self.logger.debug("Authentication message sent")
+        self._connected.set()
+
+    async def _on_message(self, message: Any) -> None:
+        """分发一条消息：任务注册表、订阅的处理器，以及匹配的事件流（队列满时在此等待）"""
+        try:
+            data = self.codec.loads(message)
+        except ValueError:
+            self.logger.warning(f"Invalid JSON message received: {message}")
+            return
+        if not isinstance(data, dict):
+            self.logger.warning(f"Unexpected message received: {message}")
+            return
+
+        handled = self.tasks.dispatch(data) if self.tasks is not None else False
+        handled = self.router.route(data) or handled
+        task_id = data.get("taskId")
+        streams = list(self._streams.get(None, ()))
+        if task_id is not None:
+            streams.extend(self._streams.get(task_id, ()))
+        for stream in streams:
+            await stream._put(data)
+        if task_id is not None and data.get("type") in TERMINAL_EVENTS:
+            # 任务已结束，事件流收到结束事件后自行关闭
+            self._streams.pop(task_id, None)
+        if not streams and not handled and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Unhandled message type: {data.get('type')}")
+            self.logger.debug(f"Message content: {json.dumps(data, indent=2, ensure_ascii=False)}")
+
+    def _remove_stream(self, stream: EventStream) -> None:
+        streams = self._streams.get(stream.task_id)
+        if streams is not None:
+            streams.discard(stream)
+            if not streams and stream.task_id is not None:
+                del self._streams[stream.task_id]
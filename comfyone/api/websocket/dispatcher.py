@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+Event = Dict[str, Any]
+
+_STOP = object()
+
+
+class EventDispatcher:
+    """
+    WebSocket事件的后台分发器
+    接收线程只负责解码并把事件放入队列，处理器在固定数量的工作线程中执行，
+    处理器很慢（例如在finished事件中下载文件）时不会阻塞后续消息和心跳的接收。
+    事件按taskId分配到固定的工作线程，同一任务的事件按到达顺序处理；没有taskId的事件由同一个线程按顺序处理。
+    """
+    def __init__(self, handler: Callable[[Event], None], workers: int = 4, max_queue: int = 10000,
+                 logger: Optional[logging.Logger] = None):
+        """
+        参数:
+            handler (callable): 在工作线程中处理单个事件的函数
+            workers (int): 工作线程数
+            max_queue (int): 每个工作线程的队列容量，队列满时接收线程等待（背压），不丢弃事件
+        """
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.logger = logger or logging.getLogger(__name__)
+        self._queues: List[queue.Queue] = [queue.Queue(max_queue) for _ in range(self.workers)]
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._dispatched = 0
+        self._errors = 0
+        self._max_depth = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._wait_total = 0.0
+
+    def submit(self, event: Event) -> None:
+        """把事件放入对应taskId的工作线程队列"""
+        if not self._threads:
+            self._start()
+        task_id = event.get("taskId")
+        shard = self._queues[hash(task_id) % self.workers if task_id is not None else 0]
+        if shard.full():
+            self.logger.warning(f"WebSocket event queue full ({self.max_queue}), receive thread waiting for handlers")
+        shard.put((event, time.monotonic()))
+        depth = self.queue_depth()
+        if depth > self._max_depth:
+            self._max_depth = depth
+
+    def queue_depth(self) -> int:
+        """所有工作线程队列中等待处理的事件数"""
+        return sum(q.qsize() for q in self._queues)
+
+    def flush(self) -> None:
+        """等待已提交的事件全部处理完成"""
+        for q in self._queues:
+            q.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        分发指标
+
+        返回:
+            Dict: queue_depth、max_queue_depth、dispatched、errors，
+            以及处理器平均/最大耗时handler_latency_avg/handler_latency_max和平均排队时间queue_wait_avg（秒）
+        """
+        with self._stats_lock:
+            count = self._dispatched
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth(),
+                "max_queue_depth": self._max_depth,
+                "dispatched": count,
+                "errors": self._errors,
+                "handler_latency_avg": self._latency_total / count if count else 0.0,
+                "handler_latency_max": self._latency_max,
+                "queue_wait_avg": self._wait_total / count if count else 0.0,
+            }
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """处理完已排队的事件后停止工作线程"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for q in self._queues[:len(threads)]:
+            q.put((_STOP, 0.0))
+        for thread in threads:
+            thread.join(timeout)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._run, args=(q,), name=f"comfyone-ws-dispatch-{i}", daemon=True)
+                for i, q in enumerate(self._queues)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _run(self, events: queue.Queue) -> None:
+        while True:
+            event, enqueued_at = events.get()
+            if event is _STOP:
+                events.task_done()
+                return
+            started = time.monotonic()
+            failed = False
+            try:
+                self.handler(event)
+            except Exception:
+                failed = True
+                self.logger.exception(f"WebSocket handler raised for {event.get('type')} event")
+            finally:
+                elapsed = time.monotonic() - started
+                with self._stats_lock:
+                    self._dispatched += 1
+                    self._errors += failed
+                    self._latency_total += elapsed
+                    self._latency_max = max(self._latency_max, elapsed)
+                    self._wait_total += started - enqueued_at
+                events.task_done()
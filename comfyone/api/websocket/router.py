@@ -0,0 +1,127 @@
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from ..futures import TERMINAL_EVENTS
+
+Event = Dict[str, Any]
+Handler = Callable[[Event], None]
+RouteKey = Tuple[Optional[str], Optional[str]]
+
+
+class Subscription:
+    """一个处理器的订阅，调用unsubscribe()取消"""
+    __slots__ = ("handler", "key", "_router")
+
+    def __init__(self, router: "EventRouter", key: RouteKey, handler: Handler):
+        self._router = router
+        self.key = key
+        self.handler = handler
+
+    @property
+    def message_type(self) -> Optional[str]:
+        return self.key[0]
+
+    @property
+    def task_id(self) -> Optional[str]:
+        return self.key[1]
+
+    def unsubscribe(self) -> None:
+        """取消订阅，重复调用无影响"""
+        self._router.unsubscribe(self)
+
+    def __repr__(self) -> str:
+        return f"Subscription(type={self.key[0]!r}, task_id={self.key[1]!r})"
+
+
+class EventRouter:
+    """
+    按(消息类型, taskId)路由WebSocket事件
+    订阅时类型和taskId都可以为None表示任意值，路由一个事件只需查找4个键，与订阅数量无关；
+    同一个键可以有多个处理器，按订阅顺序依次调用。指定了taskId的订阅在该任务的结束事件处理后自动取消。
+    """
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._routes: Dict[RouteKey, List[Subscription]] = {}
+        # taskId -> 该任务的订阅键，用于结束时自动取消
+        self._task_keys: Dict[str, Set[RouteKey]] = {}
+
+    def subscribe(self, handler: Handler, message_type: Optional[str] = None,
+                  task_id: Optional[str] = None) -> Subscription:
+        """
+        订阅事件
+
+        参数:
+            handler (callable): 事件处理器
+            message_type (str, optional): 消息类型，None表示所有类型
+            task_id (str, optional): 任务ID，None表示所有任务
+
+        返回:
+            Subscription: 订阅句柄
+        """
+        key = (message_type, task_id)
+        subscription = Subscription(self, key, handler)
+        with self._lock:
+            # 写时复制，路由时无需在锁内遍历
+            self._routes[key] = self._routes.get(key, []) + [subscription]
+            if task_id is not None:
+                self._task_keys.setdefault(task_id, set()).add(key)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """取消单个订阅"""
+        key = subscription.key
+        with self._lock:
+            handlers = [s for s in self._routes.get(key, ()) if s is not subscription]
+            if handlers:
+                self._routes[key] = handlers
+            else:
+                self._routes.pop(key, None)
+                self._discard_task_key(key)
+
+    def remove(self, message_type: Optional[str] = None, task_id: Optional[str] = None) -> None:
+        """取消某个(消息类型, taskId)键上的所有订阅"""
+        key = (message_type, task_id)
+        with self._lock:
+            self._routes.pop(key, None)
+            self._discard_task_key(key)
+
+    def route(self, event: Event) -> int:
+        """
+        把事件交给匹配的处理器，处理器抛出的异常会被记录，不影响其他处理器
+
+        返回:
+            int: 调用的处理器数量
+        """
+        message_type = event.get("type")
+        task_id = event.get("taskId")
+        routes = self._routes
+        subscriptions = routes.get((message_type, None), []) + routes.get((None, None), [])
+        if task_id is not None:
+            subscriptions = routes.get((message_type, task_id), []) + routes.get((None, task_id), []) + subscriptions
+        for subscription in subscriptions:
+            try:
+                subscription.handler(event)
+            except Exception:
+                self.logger.exception(f"WebSocket handler raised for {message_type} event")
+        if task_id is not None and message_type in TERMINAL_EVENTS and task_id in self._task_keys:
+            self._end_task(task_id)
+        return len(subscriptions)
+
+    def __len__(self) -> int:
+        return sum(len(handlers) for handlers in self._routes.values())
+
+    def _end_task(self, task_id: str) -> None:
+        with self._lock:
+            for key in self._task_keys.pop(task_id, ()):
+                self._routes.pop(key, None)
+
+    def _discard_task_key(self, key: RouteKey) -> None:
+        task_id = key[1]
+        if task_id is None:
+            return
+        keys = self._task_keys.get(task_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._task_keys[task_id]
@@ -5,6 +5,10 @@ import time
 import logging
 from typing import Optional, Callable, Dict, Any
 from .. import exceptions
+from ..codec import JSONCodec, default_codec
+from ..futures import TaskRegistry
+from .dispatcher import EventDispatcher
+from .router import EventRouter, Handler, Subscription
 
 class OneThingAIWebSocket:
     """
@@ -14,7 +18,16 @@ class OneThingAIWebSocket:
     def __init__(self, token: str, 
                  url: str = "wss://pandora-server-cf.onethingai.com/v1/ws",
                  reconnect_delay: int = 5,
-                 logger: Optional[logging.Logger] = None):
+                 logger: Optional[logging.Logger] = None,
+                 codec: Optional[JSONCodec] = None,
+                 tasks: Optional[TaskRegistry] = None,
+                 dispatch_workers: int = 4,
+                 max_queue: int = 10000):
+        """
+        参数:
+            dispatch_workers (int): 执行消息处理器的工作线程数，0表示在接收线程中直接执行
+            max_queue (int): 每个工作线程的事件队列容量，队列满时暂停接收
+        """
         self.url = url.rstrip('/')
         self.token = token
         self.ws: Optional[websocket.WebSocketApp] = None
@@ -23,26 +36,43 @@ class OneThingAIWebSocket:
         self.reconnect_delay = reconnect_delay
         self.ws_thread: Optional[threading.Thread] = None
         self.logger = logger or logging.getLogger(__name__)
+        # 消息的JSON编解码器，默认安装了orjson时使用orjson
+        self.codec = codec or default_codec
+        # 客户端submit()返回的future注册表，收到的事件先按taskId交给它
+        self.tasks = tasks
+        # 处理器在工作线程中执行，同一taskId的事件保持顺序
+        self.dispatcher: Optional[EventDispatcher] = (
+            EventDispatcher(self._dispatch, dispatch_workers, max_queue, self.logger) if dispatch_workers > 0 else None
+        )
         
-        # Callback handlers
-        self._message_handlers: Dict[str, Callable] = {}
+        # Callback handlers，按(消息类型, taskId)路由，同一类型可以有多个处理器
+        self.router = EventRouter(self.logger)
         self._error_handler: Optional[Callable] = None
         self._connection_handler: Optional[Callable] = None
 
     def on_message(self, ws: websocket.WebSocketApp, message: str) -> None:
         """处理接收到的WebSocket消息"""
         try:
-            data = json.loads(message)
-            message_type = data.get('type')
-            
-            if message_type in self._message_handlers:
-                self._message_handlers[message_type](data)
-            else:
-                self.logger.debug(f"Unhandled message type: {message_type}")
-                self.logger.debug(f"Message content: {json.dumps(data, indent=2)}")
-
-        except json.JSONDecodeError:
+            data = self.codec.loads(message)
+        except ValueError:
             self.logger.warning(f"Invalid JSON message received: {message}")
+            return
+        if not isinstance(data, dict):
+            self.logger.warning(f"Unexpected message received: {message}")
+            return
+
+        if self.dispatcher is not None:
+            self.dispatcher.submit(data)
+        else:
+            self._dispatch(data)
+
+    def _dispatch(self, data: Dict[str, Any]) -> None:
+        """把事件交给任务注册表和对应类型的处理器"""
+        handled = self.tasks.dispatch(data) if self.tasks is not None else False
+        if not self.router.route(data) and not handled and self.logger.isEnabledFor(logging.DEBUG):
+            # 只有开启debug日志时才格式化未处理的消息
+            self.logger.debug(f"Unhandled message type: {data.get('type')}")
+            self.logger.debug(f"Message content: {json.dumps(data, indent=2, ensure_ascii=False)}")
 
     def on_error(self, ws: websocket.WebSocketApp, error: Exception) -> None:
         """处理WebSocket错误"""
@@ -67,7 +97,7 @@ class OneThingAIWebSocket:
             "type": "auth",
             "token": self.token
         }
-        ws.send(json.dumps(auth_message))
+        ws.send(self.codec.dumps(auth_message))
         self.logger.debug("Authentication message sent")
         
         if self._connection_handler:
@@ -116,6 +146,8 @@ class OneThingAIWebSocket:
         self.running = False
         if self.ws:
             self.ws.close()
+        if self.dispatcher is not None:
+            self.dispatcher.close(timeout=self.reconnect_delay)
 
     def send_message(self, message: Dict[str, Any]) -> None:
         """发送WebSocket消息"""
@@ -123,21 +155,37 @@ class OneThingAIWebSocket:
             raise exceptions.ConnectionError("WebSocket connection not established")
         
         try:
-            self.ws.send(json.dumps(message))
+            self.ws.send(self.codec.dumps(message))
             self.logger.debug(f"Message sent: {message.get('type', 'unknown')}")
         except Exception as e:
             raise exceptions.ConnectionError(f"Failed to send message: {str(e)}")
 
-    def add_message_handler(self, message_type: str, handler: Callable[[Dict], None]) -> None:
-        """添加消息类型处理器"""
-        self._message_handlers[message_type] = handler
+    def add_message_handler(self, message_type: str, handler: Callable[[Dict], None]) -> Subscription:
+        """添加消息类型处理器，同一类型的多个处理器都会被调用"""
+        subscription = self.router.subscribe(handler, message_type)
         self.logger.debug(f"Added message handler for type: {message_type}")
+        return subscription
 
     def remove_message_handler(self, message_type: str) -> None:
-        """移除消息类型处理器"""
-        self._message_handlers.pop(message_type, None)
+        """移除消息类型的所有处理器（不包括按taskId订阅的处理器）"""
+        self.router.remove(message_type)
         self.logger.debug(f"Removed message handler for type: {message_type}")
 
+    def subscribe(self, handler: Handler, message_type: Optional[str] = None,
+                  task_id: Optional[str] = None) -> Subscription:
+        """
+        按消息类型和/或taskId订阅事件，指定task_id的订阅在任务结束事件处理后自动取消
+
+        参数:
+            handler (callable): 事件处理器
+            message_type (str, optional): 消息类型，None表示所有类型
+            task_id (str, optional): 任务ID，None表示所有任务
+
+        返回:
+            Subscription: 订阅句柄，调用unsubscribe()取消
+        """
+        return self.router.subscribe(handler, message_type, task_id)
+
     def set_error_handler(self, handler: Callable[[Exception], None]) -> None:
         """设置错误处理器"""
         self._error_handler = handler
@@ -146,6 +194,20 @@ class OneThingAIWebSocket:
         """设置连接建立处理器"""
         self._connection_handler = handler
 
+    def flush(self) -> None:
+        """等待已接收的事件全部处理完成"""
+        if self.dispatcher is not None:
+            self.dispatcher.flush()
+
+    def get_dispatch_stats(self) -> Dict[str, Any]:
+        """
+        获取事件分发指标
+
+        返回:
+            Dict: 队列深度、处理器耗时等，见EventDispatcher.stats()，直接在接收线程中处理时为空字典
+        """
+        return self.dispatcher.stats() if self.dispatcher is not None else {}
+
     def is_connected(self) -> bool:
         """检查WebSocket是否已连接"""
         return self.ws is not None and self.ws.sock is not None and self.ws.sock.connected
\ No newline at end of file
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+import logging
+from typing import Any, Dict, Optional
+from .models import WorkflowPayload
+
+
+def canonical_json(value: Any) -> bytes:
+    """生成规范化的JSON字节串：键排序、无多余空白，相同内容总是得到相同结果"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+# ComfyUI导出时附带的仅用于界面展示的字段，服务端执行时不需要
+UI_NODE_KEYS = ("_meta",)
+UI_INPUT_KEYS = ("speak_and_recognation",)
+
+
+def canonicalize_workflow(workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    去掉工作流图中仅用于界面展示的元数据（节点的_meta标题、speak_and_recognation等输入），
+    返回新的字典，不修改传入的工作流
+    """
+    canonical = {}
+    for node_id, node in workflow.items():
+        if isinstance(node, dict):
+            node = {key: value for key, value in node.items() if key not in UI_NODE_KEYS}
+            inputs = node.get("inputs")
+            if isinstance(inputs, dict) and any(key in inputs for key in UI_INPUT_KEYS):
+                node["inputs"] = {key: value for key, value in inputs.items() if key not in UI_INPUT_KEYS}
+        canonical[node_id] = node
+    return canonical
+
+
+def workflow_hash(payload: WorkflowPayload) -> str:
+    """计算工作流内容哈希，包含规范化后的工作流图以及输入输出定义，界面元数据的变化不影响哈希"""
+    body = payload.to_dict()
+    content = {
+        "inputs": body["inputs"],
+        "outputs": body["outputs"],
+        "workflow": canonicalize_workflow(body["workflow"]),
+    }
+    return hashlib.sha256(canonical_json(content)).hexdigest()
+
+
+class WorkflowRegistry:
+    """
+    工作流内容哈希 -> workflow_id 的索引，同时记录工作流名称 -> (内容哈希, workflow_id)
+    用于ensure_workflow判断工作流内容是否变化，设置path后索引持久化到JSON文件。
+    索引按scope（服务端地址和账号）分开保存，同一个索引文件可以被连接不同服务端或账号的客户端共享。
+    """
+    def __init__(self, path: Optional[str] = None, logger: Optional[logging.Logger] = None):
+        """
+        参数:
+            path (str, optional): 索引文件路径，None表示只保存在内存中
+        """
+        self.path = os.path.expanduser(path) if path else None
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # scope -> {"names": {名称: {"hash", "workflow_id"}}, "hashes": {内容哈希: workflow_id}}
+        self._scopes: Dict[str, Dict[str, Dict[str, Any]]] = self._load()
+
+    def lookup(self, scope: str, name: str) -> Optional[Dict[str, str]]:
+        """查询同名工作流，返回{"hash", "workflow_id"}或None"""
+        with self._lock:
+            entry = self._scopes.get(scope, {}).get("names", {}).get(name)
+            return dict(entry) if entry else None
+
+    def find(self, scope: str, content_hash: str) -> Optional[str]:
+        """查询内容相同的工作流ID"""
+        with self._lock:
+            return self._scopes.get(scope, {}).get("hashes", {}).get(content_hash)
+
+    def record(self, scope: str, name: str, content_hash: str, workflow_id: str) -> None:
+        """记录工作流的内容哈希和ID，该工作流之前的内容哈希不再指向它"""
+        with self._lock:
+            index = self._scopes.setdefault(scope, {"names": {}, "hashes": {}})
+            self._drop_hashes(index, workflow_id)
+            index["names"][name] = {"hash": content_hash, "workflow_id": workflow_id}
+            index["hashes"][content_hash] = workflow_id
+            self._save()
+
+    def forget(self, scope: str, workflow_id: str) -> None:
+        """工作流被删除后移除对应索引"""
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None:
+                return
+            names = [name for name, entry in index["names"].items() if entry["workflow_id"] == workflow_id]
+            for name in names:
+                del index["names"][name]
+            if self._drop_hashes(index, workflow_id) or names:
+                self._save()
+
+    @staticmethod
+    def _drop_hashes(index: Dict[str, Dict[str, Any]], workflow_id: str) -> bool:
+        hashes = [content_hash for content_hash, known_id in index["hashes"].items() if known_id == workflow_id]
+        for content_hash in hashes:
+            del index["hashes"][content_hash]
+        return bool(hashes)
+
+    def _load(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                scopes = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (ValueError, OSError) as e:
+            self.logger.warning(f"Ignoring unreadable workflow index {self.path}: {e}")
+            return {}
+        # 不认识的条目（例如旧格式的名称索引）直接忽略，对应工作流下次会重新上传
+        return {
+            scope: index for scope, index in scopes.items()
+            if isinstance(index, dict) and isinstance(index.get("names"), dict) and isinstance(index.get("hashes"), dict)
+        }
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._scopes, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Failed to write workflow index {self.path}: {e}")
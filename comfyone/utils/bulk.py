@@ -0,0 +1,65 @@
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import (
+    AsyncIterator, Awaitable, Callable, Iterable, Iterator, Tuple, TypeVar, Union
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_END = object()
+
+
+def bounded_map(func: Callable[[T], R], items: Iterable[T], max_concurrency: int,
+                thread_name_prefix: str = "comfyone") -> Iterator[Tuple[T, Union[R, Exception]]]:
+    """
+    在线程池中并发执行func，最多同时运行max_concurrency个任务。
+    items按需惰性读取，结果按完成顺序以(item, 结果或异常)的形式产出。
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be >= 1")
+
+    def call(item):
+        try:
+            return item, func(item)
+        except Exception as e:
+            return item, e
+
+    source = iter(items)
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=thread_name_prefix) as executor:
+        pending = {executor.submit(call, item) for item in itertools.islice(source, max_concurrency)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = next(source, _END)
+                if item is not _END:
+                    pending.add(executor.submit(call, item))
+                yield future.result()
+
+
+async def async_bounded_map(func: Callable[[T], Awaitable[R]], items: Iterable[T],
+                            max_concurrency: int) -> AsyncIterator[Tuple[T, Union[R, Exception]]]:
+    """bounded_map的asyncio版本，使用任务代替线程"""
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be >= 1")
+
+    async def call(item):
+        try:
+            return item, await func(item)
+        except Exception as e:
+            return item, e
+
+    source = iter(items)
+    pending = {asyncio.ensure_future(call(item)) for item in itertools.islice(source, max_concurrency)}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = next(source, _END)
+                if item is not _END:
+                    pending.add(asyncio.ensure_future(call(item)))
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
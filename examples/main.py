@@ -97,13 +97,13 @@ def main():
             print(f"任务 {data['taskId']} 已完成")
             
             if 'images' in status_response.data:
-                try:
-                    # Download to current directory with automatic naming
-                    for url in status_response.data["images"]:
-                        saved_path = client.api.download_file(url)
-                        print(f"结果已下载到: {saved_path}")
-                except Exception as e:
-                    print(f"下载文件失败: {str(e)}")
+                # Download all outputs in parallel to current directory with automatic naming
+                for url, result in zip(status_response.data["images"],
+                                       client.api.download_many(status_response.data["images"], ".")):
+                    if isinstance(result, Exception):
+                        print(f"下载文件失败: {str(result)}")
+                    else:
+                        print(f"结果已下载到: {result}")
 
     def handle_error(data):
         print(f"任务执行出错: {data['data']['message']}")
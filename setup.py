@@ -12,5 +12,10 @@ setup(
         "fastapi>=0.100.0",
         "sqlalchemy>=2.0.0",
     ],
+    extras_require={
+        "async": ["aiohttp>=3.8.0"],
+        "orjson": ["orjson>=3.6.0"],
+        "zstd": ["zstandard>=0.15.0"],
+    },
     python_requires=">=3.7",
 ) 
\ No newline at end of file
@@ -0,0 +1,105 @@
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import pytest
+sys.path.append(str(Path(__file__).parent.parent))
+
+
+class FakeComfyOneServer:
+    """Minimal local HTTP server standing in for pandora-server-cf"""
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.connections = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                if self.headers.get("Transfer-Encoding") == "chunked":
+                    body = b""
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        chunk = self.rfile.read(size + 2)[:size]
+                        if not size:
+                            break
+                        body += chunk
+                else:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = self.rfile.read(length) if length else b""
+                server.connections.add(self.client_address)
+                server.requests.append({
+                    "method": self.command,
+                    "path": self.path,
+                    "headers": dict(self.headers),
+                    "body": body,
+                })
+                route = server.routes.get((self.command, self.path.split("?")[0]))
+                if route is None:
+                    status, headers, payload = 404, {}, {"code": 404, "msg": "not found"}
+                else:
+                    status, headers, payload = route(self, body)
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload).encode()
+                    headers = {"Content-Type": "application/json", **headers}
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                if "Content-Length" not in headers:
+                    self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = do_HEAD = _dispatch
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def route(self, method, path, handler=None, *, status=200, payload=None, headers=None):
+        """Register a handler or a static JSON response for method + path"""
+        if handler is None:
+            static = (status, headers or {}, payload if payload is not None else {"code": 0, "msg": "ok"})
+            handler = lambda request, body: static
+        self.routes[(method, path)] = handler
+
+    def serve_file(self, path, content, *, etag='"v1"', fail=None):
+        """Serve content with Range/If-Range support; fail(request) returning True cuts the body short"""
+        def handler(request, body):
+            headers = {"ETag": etag}
+            byte_range = request.headers.get("Range")
+            if_range = request.headers.get("If-Range")
+            if byte_range is None or (if_range is not None and if_range != etag):
+                return 200, headers, content
+            start, end = byte_range[len("bytes="):].split("-")
+            start, end = int(start), min(int(end or len(content) - 1), len(content) - 1)
+            part = content[start:end + 1]
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+            if fail is not None and fail(request):
+                # advertise the full range but close the connection halfway through
+                request.close_connection = True
+                headers["Content-Length"] = str(len(part))
+                part = part[:len(part) // 2]
+            return 206, headers, part
+        self.route("GET", path, handler)
+        return handler
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    fake = FakeComfyOneServer()
+    yield fake
+    fake.stop()
@@ -0,0 +1,477 @@
+import asyncio
+import gzip
+import json
+import os
+import threading
+import time
+import pytest
+pytest.importorskip("aiohttp")
+from comfyone.api.async_client import AsyncComfyOneClient
+from comfyone.api.cache import ResponseCache
+from comfyone.api.download_cache import DownloadCache
+from comfyone.api.futures import TaskRegistry
+from comfyone.api.websocket.async_websocket import AsyncOneThingAIWebSocket
+from comfyone.api.exceptions import AuthenticationError
+from comfyone.api.models import (
+    PromptPayload, PromptInput, WorkflowPayload, WorkflowInputPayload, WorkflowOutputPayload
+)
+from comfyone.api.retry import RetryPolicy
+from comfyone.api.upload_cache import UploadCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestAsyncComfyOneClient:
+    def test_concurrent_requests_share_pool(self, server):
+        server.route("GET", "/v1/prompts/p1/status", payload={"code": 0, "msg": "ok", "data": {"status": "done"}})
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url, pool_maxsize=2) as client:
+                return await asyncio.gather(*(client.get_prompt_status("p1") for _ in range(20)))
+
+        results = run(main())
+
+        assert all(r.data == {"status": "done"} for r in results)
+        assert len(server.requests) == 20
+        assert len(server.connections) <= 2
+
+    def test_prompt_sends_payload(self, server):
+        server.route("POST", "/v1/prompts", payload={"code": 0, "msg": "ok", "data": {"id": "t1"}})
+        payload = PromptPayload(workflow_id="wf", inputs=[PromptInput(id="5", params={"width": 512})])
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url) as client:
+                return await client.prompt(payload)
+
+        result = run(main())
+
+        assert result.data == {"id": "t1"}
+        assert json.loads(server.requests[0]["body"]) == payload.to_dict()
+
+    def test_upload_file(self, server, tmp_path):
+        server.route("POST", "/v1/files", payload={"code": 0, "msg": "ok", "data": {"name": "a.png"}})
+        path = tmp_path / "a.png"
+        path.write_bytes(b"\x89PNG-data")
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url) as client:
+                return await client.upload_file(str(path))
+
+        assert run(main()).data == {"name": "a.png"}
+        assert b"\x89PNG-data" in server.requests[0]["body"]
+
+    def test_upload_bytes_streams_with_content_length(self, server):
+        server.route("POST", "/v1/files", payload={"code": 0, "msg": "ok", "data": {"name": "blob.bin"}})
+        data = bytes(range(256)) * 2000
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url) as client:
+                return await client.upload_bytes(data, filename="blob.bin")
+
+        assert run(main()).data == {"name": "blob.bin"}
+        request = server.requests[0]
+        assert int(request["headers"]["Content-Length"]) == len(request["body"])
+        assert data in request["body"]
+
+    def test_default_session_has_no_total_timeout(self):
+        async def main():
+            async with AsyncComfyOneClient("k", timeout=7) as client:
+                return client.session.timeout
+
+        timeout = run(main())
+
+        assert timeout.total is None
+        assert timeout.sock_connect == timeout.sock_read == 7
+
+    def test_slow_upload_is_not_capped_by_timeout(self):
+        from aiohttp import web
+        data = bytes(32 * 1024 * 1024)
+
+        async def slow_reader(request):
+            received = 0
+            while True:
+                chunk = await request.content.read(1024 * 1024)
+                if not chunk:
+                    break
+                received += len(chunk)
+                await asyncio.sleep(0.02)
+            return web.json_response({"code": 0, "msg": "ok", "data": {"size": received}})
+
+        async def main():
+            app = web.Application(client_max_size=0)
+            app.router.add_post("/v1/files", slow_reader)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            try:
+                base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+                async with AsyncComfyOneClient("k", base_url, timeout=0.5) as client:
+                    started = time.monotonic()
+                    result = await client.upload_bytes(data)
+                    return result, time.monotonic() - started
+            finally:
+                await runner.cleanup()
+
+        result, elapsed = run(main())
+
+        assert result.data["size"] > len(data)
+        assert elapsed > 0.5
+
+    def test_upload_files_preserves_input_order(self, server, tmp_path):
+        def handler(request, body):
+            filename = body.split(b'filename="')[1].split(b'"')[0].decode()
+            time.sleep(0.05 if filename == "first.png" else 0)
+            return 200, {}, {"code": 0, "msg": "ok", "data": {"name": filename}}
+        server.route("POST", "/v1/files", handler)
+        path = tmp_path / "first.png"
+        path.write_bytes(b"1")
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url) as client:
+                return await client.upload_files(
+                    [str(path), ("second.png", b"2"), str(tmp_path / "missing.png")], max_concurrency=3
+                )
+
+        first, second, missing = run(main())
+
+        assert first.data == {"name": "first.png"}
+        assert second.data == {"name": "second.png"}
+        assert isinstance(missing, FileNotFoundError)
+
+    def test_authentication_error(self, server):
+        server.route("GET", "/v1/backends", status=401)
+
+        async def main():
+            async with AsyncComfyOneClient("bad-key", server.base_url) as client:
+                await client.get_available_backends()
+
+        with pytest.raises(AuthenticationError):
+            run(main())
+
+    def test_prompt_many_bounds_concurrency(self, server):
+        in_flight = {"now": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def handler(request, body):
+            with lock:
+                in_flight["now"] += 1
+                in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            time.sleep(0.02)
+            with lock:
+                in_flight["now"] -= 1
+            return 200, {}, {"code": 0, "msg": "ok", "data": json.loads(body)}
+        server.route("POST", "/v1/prompts", handler)
+        payloads = [PromptPayload(workflow_id=f"wf{i}", inputs=[]) for i in range(12)]
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url) as client:
+                return [item async for item in client.prompt_many(payloads, max_concurrency=4)]
+
+        results = run(main())
+
+        assert len(results) == 12
+        assert all(r.data["workflow_id"] == p.workflow_id for p, r in results)
+        assert in_flight["peak"] <= 4
+
+    def test_upload_cache_coalesces_concurrent_uploads(self, server, tmp_path):
+        def handler(request, body):
+            time.sleep(0.05)
+            return 200, {}, {"code": 0, "msg": "ok", "data": {"name": "ref.png"}}
+        server.route("POST", "/v1/files", handler)
+        path = tmp_path / "a.png"
+        path.write_bytes(b"same-bytes")
+
+        async def main():
+            async with AsyncComfyOneClient("k", server.base_url, upload_cache=UploadCache()) as client:
+                first = await asyncio.gather(*(client.upload_file(str(path)) for _ in range(5)))
+                again = await client.upload_file(str(path))
+                return first + [again]
+
+        results = run(main())
+
+        assert all(r.data == {"name": "ref.png"} for r in results)
+        assert len(server.requests) == 1
+
+    def test_download_file_parallel_ranges_with_resume(self, server, tmp_path):
+        content = bytes(range(256)) * 4096
+        failed = []
+
+        def fail(request):
+            if not failed and request.headers["Range"].startswith("bytes=262144-"):
+                failed.append(True)
+                return True
+            return False
+        server.serve_file("/files/video.mp4", content, fail=fail)
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url,
+                                           retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01)) as client:
+                return await client.download_file(f"{server.base_url}/files/video.mp4", str(tmp_path),
+                                                  segment_size=256 * 1024)
+
+        path = run(main())
+
+        assert open(path, "rb").read() == content
+        starts = [int(r["headers"]["Range"][len("bytes="):].split("-")[0]) for r in server.requests]
+        assert starts.count(262144) == 1
+        assert len(starts) == 5 and any(262144 < start < 524288 for start in starts)
+        assert os.listdir(tmp_path) == ["video.mp4"]
+
+    def test_empty_range_response_is_released(self, server, tmp_path):
+        server.route("GET", "/files/empty.png", status=206, headers={"Content-Range": "bytes 0-0/0"}, payload=b"")
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url) as client:
+                for _ in range(3):
+                    path = await client.download_file(f"{server.base_url}/files/empty.png", str(tmp_path))
+                return path
+
+        assert open(run(main()), "rb").read() == b""
+        assert len(server.connections) == 1
+
+    def test_in_memory_downloads(self, server):
+        content = bytes(range(256)) * 1024
+        server.serve_file("/files/out.png", content)
+        url = f"{server.base_url}/files/out.png"
+        buffer = bytearray(len(content))
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url) as client:
+                view = await client.download_to_buffer(url, buffer)
+                chunks = [chunk async for chunk in client.iter_download(url, chunk_size=8192)]
+                return view, chunks
+
+        view, chunks = run(main())
+
+        assert view.obj is buffer and bytes(view) == content
+        assert b"".join(chunks) == content
+
+    def test_buffer_download_resumes_into_preallocated_buffer(self, server):
+        content = bytes(range(256)) * 1024
+        handler = server.serve_file("/files/out.png", content)
+
+        def cut_first(request, body):
+            if "Range" in request.headers:
+                return handler(request, body)
+            request.close_connection = True
+            return 200, {"ETag": '"v1"', "Content-Length": str(len(content))}, content[:100000]
+        server.route("GET", "/files/out.png", cut_first)
+        url = f"{server.base_url}/files/out.png"
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url,
+                                           retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01)) as client:
+                view = await client.download_to_buffer(url)
+                with pytest.raises(ValueError):
+                    await client.download_to_buffer(f"{server.base_url}/files/other.png", bytearray(10))
+                return view
+
+        server.serve_file("/files/other.png", content)
+        assert bytes(run(main())) == content
+        assert "Range" in server.requests[1]["headers"]
+
+    def test_download_many_uses_cache(self, server, tmp_path):
+        server.serve_file("/files/a.png", b"image-a")
+        server.serve_file("/files/b.png", b"image-b")
+        urls = [f"{server.base_url}/files/a.png", f"{server.base_url}/files/b.png"]
+        cache = DownloadCache(str(tmp_path / "cache"))
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url, download_cache=cache) as client:
+                first = await client.download_many(urls, str(tmp_path / "out"))
+                second = await client.download_many(list(reversed(urls)))
+                return first, second
+
+        first, second = run(main())
+
+        assert [open(p, "rb").read() for p in first] == [b"image-a", b"image-b"]
+        assert [open(p, "rb").read() for p in second] == [b"image-b", b"image-a"]
+        assert len(server.requests) == 2
+
+    def test_compressed_canonical_workflow_upload(self, server):
+        server.route("POST", "/v1/workflows", lambda request, body: (
+            200, {}, {"code": 0, "msg": "ok", "data": json.loads(gzip.decompress(body))}))
+        graph = {str(i): {"class_type": "CLIPTextEncode", "_meta": {"title": "Prompt"},
+                          "inputs": {"text": "a cat " * 20, "speak_and_recognation": True}} for i in range(20)}
+        payload = WorkflowPayload(
+            name="wf", inputs=WorkflowInputPayload(inputs=[]), outputs=WorkflowOutputPayload(outputs=[]),
+            workflow=graph
+        )
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url, compression="gzip") as client:
+                return await client.create_workflow(payload)
+
+        result = run(main())
+
+        assert result.data["workflow"]["0"] == {"class_type": "CLIPTextEncode", "inputs": {"text": "a cat " * 20}}
+        assert server.requests[0]["headers"]["Content-Encoding"] == "gzip"
+
+    def test_update_workflow_patches_cached_server_version(self, server):
+        graph = {str(i): {"class_type": "CLIPTextEncode", "inputs": {"text": "a cat " * 20}} for i in range(20)}
+
+        def payload():
+            return WorkflowPayload(
+                name="wf", inputs=WorkflowInputPayload(inputs=[]), outputs=WorkflowOutputPayload(outputs=[]),
+                workflow=graph
+            )
+        server.route("GET", "/v1/workflows/wf1", headers={"ETag": '"v1"'},
+                     payload={"code": 0, "msg": "ok", "data": {"id": "wf1", **payload().to_dict()}})
+        server.route("PATCH", "/v1/workflows/wf1", payload={"code": 0, "msg": "ok"})
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url, cache=ResponseCache()) as client:
+                await client.get_workflow("wf1")
+                graph["3"]["inputs"]["text"] = "a dog"
+                await client.update_workflow("wf1", payload())
+                return client.get_workflow_update_stats()
+
+        stats = run(main())
+
+        assert json.loads(server.requests[1]["body"]) == [
+            {"op": "replace", "path": "/workflow/3/inputs/text", "value": "a dog"}
+        ]
+        assert server.requests[1]["headers"]["Content-Type"] == "application/json-patch+json"
+        assert server.requests[1]["headers"]["If-Match"] == '"v1"'
+        assert stats["patched"] == 1 and stats["bytes_saved"] > 0
+
+    def test_expired_entry_revalidates_with_etag(self, server):
+        def handler(request, body):
+            if request.headers.get("If-None-Match") == '"v1"':
+                return 304, {"ETag": '"v1"'}, b""
+            return 200, {"ETag": '"v1"'}, {"code": 0, "msg": "ok", "data": [{"id": "wf1"}]}
+        server.route("GET", "/v1/workflows", handler)
+        cache = ResponseCache(ttls={"workflows": 0}, stale_while_revalidate=0)
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url, cache=cache) as client:
+                await client.get_workflows()
+                return await client.get_workflows()
+
+        result = run(main())
+
+        assert result.data == [{"id": "wf1"}]
+        assert server.requests[1]["headers"]["If-None-Match"] == '"v1"'
+
+    def test_submit_returns_awaitable_future(self, server):
+        server.route("POST", "/v1/prompts", payload={"code": 0, "msg": "ok", "data": {"id": "t1"}})
+        payload = PromptPayload(workflow_id="wf", inputs=[PromptInput(id="5", params={"width": 512})])
+
+        async def main():
+            async with AsyncComfyOneClient("test-key", server.base_url) as client:
+                future = await client.submit(payload)
+                # WebSocket事件在其他线程中完成future
+                threading.Timer(0.05, client.tasks.dispatch,
+                                args=({"type": "finished", "taskId": "t1", "data": {"success": True}},)).start()
+                return await asyncio.wait_for(future, 1)
+
+        assert run(main())["taskId"] == "t1"
+
+
+class FakeWebSocketServer:
+    """在测试事件循环中运行的WebSocket服务端，认证后发送预设的事件"""
+    def __init__(self, events):
+        self.events = events
+        self.received = []
+        self.headers = []
+
+    async def handler(self, request):
+        from aiohttp import web
+        self.headers.append(dict(request.headers))
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.received.append(json.loads((await ws.receive()).data))
+        for event in self.events:
+            await ws.send_str(json.dumps(event))
+        await ws.receive()  # 等待客户端关闭
+        return ws
+
+    async def __aenter__(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get("/v1/ws", self.handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"ws://127.0.0.1:{port}/v1/ws"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
+
+
+def progress_events(task_id, count):
+    events = [{"type": "progress", "taskId": task_id, "data": {"process": i}} for i in range(count)]
+    return events + [{"type": "finished", "taskId": task_id, "data": {"success": True}}]
+
+
+class TestAsyncWebSocket:
+    def test_auth_and_task_event_stream(self):
+        events = progress_events("t2", 3) + progress_events("t1", 3)
+
+        async def main():
+            async with FakeWebSocketServer(events) as server:
+                tasks = TaskRegistry()
+                future = tasks.register("t2")
+                async with AsyncOneThingAIWebSocket("token", url=server.url, tasks=tasks) as ws:
+                    stream = ws.events(task_id="t1")
+                    received = [event async for event in stream]
+                    result = await asyncio.wait_for(future, 1)
+                return server, received, result
+
+        server, received, result = run(main())
+
+        assert server.received == [{"type": "auth", "token": "token"}]
+        assert server.headers[0]["Authorization"] == "Bearer token"
+        assert [e["type"] for e in received] == ["progress"] * 3 + ["finished"]
+        assert all(e["taskId"] == "t1" for e in received)
+        assert result["taskId"] == "t2"
+
+    def test_bounded_queue_applies_backpressure(self):
+        events = progress_events("t1", 50)
+
+        async def main():
+            async with FakeWebSocketServer(events) as server:
+                async with AsyncOneThingAIWebSocket("token", url=server.url) as ws:
+                    stream = ws.events(types=["progress"], max_queue=5)
+                    await ws.wait_connected(1)
+                    await asyncio.sleep(0.1)
+                    queued = stream._queue.qsize()
+                    received = []
+                    async for event in stream:
+                        received.append(event["data"]["process"])
+                        if len(received) == 50:
+                            break
+                return queued, received
+
+        queued, received = run(main())
+
+        assert queued == 5
+        assert received == list(range(50))
+
+    def test_closing_full_stream_releases_reader(self):
+        async def main():
+            ws = AsyncOneThingAIWebSocket("token")
+            stream = ws.events(max_queue=1)
+            other = ws.events(task_id="t2")
+            message = json.dumps({"type": "progress", "taskId": "t1", "data": {}})
+
+            async def read():
+                for _ in range(3):
+                    await ws._on_message(message)
+
+            reader = asyncio.ensure_future(read())
+            await asyncio.sleep(0.05)
+            async with stream:
+                async for _ in stream:
+                    break
+            await asyncio.wait_for(reader, 1)
+            await ws._on_message(json.dumps({"type": "finished", "taskId": "t2", "data": {}}))
+            return [event async for event in other]
+
+        assert [e["type"] for e in run(main())] == ["finished"]
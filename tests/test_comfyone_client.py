@@ -0,0 +1,1348 @@
+import copy
+import gzip
+import io
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from unittest.mock import patch
+import pytest
+from pydantic import BaseModel
+from comfyone.api.cache import ResponseCache
+from comfyone.api.codec import JSONCodec, get_codec
+from comfyone.api.comfyone_client import ComfyOneClient
+from comfyone.api.download import DownloadState
+from comfyone.api.download_cache import DownloadCache
+from comfyone.api import json_patch
+from comfyone.api.exceptions import APIError, ConnectionError, PromptFailedError, ValidationError
+from comfyone.api.models import (
+    APIResponse, PromptInput, PromptPayload, WorkflowPayload, WorkflowInputPayload, WorkflowInput,
+    WorkflowOutputPayload, WorkflowOutput, IOType
+)
+from comfyone.api.futures import TaskRegistry
+from comfyone.api.multipart import MultipartStream
+from comfyone.api.poller import StatusPoller, _PollState, status_event
+from comfyone.api.prompt_template import PromptTemplate
+from comfyone.api.retry import RetryPolicy
+from comfyone.api.upload_cache import UploadCache
+from comfyone.api.workflow_registry import WorkflowRegistry, canonicalize_workflow, workflow_hash
+from comfyone.api.transport import PooledTransport
+from comfyone.api.websocket.websocket_client import OneThingAIWebSocket
+from comfyone.api.websocket.dispatcher import EventDispatcher
+from comfyone.api.websocket.router import EventRouter
+
+
+@pytest.fixture
+def client(server):
+    client = ComfyOneClient("test-key", server.base_url, max_retries=1)
+    yield client
+    client.close()
+
+
+def make_prompt(workflow_id="wf"):
+    return PromptPayload(workflow_id=workflow_id, inputs=[PromptInput(id="5", params={"width": 512})])
+
+
+def make_workflow(graph=None, name="test"):
+    return WorkflowPayload(
+        name=name,
+        inputs=WorkflowInputPayload(inputs=[WorkflowInput(id="5", type=IOType.NUMBER, name="width")]),
+        outputs=WorkflowOutputPayload(outputs=[WorkflowOutput(id="9")]),
+        workflow=graph if graph is not None else {"1": {"class_type": "KSampler", "inputs": {"seed": 1}}}
+    )
+
+
+class TestPooledTransport:
+    def test_requests_reuse_one_connection(self, server, client):
+        server.route("GET", "/v1/backends", payload={"code": 0, "msg": "ok", "data": []})
+
+        for _ in range(5):
+            assert client.get_available_backends().code == 0
+
+        assert len(server.requests) == 5
+        assert len(server.connections) == 1
+        assert server.requests[0]["headers"]["Authorization"] == "Bearer test-key"
+
+    def test_idle_connections_are_evicted(self, server):
+        server.route("GET", "/v1/backends", payload={"code": 0, "msg": "ok", "data": []})
+        transport = PooledTransport(idle_timeout=0.05)
+        with ComfyOneClient("test-key", server.base_url, transport=transport) as client:
+            client.get_available_backends()
+            time.sleep(0.1)
+            client.get_available_backends()
+
+        assert len(server.connections) == 2
+
+    def test_busy_connection_does_not_keep_stale_ones(self, server):
+        def slow(request, body):
+            time.sleep(0.05)
+            return 200, {}, {"code": 0, "msg": "ok", "data": []}
+        server.route("GET", "/v1/backends", slow)
+        server.route("GET", "/v1/workflows", payload={"code": 0, "msg": "ok", "data": []})
+
+        with ComfyOneClient("k", server.base_url, transport=PooledTransport(idle_timeout=0.15)) as client:
+            with ThreadPoolExecutor(2) as pool:
+                list(pool.map(lambda _: client.get_available_backends(), range(2)))
+            assert len(server.connections) == 2
+            # 一个连接持续使用，另一个连接空闲过期
+            for _ in range(10):
+                client.get_workflows()
+                time.sleep(0.03)
+            with ThreadPoolExecutor(2) as pool:
+                list(pool.map(lambda _: client.get_available_backends(), range(2)))
+
+        assert len(server.connections) == 3
+
+    def test_shared_transport_is_not_closed_by_client(self, server):
+        server.route("GET", "/v1/backends", payload={"code": 0, "msg": "ok", "data": []})
+        transport = PooledTransport()
+
+        with ComfyOneClient("k", server.base_url, transport=transport):
+            pass
+        with ComfyOneClient("k", server.base_url, transport=transport) as client:
+            assert client.get_available_backends().code == 0
+
+        assert not transport.closed
+        transport.close()
+
+    def test_closed_client_rejects_requests(self, server, client):
+        client.close()
+
+        with pytest.raises(ConnectionError):
+            client.get_available_backends()
+        assert client.transport.closed
+
+
+class TestPromptMany:
+    def test_results_stream_back_with_errors(self, server, client):
+        def handler(request, body):
+            payload = json.loads(body)
+            if payload["workflow_id"] == "bad":
+                return 400, {}, {"code": 400, "msg": "bad workflow"}
+            time.sleep(0.05)
+            return 200, {}, {"code": 0, "msg": "ok", "data": {"id": payload["workflow_id"]}}
+        server.route("POST", "/v1/prompts", handler)
+        payloads = [make_prompt(f"wf{i}") for i in range(8)] + [make_prompt("bad")]
+
+        started = time.monotonic()
+        results = list(client.prompt_many(payloads, max_concurrency=8))
+        elapsed = time.monotonic() - started
+
+        assert len(results) == 9
+        assert {p.workflow_id for p, _ in results} == {p.workflow_id for p in payloads}
+        errors = [r for _, r in results if isinstance(r, Exception)]
+        assert len(errors) == 1 and isinstance(errors[0], APIError)
+        assert all(r.data["id"] == p.workflow_id for p, r in results if not isinstance(r, Exception))
+        assert elapsed < 0.05 * 8
+
+    def test_payloads_are_consumed_lazily(self, server, client):
+        server.route("POST", "/v1/prompts", payload={"code": 0, "msg": "ok"})
+        consumed = []
+
+        def payloads():
+            for i in range(10):
+                consumed.append(i)
+                yield make_prompt(f"wf{i}")
+
+        results = client.prompt_many(payloads(), max_concurrency=2)
+        next(results)
+
+        assert len(consumed) <= 3
+        results.close()
+
+
+class TestResponseCache:
+    def test_fresh_hits_skip_network(self, server):
+        server.route("GET", "/v1/workflows/wf1", payload={"code": 0, "msg": "ok", "data": {"id": "wf1"}})
+
+        with ComfyOneClient("k", server.base_url, cache=ResponseCache()) as client:
+            first = client.get_workflow("wf1")
+            first.data["id"] = "mutated"
+            second = client.get_workflow("wf1")
+
+        assert second.data == {"id": "wf1"}
+        assert len(server.requests) == 1
+
+    def test_expired_entry_revalidates_with_etag(self, server):
+        def handler(request, body):
+            if request.headers.get("If-None-Match") == '"v1"':
+                return 304, {"ETag": '"v1"'}, b""
+            return 200, {"ETag": '"v1"'}, {"code": 0, "msg": "ok", "data": [{"id": "wf1"}]}
+        server.route("GET", "/v1/workflows", handler)
+        cache = ResponseCache(ttls={"workflows": 0}, stale_while_revalidate=0)
+
+        with ComfyOneClient("k", server.base_url, cache=cache) as client:
+            client.get_workflows()
+            result = client.get_workflows()
+
+        assert result.data == [{"id": "wf1"}]
+        assert server.requests[1]["headers"]["If-None-Match"] == '"v1"'
+
+    def test_stale_entry_is_served_while_refreshing(self, server):
+        versions = iter(["old", "new"])
+        server.route("GET", "/v1/backends/b1",
+                     lambda request, body: (200, {}, {"code": 0, "msg": "ok", "data": {"v": next(versions)}}))
+        cache = ResponseCache(ttls={"backends": 0}, stale_while_revalidate=60)
+
+        with ComfyOneClient("k", server.base_url, cache=cache) as client:
+            client.get_backend("b1")
+            assert client.get_backend("b1").data == {"v": "old"}
+            deadline = time.monotonic() + 2
+            while cache.lookup("v1/backends/b1")[0].data["data"]["v"] != "new" and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        assert cache.lookup("v1/backends/b1")[0].data["data"] == {"v": "new"}
+
+    def test_refresh_does_not_overwrite_invalidation(self, server):
+        refresh_started, release = threading.Event(), threading.Event()
+        versions = iter(["old", "stale"])
+
+        def handler(request, body):
+            version = next(versions)
+            if version == "stale":
+                refresh_started.set()
+                release.wait(5)
+            return 200, {}, {"code": 0, "msg": "ok", "data": {"v": version}}
+        server.route("GET", "/v1/backends/b1", handler)
+        cache = ResponseCache(ttls={"backends": 0}, stale_while_revalidate=60)
+
+        with ComfyOneClient("k", server.base_url, cache=cache) as client:
+            client.get_backend("b1")
+            client.get_backend("b1")
+            assert refresh_started.wait(5)
+            cache.invalidate("v1/backends/b1")
+            release.set()
+            deadline = time.monotonic() + 2
+            while not cache.begin_refresh("v1/backends/b1") and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        assert cache.lookup("v1/backends/b1") == (None, ResponseCache.MISS)
+
+    def test_clear_only_removes_own_files(self, tmp_path):
+        other = tmp_path / "settings.json"
+        other.write_text("{}")
+        cache = ResponseCache(disk_path=str(tmp_path))
+        cache.store("v1/workflows/a", {"code": 0})
+        cache.clear()
+
+        assert [p.name for p in tmp_path.iterdir()] == ["settings.json"]
+        assert cache.lookup("v1/workflows/a") == (None, ResponseCache.MISS)
+
+    def test_writes_invalidate_related_entries(self, server):
+        server.route("GET", "/v1/workflows", payload={"code": 0, "msg": "ok", "data": []})
+        server.route("GET", "/v1/workflows/wf1", payload={"code": 0, "msg": "ok", "data": {"id": "wf1"}})
+        server.route("GET", "/v1/workflows/wf2", payload={"code": 0, "msg": "ok", "data": {"id": "wf2"}})
+        server.route("DELETE", "/v1/workflows/wf1", payload={"code": 0, "msg": "ok"})
+
+        with ComfyOneClient("k", server.base_url, cache=ResponseCache()) as client:
+            client.get_workflows()
+            client.get_workflow("wf1")
+            client.get_workflow("wf2")
+            client.delete_workflow("wf1")
+            for _ in range(2):
+                client.get_workflows()
+                client.get_workflow("wf1")
+                client.get_workflow("wf2")
+
+        gets = [r["path"] for r in server.requests if r["method"] == "GET"]
+        assert gets.count("/v1/workflows") == 2
+        assert gets.count("/v1/workflows/wf1") == 2
+        assert gets.count("/v1/workflows/wf2") == 1
+
+    def test_disk_tier_survives_restart(self, server, tmp_path):
+        server.route("GET", "/v1/workflows/wf1", payload={"code": 0, "msg": "ok", "data": {"id": "wf1"}})
+
+        with ComfyOneClient("k", server.base_url, cache=ResponseCache(disk_path=str(tmp_path))) as client:
+            client.get_workflow("wf1")
+        with ComfyOneClient("k", server.base_url, cache=ResponseCache(disk_path=str(tmp_path))) as client:
+            assert client.get_workflow("wf1").data == {"id": "wf1"}
+
+        assert len(server.requests) == 1
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2)
+        for key in ("v1/workflows/a", "v1/workflows/b", "v1/workflows/c"):
+            cache.store(key, {"code": 0})
+
+        assert cache.lookup("v1/workflows/a")[1] == ResponseCache.MISS
+        assert cache.lookup("v1/workflows/c")[1] == ResponseCache.FRESH
+
+
+class TestEnsureWorkflow:
+    @pytest.fixture
+    def workflow_server(self, server):
+        created = iter(["wf1", "wf2"])
+        server.route("POST", "/v1/workflows",
+                     lambda request, body: (200, {}, {"code": 0, "msg": "ok", "data": {"id": next(created)}}))
+        server.route("PATCH", "/v1/workflows/wf1", payload={"code": 0, "msg": "ok"})
+        return server
+
+    def test_unchanged_workflow_is_not_uploaded_again(self, workflow_server, tmp_path):
+        index = str(tmp_path / "workflows.json")
+        with ComfyOneClient("k", workflow_server.base_url, workflow_registry=WorkflowRegistry(index)) as client:
+            assert client.ensure_workflow(make_workflow()) == "wf1"
+        with ComfyOneClient("k", workflow_server.base_url, workflow_registry=WorkflowRegistry(index)) as client:
+            assert client.ensure_workflow(make_workflow()) == "wf1"
+
+        assert len(workflow_server.requests) == 1
+
+    def test_index_is_scoped_to_server_and_account(self, workflow_server, tmp_path):
+        registry = WorkflowRegistry(str(tmp_path / "workflows.json"))
+        with ComfyOneClient("k", workflow_server.base_url, workflow_registry=registry) as client:
+            assert client.ensure_workflow(make_workflow()) == "wf1"
+        # 另一个账号看不到这个工作流，需要自己创建
+        with ComfyOneClient("other-key", workflow_server.base_url, workflow_registry=registry) as client:
+            assert client.ensure_workflow(make_workflow()) == "wf2"
+        with ComfyOneClient("k", workflow_server.base_url + "/", workflow_registry=registry) as client:
+            assert client.ensure_workflow(make_workflow()) == "wf1"
+
+        assert [r["method"] for r in workflow_server.requests] == ["POST", "POST"]
+        assert "other-key" not in (tmp_path / "workflows.json").read_text()
+
+    def test_same_content_under_another_name_is_reused(self, workflow_server, client):
+        assert client.ensure_workflow(make_workflow(name="a")) == "wf1"
+        assert client.ensure_workflow(make_workflow(name="b")) == "wf1"
+
+        assert len(workflow_server.requests) == 1
+        assert client.workflow_registry.lookup(client.scope, "b")["workflow_id"] == "wf1"
+
+    def test_hash_ignores_key_order(self):
+        a = make_workflow({"1": {"class_type": "A", "inputs": {"x": 1, "y": 2}}})
+        b = make_workflow({"1": {"inputs": {"y": 2, "x": 1}, "class_type": "A"}})
+
+        assert workflow_hash(a) == workflow_hash(b)
+        assert workflow_hash(a) != workflow_hash(make_workflow({"1": {"class_type": "B"}}))
+
+    def test_changed_workflow_is_updated(self, workflow_server, client):
+        client.ensure_workflow(make_workflow())
+        workflow_id = client.ensure_workflow(make_workflow({"1": {"class_type": "Changed"}}))
+
+        assert workflow_id == "wf1"
+        update = workflow_server.requests[-1]
+        assert (update["method"], update["path"]) == ("PATCH", "/v1/workflows/wf1")
+        # 没有缓存的服务端版本，发送完整工作流
+        assert json.loads(update["body"]) == make_workflow({"1": {"class_type": "Changed"}}).to_dict()
+
+    def test_deleted_workflow_is_recreated(self, workflow_server, client):
+        workflow_server.route("PATCH", "/v1/workflows/wf1", status=404, payload={"code": 404, "msg": "gone"})
+        client.ensure_workflow(make_workflow())
+
+        assert client.ensure_workflow(make_workflow({"1": {"class_type": "Changed"}})) == "wf2"
+
+
+    def test_failed_update_is_not_recreated(self, workflow_server, client):
+        workflow_server.route("PATCH", "/v1/workflows/wf1", payload={"code": 1001, "msg": "invalid workflow"})
+        client.ensure_workflow(make_workflow())
+
+        with pytest.raises(APIError) as excinfo:
+            client.ensure_workflow(make_workflow({"1": {"class_type": "Changed"}}))
+
+        assert excinfo.value.code == 1001
+        # 更新失败后不会再创建同名工作流
+        assert [r["method"] for r in workflow_server.requests] == ["POST", "PATCH"]
+        assert client.workflow_registry.lookup(client.scope, "test")["workflow_id"] == "wf1"
+
+class TestUploadCache:
+    def test_same_content_is_uploaded_once(self, server, tmp_path):
+        server.route("POST", "/v1/files", payload={"code": 0, "msg": "ok", "data": {"name": "ref.png"}})
+        first, second = tmp_path / "a.png", tmp_path / "b.png"
+        first.write_bytes(b"same-bytes")
+        second.write_bytes(b"same-bytes")
+        cache_file = str(tmp_path / "uploads.json")
+
+        with ComfyOneClient("k", server.base_url, upload_cache=UploadCache(path=cache_file)) as client:
+            assert client.upload_file(str(first)).data == {"name": "ref.png"}
+            assert client.upload_file(str(second)).data == {"name": "ref.png"}
+        with ComfyOneClient("k", server.base_url, upload_cache=UploadCache(path=cache_file)) as client:
+            client.upload_file(str(first))
+
+        assert len(server.requests) == 1
+
+    def test_references_are_scoped_to_server_and_account(self, server, tmp_path):
+        server.route("POST", "/v1/files", payload={"code": 0, "msg": "ok", "data": {"name": "ref.png"}})
+        path = tmp_path / "a.png"
+        path.write_bytes(b"same-bytes")
+        cache = UploadCache()
+
+        for api_key in ("k", "other-key", "k"):
+            with ComfyOneClient(api_key, server.base_url, upload_cache=cache) as client:
+                client.upload_file(str(path))
+        with ComfyOneClient("k", server.base_url.replace("127.0.0.1", "localhost"), upload_cache=cache) as client:
+            client.upload_file(str(path))
+
+        assert len(server.requests) == 3
+        assert len(cache) == 3
+
+    def test_concurrent_uploads_are_coalesced(self, server, tmp_path):
+        def handler(request, body):
+            time.sleep(0.1)
+            return 200, {}, {"code": 0, "msg": "ok", "data": {"name": "ref.png"}}
+        server.route("POST", "/v1/files", handler)
+        path = tmp_path / "a.png"
+        path.write_bytes(b"x" * 100000)
+
+        with ComfyOneClient("k", server.base_url, upload_cache=UploadCache()) as client:
+            with ThreadPoolExecutor(4) as pool:
+                results = list(pool.map(lambda _: client.upload_file(str(path)), range(4)))
+
+        assert all(r.data == {"name": "ref.png"} for r in results)
+        assert len(server.requests) == 1
+
+    def test_failed_uploads_are_not_cached(self, server, tmp_path):
+        server.route("POST", "/v1/files", status=400, payload={"code": 400, "msg": "bad file"})
+        path = tmp_path / "a.png"
+        path.write_bytes(b"data")
+        cache = UploadCache()
+
+        with ComfyOneClient("k", server.base_url, upload_cache=cache) as client:
+            for _ in range(2):
+                with pytest.raises(APIError):
+                    client.upload_file(str(path))
+
+        assert len(cache) == 0
+        assert len(server.requests) == 2
+
+    def test_lru_and_ttl(self):
+        cache = UploadCache(max_entries=2, ttl=60)
+        for digest in ("a", "b", "c"):
+            cache.put(digest, {"code": 0})
+
+        assert cache.get("a") is None
+        assert cache.get("c") == {"code": 0}
+        assert UploadCache(ttl=-1).get("c") is None
+
+
+def multipart_file(request):
+    """Extract (filename, content) of the single file part of a multipart request"""
+    boundary = request["headers"]["Content-Type"].split("boundary=")[1].encode()
+    part = request["body"].split(b"--" + boundary)[1]
+    headers, content = part.split(b"\r\n\r\n", 1)
+    filename = headers.split(b'filename="')[1].split(b'"')[0].decode()
+    return filename, content[:-2]
+
+
+class TestStreamingUpload:
+    @pytest.fixture
+    def upload_server(self, server):
+        server.route("POST", "/v1/files", payload={"code": 0, "msg": "ok", "data": {"name": "ref"}})
+        return server
+
+    def test_upload_bytes_and_mmap(self, upload_server, client, tmp_path):
+        client.upload_bytes(b"in-memory", filename="frame.png")
+        path = tmp_path / "video.bin"
+        path.write_bytes(b"m" * 300000)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            client.upload_bytes(mapped, filename="video.bin")
+
+        first, second = upload_server.requests
+        assert multipart_file(first) == ("frame.png", b"in-memory")
+        assert multipart_file(second) == ("video.bin", b"m" * 300000)
+        assert int(second["headers"]["Content-Length"]) == len(second["body"])
+
+    def test_upload_fileobj_from_current_position(self, upload_server, client):
+        buffer = io.BytesIO(b"skip:payload")
+        buffer.seek(5)
+        client.upload_fileobj(buffer, filename="part.txt")
+
+        assert multipart_file(upload_server.requests[0]) == ("part.txt", b"payload")
+
+    def test_non_seekable_source_uses_chunked_encoding(self, upload_server, client):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b"streamed")
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb", buffering=0) as pipe:
+            client.upload_fileobj(pipe, filename="pipe.bin")
+
+        request = upload_server.requests[0]
+        assert request["headers"]["Transfer-Encoding"] == "chunked"
+        assert multipart_file(request) == ("pipe.bin", b"streamed")
+
+    def test_upload_file_closes_handle_on_error(self, server, tmp_path):
+        server.route("POST", "/v1/files", status=400, payload={"code": 400, "msg": "bad"})
+        path = tmp_path / "a.png"
+        path.write_bytes(b"data")
+        opened = []
+        original_init = MultipartStream.__init__
+
+        def tracking_init(stream, *args, **kwargs):
+            original_init(stream, *args, **kwargs)
+            opened.append(stream)
+
+        with ComfyOneClient("k", server.base_url) as client, \
+                patch.object(MultipartStream, "__init__", tracking_init):
+            with pytest.raises(APIError):
+                client.upload_file(str(path))
+
+        assert opened[0]._file.closed
+
+    def test_retry_rewinds_stream(self, server, tmp_path):
+        calls = []
+
+        def handler(request, body):
+            calls.append(body)
+            if len(calls) == 1:
+                return 503, {"Retry-After": "0"}, {"code": 503, "msg": "busy"}
+            return 200, {}, {"code": 0, "msg": "ok"}
+        server.route("POST", "/v1/files", handler)
+        path = tmp_path / "a.png"
+        path.write_bytes(b"retry-me")
+
+        with ComfyOneClient("k", server.base_url,
+                            retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01)) as client:
+            client.upload_file(str(path))
+
+        assert calls[0] == calls[1]
+        assert b"retry-me" in calls[1]
+
+
+class TestUploadFiles:
+    def test_results_in_input_order_with_per_file_errors(self, server, client, tmp_path):
+        def handler(request, body):
+            filename = body.split(b'filename="')[1].split(b'"')[0].decode()
+            # earlier inputs finish later, results must still follow input order
+            time.sleep({"a.png": 0.1, "b.png": 0.05}.get(filename, 0))
+            return 200, {}, {"code": 0, "msg": "ok", "data": {"name": filename}}
+        server.route("POST", "/v1/files", handler)
+        path = tmp_path / "a.png"
+        path.write_bytes(b"a")
+
+        results = client.upload_files(
+            [str(path), ("b.png", b"b"), str(tmp_path / "missing.png"), io.BytesIO(b"c")],
+            max_concurrency=4,
+        )
+
+        assert results[0].data == {"name": "a.png"}
+        assert results[1].data == {"name": "b.png"}
+        assert isinstance(results[2], FileNotFoundError)
+        assert results[3].data == {"name": "upload.bin"}
+
+    def test_uploads_run_in_parallel(self, server, client):
+        def handler(request, body):
+            time.sleep(0.2)
+            return 200, {}, {"code": 0, "msg": "ok", "data": {}}
+        server.route("POST", "/v1/files", handler)
+
+        started = time.monotonic()
+        results = client.upload_files([(f"{i}.png", b"x") for i in range(4)], max_concurrency=4)
+
+        assert len(results) == 4
+        assert time.monotonic() - started < 0.6
+
+
+def range_starts(server):
+    return [int(r["headers"]["Range"][len("bytes="):].split("-")[0])
+            for r in server.requests if "Range" in r["headers"]]
+
+
+class TestDownloadFile:
+    content = bytes(range(256)) * 4096  # 1 MiB
+
+    def test_save_path_directory_and_file(self, server, client, tmp_path):
+        server.serve_file("/files/out.png", b"png")
+
+        saved = client.download_file(f"{server.base_url}/files/out.png", str(tmp_path))
+        renamed = client.download_file(f"{server.base_url}/files/out.png", str(tmp_path / "copy.png"))
+
+        assert saved == str(tmp_path / "out.png")
+        assert renamed == str(tmp_path / "copy.png")
+        assert (tmp_path / "out.png").read_bytes() == b"png"
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["copy.png", "out.png"]
+
+    def test_empty_range_response_is_released(self, server, client, tmp_path):
+        server.route("GET", "/files/empty.png", status=206, headers={"Content-Range": "bytes 0-0/0"}, payload=b"")
+
+        for _ in range(3):
+            path = client.download_file(f"{server.base_url}/files/empty.png", str(tmp_path))
+
+        assert open(path, "rb").read() == b""
+        # 没有需要下载的分段时，第一个响应也要归还连接
+        assert len(server.connections) == 1
+
+    def test_parallel_ranges(self, server, client, tmp_path):
+        server.serve_file("/files/video.mp4", self.content)
+
+        path = client.download_file(f"{server.base_url}/files/video.mp4", str(tmp_path),
+                                    max_connections=4, segment_size=256 * 1024)
+
+        assert open(path, "rb").read() == self.content
+        assert sorted(range_starts(server)) == [0, 262144, 524288, 786432]
+        assert os.listdir(tmp_path) == ["video.mp4"]
+
+    def test_interrupted_range_resumes_from_written_offset(self, server, tmp_path):
+        failed = []
+
+        def fail(request):
+            if not failed and request.headers["Range"].startswith("bytes=524288-"):
+                failed.append(True)
+                return True
+            return False
+        server.serve_file("/files/video.mp4", self.content, fail=fail)
+
+        with ComfyOneClient("k", server.base_url,
+                            retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01)) as client:
+            path = client.download_file(f"{server.base_url}/files/video.mp4", str(tmp_path),
+                                        segment_size=512 * 1024)
+
+        assert open(path, "rb").read() == self.content
+        starts = range_starts(server)
+        assert starts.count(524288) == 1
+        assert len(starts) == 3 and starts[-1] > 524288
+
+    def test_without_range_support(self, server, client, tmp_path):
+        server.route("GET", "/files/out.bin", payload=self.content)
+
+        path = client.download_file(f"{server.base_url}/files/out.bin", str(tmp_path))
+
+        assert open(path, "rb").read() == self.content
+
+    def test_failed_download_resumes_on_next_call(self, server, client, tmp_path):
+        url = f"{server.base_url}/files/video.mp4"
+        handler = server.serve_file("/files/video.mp4", self.content)
+
+        def broken(request, body):
+            if request.headers.get("Range", "").startswith("bytes=786432-"):
+                return 404, {}, {"code": 404, "msg": "gone"}
+            return handler(request, body)
+        server.route("GET", "/files/video.mp4", broken)
+
+        with pytest.raises(ConnectionError):
+            client.download_file(url, str(tmp_path), max_connections=1, segment_size=256 * 1024)
+        assert not (tmp_path / "video.mp4").exists()
+        assert (tmp_path / "video.mp4.part.json").exists()
+
+        server.route("GET", "/files/video.mp4", handler)
+        server.requests.clear()
+        path = client.download_file(url, str(tmp_path), segment_size=256 * 1024)
+
+        assert open(path, "rb").read() == self.content
+        assert range_starts(server) == [786432]
+        assert os.listdir(tmp_path) == ["video.mp4"]
+
+    def test_changed_remote_file_restarts(self, server, client, tmp_path):
+        url = f"{server.base_url}/files/video.mp4"
+        state = DownloadState(str(tmp_path / "video.mp4"))
+        state.plan(url, len(self.content), '"old"', 256 * 1024)
+        state.segments[0].written = 1000
+        state.save()
+        server.serve_file("/files/video.mp4", self.content, etag='"new"')
+
+        path = client.download_file(url, str(tmp_path), segment_size=256 * 1024)
+
+        assert open(path, "rb").read() == self.content
+        assert os.listdir(tmp_path) == ["video.mp4"]
+
+
+class TestInMemoryDownload:
+    content = bytes(range(256)) * 1024
+
+    def test_download_to_preallocated_buffer(self, server, client):
+        server.serve_file("/files/out.png", self.content)
+        buffer = bytearray(len(self.content) + 10)
+
+        view = client.download_to_buffer(f"{server.base_url}/files/out.png", buffer)
+
+        assert view.obj is buffer
+        assert bytes(view) == self.content
+
+    def test_buffer_too_small(self, server, client):
+        server.serve_file("/files/out.png", self.content)
+
+        with pytest.raises(ValueError):
+            client.download_to_buffer(f"{server.base_url}/files/out.png", bytearray(10))
+
+    def test_allocates_buffer_and_resumes(self, server):
+        content = self.content
+        handler = server.serve_file("/files/out.png", content)
+
+        def cut_first(request, body):
+            if "Range" in request.headers:
+                return handler(request, body)
+            # declare the full length but drop the connection after 100 KB
+            request.close_connection = True
+            return 200, {"ETag": '"v1"', "Content-Length": str(len(content))}, content[:100000]
+        server.route("GET", "/files/out.png", cut_first)
+
+        with ComfyOneClient("k", server.base_url,
+                            retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01)) as client:
+            view = client.download_to_buffer(f"{server.base_url}/files/out.png")
+
+        assert bytes(view) == content
+        resumed_from = int(server.requests[1]["headers"]["Range"][len("bytes="):-1])
+        assert 0 < resumed_from <= 100000
+
+    def test_iter_download(self, server, client):
+        server.serve_file("/files/out.png", self.content)
+
+        chunks = list(client.iter_download(f"{server.base_url}/files/out.png", chunk_size=4096))
+
+        assert b"".join(chunks) == self.content
+        assert max(len(c) for c in chunks) == 4096
+
+
+class TestDownloadMany:
+    def test_results_in_input_order_and_duplicates_fetched_once(self, server, client, tmp_path):
+        for name in ("a", "b"):
+            server.serve_file(f"/files/{name}.png", name.encode() * 10)
+        urls = [f"{server.base_url}/files/{name}.png" for name in ("a", "b", "missing", "a")]
+
+        results = client.download_many(urls, str(tmp_path / "out"))
+
+        assert results[0] == results[3] == str(tmp_path / "out" / "a.png")
+        assert open(results[1], "rb").read() == b"b" * 10
+        assert isinstance(results[2], ConnectionError)
+        assert [r["path"] for r in server.requests].count("/files/a.png") == 1
+
+    def test_extensionless_urls_get_distinct_files(self, server, client, tmp_path):
+        def view(request, body):
+            name = request.path.split("filename=")[1][:-len(".png")]
+            time.sleep(0.05)
+            return 200, {}, name.encode() * 10
+        server.route("GET", "/view", view)
+        urls = [f"{server.base_url}/view?filename={name}.png" for name in ("a", "b", "c")]
+
+        results = client.download_many(urls, str(tmp_path / "out"))
+
+        assert len(set(results)) == 3
+        assert all(r.endswith(".png") for r in results)
+        assert [open(r, "rb").read() for r in results] == [b"a" * 10, b"b" * 10, b"c" * 10]
+
+    def test_concurrent_calls_for_same_url_download_once(self, server, tmp_path):
+        def slow(request, body):
+            time.sleep(0.1)
+            return 200, {"ETag": '"v1"'}, b"image-a"
+        server.route("GET", "/files/a.png", slow)
+        url = f"{server.base_url}/files/a.png"
+        cache = DownloadCache(str(tmp_path / "cache"))
+
+        with ComfyOneClient("k", server.base_url, download_cache=cache) as client:
+            with ThreadPoolExecutor(4) as pool:
+                results = list(pool.map(lambda _: client.download_many([url])[0], range(4)))
+
+        assert len(set(results)) == 1
+        assert open(results[0], "rb").read() == b"image-a"
+        assert [r["path"] for r in server.requests].count("/files/a.png") == 1
+
+    def test_cached_outputs_skip_the_network(self, server, tmp_path):
+        server.serve_file("/files/a.png", b"image-a")
+        url = f"{server.base_url}/files/a.png"
+        cache = DownloadCache(str(tmp_path / "cache"))
+
+        with ComfyOneClient("k", server.base_url, download_cache=cache) as client:
+            first, = client.download_many([url])
+            server.requests.clear()
+            second, = client.download_many([url], str(tmp_path / "out"))
+
+        assert first.startswith(str(tmp_path / "cache"))
+        assert open(second, "rb").read() == b"image-a"
+        assert server.requests == []
+        # a fresh cache instance reads the persisted index
+        assert DownloadCache(str(tmp_path / "cache")).get(url) == first
+
+    def test_editing_output_does_not_touch_cache(self, server, tmp_path):
+        server.serve_file("/files/a.png", b"image-a")
+        url = f"{server.base_url}/files/a.png"
+        cache = DownloadCache(str(tmp_path / "cache"))
+
+        with ComfyOneClient("k", server.base_url, download_cache=cache) as client:
+            saved, = client.download_many([url], str(tmp_path / "out"))
+            with open(saved, "wb") as f:
+                f.write(b"edited")
+            again, = client.download_many([url], str(tmp_path / "out2"))
+
+        assert open(cache.get(url), "rb").read() == b"image-a"
+        assert open(again, "rb").read() == b"image-a"
+
+    def test_claim_after_resolve_hits_cache(self, tmp_path):
+        cache = DownloadCache(str(tmp_path / "cache"))
+        url = "http://example.com/a.png"
+        assert cache.claim(url) == (None, None)
+        staging = cache.staging_path(url)
+        with open(staging, "wb") as f:
+            f.write(b"image-a")
+        cache.resolve(url, cache.put(url, staging))
+
+        cached_path, future = cache.claim(url)
+        assert future is None
+        assert open(cached_path, "rb").read() == b"image-a"
+
+    def test_cache_evicts_least_recently_used(self, server, tmp_path):
+        for name in ("a", "b", "c"):
+            server.serve_file(f"/files/{name}.png", name.encode() * 100)
+        url = lambda name: f"{server.base_url}/files/{name}.png"
+        cache = DownloadCache(str(tmp_path / "cache"), max_bytes=250)
+
+        with ComfyOneClient("k", server.base_url, download_cache=cache) as client:
+            client.download_many([url("a")])
+            client.download_many([url("b")])
+            client.download_many([url("a")])
+            client.download_many([url("c")])
+
+        assert url("b") not in cache
+        assert url("a") in cache and url("c") in cache
+        assert cache.total_bytes == 200
+
+
+class RecordingCodec(JSONCodec):
+    def __init__(self):
+        self.calls = []
+
+    def dumps(self, value):
+        self.calls.append("dumps")
+        return super().dumps(value)
+
+    def loads(self, data):
+        self.calls.append("loads")
+        return super().loads(data)
+
+
+class TestJSONCodec:
+    @pytest.mark.parametrize("name", ["json", "orjson"])
+    def test_round_trip_to_bytes(self, name):
+        if name == "orjson":
+            pytest.importorskip("orjson")
+        codec = get_codec(name)
+        value = {"name": "工作流", "nodes": {"5": {"width": 512, "ratio": 1.5, "on": True, "x": None}}}
+
+        encoded = codec.dumps(value)
+
+        assert isinstance(encoded, bytes)
+        assert codec.loads(encoded) == value
+        assert codec.loads(memoryview(encoded)) == value
+        with pytest.raises(ValueError):
+            codec.loads(b"{not json")
+
+    def test_default_prefers_orjson(self):
+        pytest.importorskip("orjson")
+        assert get_codec().name == "orjson"
+
+    def test_client_encodes_and_decodes_with_codec(self, server):
+        server.route("POST", "/v1/prompts", lambda request, body: (
+            200, {}, {"code": 0, "msg": "ok", "data": json.loads(body)}))
+        codec = RecordingCodec()
+
+        with ComfyOneClient("k", server.base_url, codec=codec) as client:
+            result = client.prompt(make_prompt())
+
+        assert codec.calls == ["dumps", "loads"]
+        assert result.data == make_prompt().to_dict()
+        assert server.requests[0]["headers"]["Content-Type"] == "application/json"
+
+    def test_websocket_uses_codec(self):
+        codec = RecordingCodec()
+        ws = OneThingAIWebSocket("token", codec=codec)
+        received = []
+        ws.add_message_handler("progress", received.append)
+
+        ws.on_message(None, b'{"type": "progress", "taskId": "t1"}')
+        ws.on_message(None, "not json")
+        ws.flush()
+
+        assert received == [{"type": "progress", "taskId": "t1"}]
+        assert codec.calls == ["loads", "loads"]
+
+
+class WorkflowSummary(BaseModel):
+    id: str
+    name: str
+
+
+class TestTrustedResponses:
+    def test_trusted_client_skips_validation(self, server):
+        workflows = [{"id": str(i), "name": f"wf{i}", "extra": {"nodes": i}} for i in range(3)]
+        server.route("GET", "/v1/workflows", payload={"code": 0, "data": workflows})
+
+        with ComfyOneClient("k", server.base_url, max_retries=1) as strict:
+            with pytest.raises(APIError):
+                strict.get_workflows()  # "msg" missing fails validation
+        with ComfyOneClient("k", server.base_url, trust_responses=True) as client:
+            result = client.get_workflows()
+
+        assert isinstance(result, APIResponse)
+        assert result.code == 0 and result.msg == ""
+        assert result.data is not None and result.data[0]["extra"] == {"nodes": 0}
+
+    def test_typed_accessors_materialize_on_demand(self):
+        response = APIResponse.trusted({"code": 0, "msg": "ok", "data": [
+            {"id": "1", "name": "a"}, {"id": "2", "name": "b"}, {"bad": True},
+        ]})
+
+        items = response.iter_data(WorkflowSummary)
+        first = next(items)
+
+        assert isinstance(first, WorkflowSummary) and first.name == "a"
+        assert next(items).id == "2"
+        with pytest.raises(Exception):
+            list(response.iter_data(WorkflowSummary, validate=True))
+
+    def test_data_as_and_get(self):
+        response = APIResponse.trusted({"code": 0, "msg": "ok", "data": {"id": "7", "name": "wf"}})
+
+        assert response.get("id") == "7"
+        assert response.get("missing", "x") == "x"
+        assert response.data_as(WorkflowSummary).name == "wf"
+        assert response.data_as(WorkflowSummary, validate=True) == WorkflowSummary(id="7", name="wf")
+
+
+class TestPromptTemplate:
+    def test_encode_matches_payload(self):
+        template = PromptTemplate.compile("wf", {"5": {"width": 512, "height": 512}, "6": ["text"]})
+
+        body = template.encode({"5": {"width": 1024}, "6": {"text": "一只猫"}})
+
+        expected = PromptPayload(workflow_id="wf", inputs=[
+            PromptInput(id="5", params={"width": 1024, "height": 512}),
+            PromptInput(id="6", params={"text": "一只猫"}),
+        ])
+        assert json.loads(body) == expected.to_dict()
+        assert template.render({"6": {"text": "x"}})["inputs"][0]["params"] == {"width": 512, "height": 512}
+        assert template.params == [("5", "width"), ("5", "height"), ("6", "text")]
+
+    def test_rejects_missing_and_unknown_params(self):
+        template = PromptTemplate.compile("wf", {"6": ["text"]})
+
+        with pytest.raises(ValidationError):
+            template.encode()
+        with pytest.raises(ValidationError):
+            template.encode({"6": {"text": "a", "txet": "b"}})
+        with pytest.raises(ValidationError):
+            template.encode({"7": {"text": "a"}})
+        with pytest.raises(ValidationError):
+            PromptTemplate.compile("wf", {"6": "text"})
+
+    def test_compile_validates_once(self):
+        with pytest.raises(Exception):
+            PromptTemplate.compile("", {"6": ["text"]})
+        template = PromptTemplate.compile("wf", {"6": ["text"]})
+
+        with patch.object(PromptPayload, "__init__", side_effect=AssertionError("pydantic in the loop")):
+            bodies = [template.encode({"6": {"text": str(i)}}) for i in range(100)]
+
+        assert json.loads(bodies[-1])["inputs"] == [{"id": "6", "params": {"text": "99"}}]
+
+    def test_client_sends_encoded_body(self, server, client):
+        server.route("POST", "/v1/prompts", lambda request, body: (
+            200, {}, {"code": 0, "msg": "ok", "data": json.loads(body)}))
+        template = PromptTemplate.compile("wf", {"5": ["width"]})
+
+        results = list(client.prompt_many([template.encode({"5": {"width": w}}) for w in (256, 512)]))
+
+        widths = sorted(result.data["inputs"][0]["params"]["width"] for _, result in results)
+        assert widths == [256, 512]
+        assert server.requests[0]["headers"]["Content-Type"] == "application/json"
+
+
+def exported_graph(meta=True):
+    """模拟ComfyUI导出的工作流，带界面元数据"""
+    graph = {str(i): {"class_type": "CLIPTextEncode", "inputs": {"text": "a cat " * 20, "clip": ["4", 1]}}
+             for i in range(1, 40)}
+    if meta:
+        for node_id, node in graph.items():
+            node["_meta"] = {"title": f"Prompt {node_id}"}
+            node["inputs"]["speak_and_recognation"] = {"__value__": [False, True]}
+    return graph
+
+
+class TestRequestCompression:
+    def test_canonicalize_strips_ui_metadata(self):
+        graph = exported_graph()
+
+        canonical = canonicalize_workflow(graph)
+
+        assert canonical == exported_graph(meta=False)
+        assert "_meta" in graph["1"]  # 不修改原工作流
+        assert workflow_hash(make_workflow(graph)) == workflow_hash(make_workflow(exported_graph(meta=False)))
+
+    def test_create_workflow_sends_canonical_gzip_body(self, server):
+        server.route("POST", "/v1/workflows", lambda request, body: (
+            200, {}, {"code": 0, "msg": "ok", "data": json.loads(gzip.decompress(body))}))
+
+        with ComfyOneClient("k", server.base_url, compression="gzip") as client:
+            result = client.create_workflow(make_workflow(exported_graph()))
+            server.route("POST", "/v1/prompts", payload={"code": 0, "msg": "ok"})
+            client.prompt(make_prompt())
+
+        assert result.data["workflow"] == exported_graph(meta=False)
+        workflow_request, prompt_request = server.requests
+        assert workflow_request["headers"]["Content-Encoding"] == "gzip"
+        assert len(workflow_request["body"]) * 4 < len(json.dumps(result.data))
+        # 小请求体不压缩
+        assert "Content-Encoding" not in prompt_request["headers"]
+
+    def test_unsupported_encoding_falls_back(self, server):
+        def handler(request, body):
+            if request.headers.get("Content-Encoding"):
+                return 415, {}, {"code": 415, "msg": "unsupported encoding"}
+            return 200, {}, {"code": 0, "msg": "ok", "data": json.loads(body)}
+        server.route("POST", "/v1/workflows", handler)
+
+        with ComfyOneClient("k", server.base_url, compression="gzip", canonicalize_workflows=False) as client:
+            result = client.create_workflow(make_workflow(exported_graph()))
+            client.create_workflow(make_workflow(exported_graph()))
+
+        assert result.data["workflow"] == exported_graph()
+        assert client.compressor is None
+        assert [bool(r["headers"].get("Content-Encoding")) for r in server.requests] == [True, False, False]
+
+    def test_zstd(self, server):
+        zstandard = pytest.importorskip("zstandard")
+        server.route("POST", "/v1/workflows", lambda request, body: (
+            200, {}, {"code": 0, "msg": "ok", "data": json.loads(zstandard.ZstdDecompressor().decompress(body))}))
+
+        with ComfyOneClient("k", server.base_url, compression="zstd") as client:
+            result = client.create_workflow(make_workflow(exported_graph()))
+
+        assert result.data["workflow"] == exported_graph(meta=False)
+        assert server.requests[0]["headers"]["Content-Encoding"] == "zstd"
+
+
+def apply_patch(document, ops):
+    """把json_patch.diff生成的add/remove/replace操作应用到document的副本上，模拟服务端"""
+    document = copy.deepcopy(document)
+    for op in ops:
+        tokens = [token.replace("~1", "/").replace("~0", "~") for token in op["path"].split("/")[1:]]
+        if not tokens:
+            document = copy.deepcopy(op["value"])
+            continue
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        key = int(tokens[-1]) if isinstance(parent, list) else tokens[-1]
+        if op["op"] == "remove":
+            del parent[key]
+        else:
+            parent[key] = copy.deepcopy(op["value"])
+    return document
+
+
+class TestWorkflowPatch:
+    @pytest.fixture
+    def workflow_server(self, server):
+        """保存工作流并为每个版本返回ETag的服务端，补丁的If-Match与当前版本不一致时返回412"""
+        state = {"document": None, "version": 0, "patch_status": None}
+
+        def etag():
+            return '"v%d"' % state["version"]
+
+        def create(request, body):
+            state["document"] = json.loads(body)
+            state["version"] += 1
+            return 200, {}, {"code": 0, "msg": "ok", "data": {"id": "wf1"}}
+
+        def get(request, body):
+            return 200, {"ETag": etag()}, {"code": 0, "msg": "ok", "data": {"id": "wf1", **state["document"]}}
+
+        def update(request, body):
+            if request.headers["Content-Type"] == json_patch.CONTENT_TYPE:
+                if state["patch_status"]:
+                    return state["patch_status"], {}, {"code": state["patch_status"], "msg": "unsupported"}
+                if request.headers.get("If-Match") != etag():
+                    return 412, {}, {"code": 412, "msg": "precondition failed"}
+                state["document"] = apply_patch(state["document"], json.loads(body))
+            else:
+                state["document"] = json.loads(body)
+            state["version"] += 1
+            return 200, {}, {"code": 0, "msg": "ok"}
+        server.route("POST", "/v1/workflows", create)
+        server.route("GET", "/v1/workflows/wf1", get)
+        server.route("PATCH", "/v1/workflows/wf1", update)
+        server.state = state
+        return server
+
+    def test_diff_round_trip(self):
+        old = {"a": {"b": [1, 2], "c/d": 1, "e": "x"}, "gone": True}
+        new = {"a": {"b": [1, 3], "c/d": 2, "f": None}, "list": [1]}
+
+        ops = json_patch.diff(old, new)
+
+        assert apply_patch(old, ops) == new
+        assert {"op": "replace", "path": "/a/b/1", "value": 3} in ops
+        assert {"op": "replace", "path": "/a/c~1d", "value": 2} in ops
+        assert {"op": "remove", "path": "/gone"} in ops
+        assert json_patch.diff(new, new) == []
+
+    def test_update_patches_cached_server_version(self, workflow_server):
+        graph = exported_graph(meta=False)
+
+        with ComfyOneClient("k", workflow_server.base_url, cache=ResponseCache()) as client:
+            client.create_workflow(make_workflow(graph))
+            client.get_workflow("wf1")
+            graph["7"]["inputs"]["text"] = "a dog"
+            assert client.update_workflow("wf1", make_workflow(graph)).code == 0
+            stats = client.get_workflow_update_stats()
+
+        patch_request = workflow_server.requests[2]
+        assert json.loads(patch_request["body"]) == [{"op": "replace", "path": "/workflow/7/inputs/text", "value": "a dog"}]
+        assert patch_request["headers"]["If-Match"] == '"v1"'
+        assert workflow_server.state["document"] == make_workflow(graph).to_dict()
+        assert stats["patched"] == 1 and stats["full"] == 0
+        full_size = len(json.dumps(workflow_server.state["document"], separators=(",", ":")))
+        assert stats["bytes_saved"] == full_size - len(patch_request["body"])
+
+    def test_changed_server_version_gets_full_update(self, workflow_server):
+        graph = exported_graph(meta=False)
+
+        with ComfyOneClient("k", workflow_server.base_url, cache=ResponseCache()) as client:
+            client.create_workflow(make_workflow(graph))
+            client.get_workflow("wf1")
+            workflow_server.state["version"] += 1  # 其他客户端修改了工作流
+            graph["7"]["inputs"]["text"] = "a dog"
+            assert client.update_workflow("wf1", make_workflow(graph)).code == 0
+            stats = client.get_workflow_update_stats()
+
+        content_types = [r["headers"]["Content-Type"] for r in workflow_server.requests[2:]]
+        assert content_types == [json_patch.CONTENT_TYPE, "application/json"]
+        assert workflow_server.state["document"] == make_workflow(graph).to_dict()
+        assert stats == {"patched": 0, "full": 1, "bytes_saved": 0}
+
+    def test_falls_back_to_full_upload(self, workflow_server):
+        workflow_server.state["patch_status"] = 415
+        graph = exported_graph(meta=False)
+
+        with ComfyOneClient("k", workflow_server.base_url, cache=ResponseCache()) as client:
+            client.create_workflow(make_workflow(graph))
+            client.update_workflow("wf1", make_workflow(graph))  # 没有缓存的服务端版本，发送完整工作流
+            for text in ("a dog", "a bird"):
+                client.get_workflow("wf1")
+                graph["7"]["inputs"]["text"] = text
+                client.update_workflow("wf1", make_workflow(graph))
+            stats = client.get_workflow_update_stats()
+
+        content_types = [r["headers"]["Content-Type"] for r in workflow_server.requests if r["method"] == "PATCH"]
+        assert content_types == ["application/json", json_patch.CONTENT_TYPE, "application/json", "application/json"]
+        assert client.workflow_patches is False
+        assert stats == {"patched": 0, "full": 3, "bytes_saved": 0}
+
+
+def task_event(event_type, task_id, **data):
+    return json.dumps({"type": event_type, "taskId": task_id, "data": data})
+
+
+class TestPromptFutures:
+    def test_submit_resolves_from_websocket_events(self, server, client):
+        task_ids = iter(range(1000))
+        server.route("POST", "/v1/prompts", lambda request, body: (
+            200, {}, {"code": 0, "msg": "ok", "data": {"id": f"t{next(task_ids)}"}}))
+        ws = OneThingAIWebSocket("token", tasks=client.tasks)
+        progress = []
+
+        futures = [client.submit(make_prompt(), on_progress=progress.append) for _ in range(50)]
+        ws.on_message(None, task_event("progress", "t3", process=40))
+        for i in reversed(range(50)):
+            ws.on_message(None, task_event("finished", f"t{i}", success=i != 7))
+
+        done, not_done = wait(futures, timeout=1)
+        assert len(done) == 50 and not not_done
+        assert {f.task_id for f in as_completed(futures)} == {f"t{i}" for i in range(50)}
+        assert futures[0].result()["taskId"] == "t0"
+        with pytest.raises(PromptFailedError) as excinfo:
+            futures[7].result()
+        assert excinfo.value.task_id == "t7"
+        assert progress == [json.loads(task_event("progress", "t3", process=40))]
+        assert len(client.tasks) == 0
+
+    def test_terminal_event_before_register(self):
+        tasks = TaskRegistry()
+        ws = OneThingAIWebSocket("token", tasks=tasks)
+
+        ws.on_message(None, task_event("error", "t1", message="out of memory"))
+        ws.flush()
+        future = tasks.register("t1")
+
+        with pytest.raises(PromptFailedError, match="out of memory"):
+            future.result(timeout=0)
+
+    def test_register_dedupes_and_cancel(self):
+        tasks = TaskRegistry()
+        future = tasks.register("t1")
+
+        assert tasks.register("t1") is future
+        assert future.cancel()
+        assert "t1" not in tasks and len(tasks) == 0
+        tasks.dispatch(json.loads(task_event("finished", "t1", success=True)))
+        assert future.cancelled() and "t1" not in tasks
+
+
+class TestStatusPoller:
+    def test_polls_until_finished_and_dedupes(self, server, client):
+        states = iter([{"status": "queued", "current": 2}, {"status": "running", "process": 50},
+                       {"status": "finished", "images": ["a.png"]}])
+        server.route("GET", "/v1/prompts/t1/status", lambda request, body: (
+            200, {}, {"code": 0, "msg": "ok", "data": next(states)}))
+        client.poller = StatusPoller(client, min_interval=0.01, max_interval=0.05)
+        events = []
+
+        future = client.watch("t1", on_progress=events.append)
+        assert client.watch("t1") is future
+
+        result = future.result(timeout=5)
+        assert result["data"]["images"] == ["a.png"] and result["data"]["success"] is True
+        assert [e["type"] for e in events] == ["pendding", "progress"]
+        assert len(server.requests) == 3
+        assert len(client.poller) == 0
+
+    def test_missing_task_fails_future(self, server, client):
+        server.route("GET", "/v1/prompts/t1/status", status=404, payload={"code": 404, "msg": "not found"})
+        client.poller = StatusPoller(client, min_interval=0.01)
+
+        with pytest.raises(PromptFailedError):
+            client.watch("t1").result(timeout=5)
+
+    def test_websocket_completion_stops_polling(self, server, client):
+        server.route("GET", "/v1/prompts/t1/status", payload={"code": 0, "msg": "ok", "data": {"status": "running"}})
+        client.poller = StatusPoller(client, min_interval=0.01, max_interval=0.01)
+        future = client.watch("t1")
+        time.sleep(0.05)
+
+        client.tasks.dispatch(json.loads(task_event("finished", "t1", success=True)))
+        future.result(timeout=1)
+        time.sleep(0.05)
+        polled = len(server.requests)
+        time.sleep(0.05)
+
+        assert len(server.requests) == polled
+        assert len(client.poller) == 0
+
+    def test_cancel_stops_polling_without_cancelling_on_server(self, server, client):
+        server.route("GET", "/v1/prompts/t1/status", payload={"code": 0, "msg": "ok", "data": {"status": "running"}})
+        client.poller = StatusPoller(client, min_interval=0.01, max_interval=0.01)
+        future = client.watch("t1")
+        time.sleep(0.05)
+
+        assert future.cancel()
+        assert "t1" not in client.tasks and len(client.poller) == 0
+        time.sleep(0.05)
+        polled = len(server.requests)
+        time.sleep(0.05)
+
+        assert len(server.requests) == polled
+        assert all(r["method"] == "GET" for r in server.requests)
+
+    def test_unexpected_error_does_not_stop_polling(self, server, client):
+        states = iter([{"status": "running", "process": 10}, {"status": "finished"}])
+        server.route("GET", "/v1/prompts/t1/status", lambda request, body: (
+            200, {}, {"code": 0, "msg": "ok", "data": next(states)}))
+        client.poller = StatusPoller(client, min_interval=0.01, max_interval=0.05)
+
+        with patch.object(client.poller, "_next_interval", side_effect=RuntimeError("bug")):
+            assert client.watch("t1").result(timeout=5)["data"]["success"] is True
+        assert len(server.requests) == 2
+
+    def test_interval_adapts_to_queue_position_and_progress(self, client):
+        poller = StatusPoller(client, min_interval=1, max_interval=60)
+        state = _PollState(1)
+
+        assert poller._next_interval(state, {"current": 9}) == 10
+        assert poller._next_interval(state, {"process": 10}) == 1.5  # 第一次看到进度，按退避计算
+        state.progress_at -= 10  # 10秒前进度为10%
+        assert poller._next_interval(state, {"process": 20}) == pytest.approx(40, rel=0.01)  # 剩余80秒，在一半时再查
+        assert status_event("t1", {"status": "failed"})["data"]["success"] is False
+
+
+class TestEventDispatch:
+    def test_slow_handler_does_not_block_receive(self):
+        ws = OneThingAIWebSocket("token", dispatch_workers=2)
+        release = threading.Event()
+        finished = []
+        ws.add_message_handler("finished", lambda data: (release.wait(1), finished.append(data["taskId"])))
+
+        started = time.monotonic()
+        for i in range(20):
+            ws.on_message(None, task_event("finished", f"t{i}", success=True))
+        receive_time = time.monotonic() - started
+        assert ws.get_dispatch_stats()["queue_depth"] > 0
+        release.set()
+        ws.flush()
+
+        assert receive_time < 0.5
+        assert sorted(finished) == sorted(f"t{i}" for i in range(20))
+        stats = ws.get_dispatch_stats()
+        assert stats["dispatched"] == 20 and stats["queue_depth"] == 0
+        assert stats["handler_latency_max"] >= stats["handler_latency_avg"] > 0
+        ws.close()
+
+    def test_events_of_one_task_stay_ordered(self):
+        seen = {}
+
+        def handler(event):
+            time.sleep(0.001 if event["data"]["n"] % 2 else 0)
+            seen.setdefault(event["taskId"], []).append(event["data"]["n"])
+
+        dispatcher = EventDispatcher(handler, workers=4)
+        for n in range(50):
+            for task in ("a", "b", "c"):
+                dispatcher.submit({"type": "progress", "taskId": task, "data": {"n": n}})
+        dispatcher.flush()
+        dispatcher.close()
+
+        assert seen == {task: list(range(50)) for task in ("a", "b", "c")}
+
+    def test_handler_errors_are_counted(self):
+        dispatcher = EventDispatcher(lambda event: 1 / 0, workers=1)
+        dispatcher.submit({"type": "progress"})
+        dispatcher.flush()
+
+        assert dispatcher.stats()["errors"] == 1
+        dispatcher.close()
+
+
+class TestEventRouter:
+    def test_fan_out_by_type_and_task(self):
+        router = EventRouter()
+        calls = []
+        router.subscribe(lambda e: calls.append("type"), "progress")
+        router.subscribe(lambda e: calls.append("type2"), "progress")
+        router.subscribe(lambda e: calls.append("task"), task_id="t1")
+        router.subscribe(lambda e: calls.append("both"), "progress", "t1")
+        router.subscribe(lambda e: calls.append("all"))
+
+        assert router.route({"type": "progress", "taskId": "t1"}) == 5
+        assert calls == ["both", "task", "type", "type2", "all"]
+        calls.clear()
+        assert router.route({"type": "progress", "taskId": "t2"}) == 3
+        assert calls == ["type", "type2", "all"]
+
+    def test_task_subscriptions_end_with_task(self):
+        router = EventRouter()
+        seen = []
+        router.subscribe(seen.append, task_id="t1")
+        failing = router.subscribe(lambda e: 1 / 0, "finished", "t1")
+
+        router.route({"type": "progress", "taskId": "t1"})
+        router.route({"type": "finished", "taskId": "t1"})
+        router.route({"type": "progress", "taskId": "t1"})
+
+        assert [e["type"] for e in seen] == ["progress", "finished"]
+        assert len(router) == 0
+        failing.unsubscribe()  # 已自动取消，重复取消无影响
+
+    def test_websocket_handlers(self):
+        ws = OneThingAIWebSocket("token", dispatch_workers=0)
+        seen = []
+        ws.add_message_handler("progress", seen.append)
+        subscription = ws.add_message_handler("progress", seen.append)
+        ws.subscribe(seen.append, "finished", "t1")
+
+        ws.on_message(None, task_event("progress", "t1", process=10))
+        subscription.unsubscribe()
+        ws.on_message(None, task_event("progress", "t1", process=20))
+        ws.on_message(None, task_event("finished", "t1", success=True))
+        ws.remove_message_handler("progress")
+        ws.on_message(None, task_event("progress", "t1", process=30))
+
+        assert [e["data"].get("process") for e in seen] == [10, 10, 20, None]
+
+    def test_unhandled_messages_are_not_formatted_without_debug(self):
+        ws = OneThingAIWebSocket("token", dispatch_workers=0)
+        ws.logger.setLevel(logging.INFO)
+        message = task_event("progress", "t1", process=10)
+
+        with patch("comfyone.api.websocket.websocket_client.json.dumps") as dumps:
+            ws.on_message(None, message)
+            assert not dumps.called
+            ws.logger.setLevel(logging.DEBUG)
+            ws.on_message(None, message)
+            assert dumps.called
+        ws.logger.setLevel(logging.NOTSET)
@@ -0,0 +1,296 @@
+import asyncio
+import time
+from unittest.mock import patch
+import pytest
+from comfyone.api.comfyone_client import ComfyOneClient
+from comfyone.api.exceptions import APIError, ConnectionError
+from comfyone.api.retry import RetryPolicy, RetryBudget
+from comfyone.api.concurrency import AdaptiveConcurrencyLimiter
+from comfyone.api.models import PromptPayload
+from comfyone.api.rate_limit import RateLimiter, TokenBucket
+from comfyone.api.circuit_breaker import (
+    CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError, CircuitState
+)
+
+
+class TestRetryPolicy:
+    def test_decorrelated_jitter_stays_within_bounds(self):
+        policy = RetryPolicy(max_attempts=50, base_delay=0.1, max_delay=2.0)
+        state = policy.start()
+        delays = [state.next_delay() for _ in range(20)]
+
+        assert all(0.1 <= d <= 2.0 for d in delays)
+        assert len(set(delays)) > 1
+
+    def test_client_errors_are_not_retried(self):
+        state = RetryPolicy(max_attempts=5).start()
+
+        assert state.next_delay(400) is None
+        assert state.next_delay(404) is None
+        assert state.next_delay(503) is not None
+
+    def test_post_is_retried_only_when_not_processed(self):
+        policy = RetryPolicy(max_attempts=5)
+
+        for status in (500, 502, 504, None):
+            assert policy.start().next_delay(status, "GET") is not None
+            assert policy.start().next_delay(status, "POST") is None
+        assert policy.start().next_delay(None, "POST", sent=False) is not None
+        assert policy.start().next_delay(503, "POST") is None
+        assert policy.start().next_delay(503, "POST", headers={"Retry-After": "0"}) is not None
+        assert RetryPolicy(idempotent_methods=["GET", "POST"]).start().next_delay(500, "POST") is not None
+
+    def test_retry_after_seconds_and_cap(self):
+        policy = RetryPolicy(max_attempts=5, base_delay=0.01, max_delay=0.02, max_retry_after=10)
+
+        assert policy.start().next_delay(429, headers={"Retry-After": "3"}) == 3.0
+        assert policy.start().next_delay(429, headers={"Retry-After": "30"}) is None
+        assert policy.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+        assert policy.parse_retry_after("garbage") is None
+
+    def test_deadline_stops_retrying(self):
+        state = RetryPolicy(max_attempts=10, base_delay=1.0, deadline=0.5).start()
+
+        assert state.next_delay() is None
+
+    def test_budget_limits_retries_to_fraction_of_traffic(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0.0, capacity=1.0)
+        policy = RetryPolicy(max_attempts=3, base_delay=0.0, budget=budget)
+
+        assert policy.start().next_delay() is not None
+        assert policy.start().next_delay() is None
+        policy.start()
+        assert policy.start().next_delay() is not None
+
+
+class TestClientRetries:
+    def test_retries_503_then_succeeds(self, server):
+        calls = []
+
+        def handler(request, body):
+            calls.append(1)
+            if len(calls) < 3:
+                return 503, {"Retry-After": "0"}, {"code": 503, "msg": "busy"}
+            return 200, {}, {"code": 0, "msg": "ok"}
+        server.route("GET", "/v1/workflows", handler)
+        policy = RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.02)
+
+        with ComfyOneClient("k", server.base_url, retry_policy=policy) as client:
+            assert client.get_workflows().code == 0
+        assert len(calls) == 3
+
+    def test_prompt_is_not_retried_after_server_error(self, server):
+        server.route("POST", "/v1/prompts", status=502, payload={"code": 502, "msg": "bad gateway"})
+        policy = RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.02)
+
+        with ComfyOneClient("k", server.base_url, retry_policy=policy) as client:
+            with pytest.raises(APIError):
+                client._request_api("v1/prompts", {}, "POST")
+        assert len(server.requests) == 1
+
+    def test_refused_connection_retries_post(self):
+        policy = RetryPolicy(max_attempts=2, base_delay=0.01, max_delay=0.01)
+
+        with ComfyOneClient("k", "http://127.0.0.1:9", retry_policy=policy) as client:
+            with patch("comfyone.api.comfyone_client.time.sleep") as sleep:
+                with pytest.raises(ConnectionError):
+                    client._request_api("v1/prompts", {}, "POST")
+        # 连接被拒绝时请求没有发出，可以安全重试
+        assert sleep.call_count == 1
+
+    def test_4xx_fails_fast_with_status_code(self, server):
+        server.route("GET", "/v1/workflows/missing", status=404, payload={"code": 404, "msg": "no such workflow"})
+        policy = RetryPolicy(max_attempts=3, base_delay=0.01)
+
+        with ComfyOneClient("k", server.base_url, retry_policy=policy) as client:
+            with pytest.raises(APIError) as info:
+                client.get_workflow("missing")
+        assert info.value.code == 404
+        assert str(info.value) == "no such workflow"
+        assert len(server.requests) == 1
+
+    def test_connection_failure_raises_connection_error(self):
+        policy = RetryPolicy(max_attempts=2, base_delay=0.01, max_delay=0.01)
+
+        with ComfyOneClient("k", "http://127.0.0.1:9", retry_policy=policy) as client:
+            with pytest.raises(ConnectionError) as info:
+                client.get_workflows()
+        assert info.value.code == 503
+
+
+class TestCircuitBreaker:
+    def test_opens_on_failure_rate_and_probes_after_timeout(self):
+        breaker = CircuitBreaker("v1/prompts", window_size=4, min_calls=4, open_timeout=0.05)
+        for outcome in (True, True, False, False):
+            breaker.before_call()
+            breaker.record_success() if outcome else breaker.record_failure()
+
+        assert breaker.state == CircuitState.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        assert breaker.state == CircuitState.HALF_OPEN
+        breaker.before_call()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("v1/files", window_size=1, min_calls=1, open_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitState.OPEN
+
+    def test_endpoint_families(self):
+        family = CircuitBreakerRegistry.endpoint_family
+
+        assert family("v1/prompts/abc/status") == "v1/prompts"
+        assert family("v1/files") == "v1/files"
+
+    def test_client_fails_fast_per_endpoint_family(self, server):
+        server.route("POST", "/v1/prompts", status=500, payload={"code": 500, "msg": "down"})
+        server.route("GET", "/v1/workflows", payload={"code": 0, "msg": "ok"})
+        breakers = CircuitBreakerRegistry(window_size=2, min_calls=2, open_timeout=60)
+        policy = RetryPolicy(max_attempts=1)
+
+        with ComfyOneClient("k", server.base_url, retry_policy=policy, circuit_breakers=breakers) as client:
+            for _ in range(2):
+                with pytest.raises(APIError):
+                    client._request_api("v1/prompts", {}, "POST")
+            sent = len(server.requests)
+            with pytest.raises(CircuitOpenError):
+                client._request_api("v1/prompts", {}, "POST")
+
+            assert len(server.requests) == sent
+            assert client.get_workflows().code == 0
+            states = client.get_circuit_states()
+        assert states["v1/prompts"]["state"] == "open"
+        assert states["v1/workflows"]["state"] == "closed"
+
+
+class TestRateLimiter:
+    def test_token_bucket_spaces_out_requests(self):
+        bucket = TokenBucket(rate=100, burst=2)
+        waits = [bucket.reserve() for _ in range(4)]
+
+        assert waits[:2] == [0.0, 0.0]
+        assert waits[2] == pytest.approx(0.01, abs=0.005)
+        assert waits[3] == pytest.approx(0.02, abs=0.005)
+
+    def test_classify_endpoints(self):
+        assert RateLimiter.classify("v1/prompts", "POST") == RateLimiter.PROMPT
+        assert RateLimiter.classify("v1/prompts/abc/status") == RateLimiter.STATUS
+        assert RateLimiter.classify("v1/files", "POST") == RateLimiter.FILE
+        assert RateLimiter.classify("v1/workflows") == RateLimiter.DEFAULT
+
+    def test_shared_per_api_key(self):
+        limiter = RateLimiter.for_api_key("shared-key", prompt=5)
+
+        assert RateLimiter.for_api_key("shared-key") is limiter
+        assert RateLimiter.for_api_key("other-key") is not limiter
+
+    def test_client_blocks_instead_of_failing(self, server):
+        server.route("GET", "/v1/prompts/p/status", payload={"code": 0, "msg": "ok"})
+        limiter = RateLimiter(status=(20, 1))
+
+        with ComfyOneClient("k", server.base_url, rate_limiter=limiter) as client:
+            started = time.monotonic()
+            for _ in range(4):
+                client.get_prompt_status("p")
+            elapsed = time.monotonic() - started
+
+        assert elapsed >= 0.14
+        assert len(server.requests) == 4
+
+    def test_async_acquire_does_not_block_loop(self):
+        bucket = TokenBucket(rate=10, burst=1)
+
+        async def main():
+            ticks = []
+
+            async def ticker():
+                for _ in range(5):
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.01)
+
+            await asyncio.gather(bucket.acquire_async(), bucket.acquire_async(), ticker())
+            return ticks
+
+        assert len(asyncio.run(main())) == 5
+
+
+class TestAdaptiveConcurrency:
+    def test_additive_increase_and_multiplicative_decrease(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=8, decrease_cooldown=0)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(0.01)
+
+        assert limiter.limit == 7
+
+        limiter.acquire()
+        limiter.release(0.01, overloaded=True)
+        assert limiter.limit == 3
+
+    def test_latency_spike_cuts_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=10, min_samples=5, decrease_cooldown=0)
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(0.01)
+        before = limiter.limit
+        limiter.acquire()
+        limiter.release(0.5)
+
+        assert limiter.limit == before // 2
+
+    def test_cooldown_decreases_once_per_window(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=16, decrease_cooldown=60)
+        for _ in range(3):
+            limiter.acquire()
+            limiter.release(overloaded=True)
+
+        assert limiter.limit == 8
+        assert limiter.stats()["overloads"] == 3
+
+    def test_acquire_blocks_at_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+        limiter.acquire()
+
+        assert limiter.acquire(timeout=0.01) is False
+        limiter.release()
+        assert limiter.acquire(timeout=0.01) is True
+
+    def test_async_waiters_are_woken(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+        peak = []
+
+        async def worker():
+            await limiter.acquire_async()
+            peak.append(limiter.in_flight)
+            await asyncio.sleep(0.005)
+            limiter.release()
+
+        async def main():
+            await asyncio.gather(*(worker() for _ in range(10)))
+
+        asyncio.run(main())
+        assert len(peak) == 10
+        assert max(peak) <= 2
+
+    def test_client_backs_off_on_429(self, server):
+        server.route("POST", "/v1/prompts", status=429, payload={"code": 429, "msg": "slow down"})
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8, decrease_cooldown=0)
+
+        with ComfyOneClient("k", server.base_url, retry_policy=RetryPolicy(max_attempts=1),
+                            concurrency_limiter=limiter) as client:
+            with pytest.raises(APIError):
+                client.prompt(PromptPayload(workflow_id="wf", inputs=[]))
+            stats = client.get_concurrency_stats()
+
+        assert stats["limit"] == 4
+        assert stats["in_flight"] == 0